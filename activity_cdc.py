@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于MySQL binlog的用户活动增量采集（可选模式）
+监听 wy_user / wy_special_buy / wy_special_watch / wy_store_order 的行变更，
+转换成活动事件，维护实时计数器（按5分钟分桶），写入按天切分的事件流文件、本地事件库（event_store.py）
+和用户时间线索引（timeline.py）。
+wy_user.last_time 的每次更新都会记录为一次登录，不会像按时间段轮询那样丢失中间的登录。
+
+依赖 mysql-replication（pip3 install mysql-replication），MySQL需开启 binlog_format=ROW，
+采集账号需要 REPLICATION SLAVE, REPLICATION CLIENT 权限。
+用法:
+    python3 activity_cdc.py run             # 持续采集
+    python3 activity_cdc.py stats --hours 6 # 读取计数器汇总
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+
+# 采集状态目录
+STATE_DIR = Path("/www/wwwroot/ana/state")
+
+# 需要监听的表
+TABLES = ('wy_user', 'wy_special_buy', 'wy_special_watch', 'wy_store_order')
+
+# 计数器分桶粒度（秒）和保留天数
+BUCKET_SECONDS = 300
+COUNTER_RETENTION_DAYS = 8
+
+# binlog复制使用的server_id，不能与集群内其他节点重复
+DEFAULT_SERVER_ID = 4391
+
+# 每处理多少个事件或多少秒保存一次状态
+CHECKPOINT_EVENTS = 500
+CHECKPOINT_SECONDS = 10
+
+# 事件类型
+EVENT_KINDS = ('register', 'login', 'purchase', 'order_paid', 'watch', 'watch_time')
+
+logger = logging.getLogger(__name__)
+
+ActivityEvent = namedtuple('ActivityEvent', ['kind', 'uid', 'ts', 'special_id', 'amount', 'minutes', 'ref_id'])
+
+
+def make_event(kind, uid, ts, special_id=0, amount=0.0, minutes=0.0, ref_id=None):
+    return ActivityEvent(kind, int(uid or 0), int(ts or 0), int(special_id or 0),
+                         float(amount or 0), float(minutes or 0), ref_id)
+
+
+def rows_to_events(table, action, row, event_time=None):
+    """把一行binlog变更转换成活动事件
+
+    action为 insert/update；insert时row是行数据，update时row是(变更前, 变更后)
+    """
+    event_time = int(event_time or time.time())
+
+    if action == 'insert':
+        values = row
+        if table == 'wy_user':
+            return [make_event('register', values.get('uid'), values.get('add_time') or event_time)]
+        if table == 'wy_special_buy' and not values.get('is_del'):
+            return [make_event('purchase', values.get('uid'), values.get('add_time') or event_time,
+                               special_id=values.get('special_id'), ref_id=values.get('order_id'))]
+        if table == 'wy_special_watch':
+            return [make_event('watch', values.get('uid'), values.get('add_time') or event_time,
+                               special_id=values.get('special_id'), minutes=values.get('viewing_time'))]
+        if table == 'wy_store_order' and values.get('paid') == 1:
+            return [make_event('order_paid', values.get('uid'), values.get('pay_time') or event_time,
+                               amount=values.get('pay_price'), ref_id=values.get('id'))]
+        return []
+
+    if action == 'update':
+        before, after = row
+        if table == 'wy_user' and after.get('last_time') and after.get('last_time') != before.get('last_time'):
+            return [make_event('login', after.get('uid'), after.get('last_time'))]
+        if table == 'wy_store_order' and after.get('paid') == 1 and before.get('paid') != 1:
+            return [make_event('order_paid', after.get('uid'), after.get('pay_time') or event_time,
+                               amount=after.get('pay_price'), ref_id=after.get('id'))]
+        if table == 'wy_special_watch':
+            delta = float(after.get('viewing_time') or 0) - float(before.get('viewing_time') or 0)
+            if delta > 0:
+                return [make_event('watch_time', after.get('uid'), event_time,
+                                   special_id=after.get('special_id'), minutes=delta)]
+        return []
+
+    return []
+
+
+class ActivityCounters:
+    """按时间分桶的活动计数器，窗口查询只需累加固定数量的桶"""
+
+    def __init__(self, path=None, bucket_seconds=BUCKET_SECONDS, retention_days=COUNTER_RETENTION_DAYS):
+        self.path = Path(path) if path else STATE_DIR / 'activity_counters.json'
+        self.bucket_seconds = bucket_seconds
+        self.retention_days = retention_days
+        # {kind: {bucket_start: [次数, 金额, 分钟]}}
+        self.buckets = {kind: {} for kind in EVENT_KINDS}
+
+    def add(self, event):
+        bucket = event.ts - event.ts % self.bucket_seconds
+        stats = self.buckets.setdefault(event.kind, {}).setdefault(bucket, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += event.amount
+        stats[2] += event.minutes
+
+    def window(self, kind, start, end):
+        """返回[start, end)内的(次数, 金额, 分钟)，精度为一个分桶"""
+        start_ts = int(start.timestamp())
+        end_ts = int(end.timestamp())
+        buckets = self.buckets.get(kind, {})
+        count, amount, minutes = 0, 0.0, 0.0
+
+        bucket = start_ts - start_ts % self.bucket_seconds
+        while bucket < end_ts:
+            stats = buckets.get(bucket)
+            if stats:
+                count += stats[0]
+                amount += stats[1]
+                minutes += stats[2]
+            bucket += self.bucket_seconds
+        return count, amount, minutes
+
+    def summary(self, start, end):
+        """各类事件在窗口内的汇总"""
+        return {kind: self.window(kind, start, end) for kind in EVENT_KINDS}
+
+    def covers(self, start, end, now=None, kind=None):
+        """[start, end)是否在计数器的数据范围内：不早于最早的分桶（开始采集的时间）且未超过保留期
+
+        计数器的各类事件都来自binlog，kind不影响结果
+        """
+        earliest = [min(buckets) for buckets in self.buckets.values() if buckets]
+        if not earliest:
+            return False
+        cutoff = (now.timestamp() if now else time.time()) - self.retention_days * 86400
+        return start.timestamp() >= max(min(earliest), cutoff)
+
+    def prune(self, now=None):
+        """删除超过保留期的分桶"""
+        cutoff = int((now or time.time()) - self.retention_days * 86400)
+        for kind, buckets in self.buckets.items():
+            for bucket in [b for b in buckets if b < cutoff]:
+                del buckets[bucket]
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.buckets = {kind: {int(b): v for b, v in buckets.items()} for kind, buckets in data.items()}
+        except FileNotFoundError:
+            pass
+        return self
+
+    def save(self):
+        self.prune()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.buckets, f)
+        os.replace(tmp_path, self.path)
+
+
+class EventStreamWriter:
+    """把活动事件追加写入按天切分的JSON Lines文件"""
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory) if directory else STATE_DIR / 'events'
+        self._day = None
+        self._file = None
+
+    def add(self, event):
+        day = datetime.fromtimestamp(event.ts).strftime('%Y%m%d')
+        if day != self._day:
+            self.close()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.directory / f"events_{day}.jsonl", 'a', encoding='utf-8', buffering=1 << 16)
+            self._day = day
+        self._file.write(json.dumps(event._asdict(), ensure_ascii=False, default=str) + "\n")
+
+    def save(self):
+        if self._file:
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._day = None
+
+
+class BinlogActivityFeed:
+    """tail binlog并把活动事件分发给各个接收者（计数器、事件流等）"""
+
+    def __init__(self, sinks, db_config=None, server_id=DEFAULT_SERVER_ID, checkpoint_path=None,
+                 start_at_current=False):
+        self.sinks = list(sinks)
+        self.db_config = db_config
+        self.server_id = server_id
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else STATE_DIR / 'binlog_position.json'
+        # 没有检查点时从主库当前位置开始，只处理启动之后的变更（默认从当前binlog文件开头读取）
+        self.start_at_current = start_at_current
+        self.running = False
+
+    def load_position(self):
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_position(self, log_file, log_pos):
+        for sink in self.sinks:
+            sink.save()
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'log_file': log_file, 'log_pos': log_pos}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def current_position(self):
+        """主库当前的binlog位置"""
+        conn = db.connect(self.db_config)
+        try:
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute("SHOW BINARY LOG STATUS")
+                except Exception:
+                    cursor.execute("SHOW MASTER STATUS")
+                status = cursor.fetchone()
+        finally:
+            conn.close()
+        if not status:
+            raise RuntimeError("主库没有开启binlog")
+        return {'log_file': status['File'], 'log_pos': status['Position']}
+
+    def start_position(self):
+        """读取检查点；没有检查点且start_at_current时取主库当前位置并立即保存"""
+        position = self.load_position()
+        if position is None and self.start_at_current:
+            position = self.current_position()
+            self.save_position(position['log_file'], position['log_pos'])
+            logger.info(f"没有检查点，从主库当前位置开始: {position['log_file']}:{position['log_pos']}")
+        return position or {}
+
+    def open_stream(self, blocking=True):
+        try:
+            from pymysqlreplication import BinLogStreamReader
+            from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent
+        except ImportError:
+            raise RuntimeError("CDC模式需要安装 mysql-replication: pip3 install mysql-replication")
+
+        db_config = self.db_config or db.load_database_config()
+        position = self.start_position()
+        return BinLogStreamReader(
+            connection_settings={
+                'host': db_config['host'],
+                'port': db_config['port'],
+                'user': db_config['user'],
+                'passwd': db_config['password'],
+            },
+            server_id=self.server_id,
+            only_schemas=[db_config['database']],
+            only_tables=list(TABLES),
+            only_events=[WriteRowsEvent, UpdateRowsEvent],
+            resume_stream=bool(position),
+            log_file=position.get('log_file'),
+            log_pos=position.get('log_pos'),
+            blocking=blocking,
+        )
+
+    def dispatch(self, table, action, row, event_time):
+        events = rows_to_events(table, action, row, event_time)
+        for event in events:
+            for sink in self.sinks:
+                sink.add(event)
+        return len(events)
+
+    def run(self, blocking=True):
+        """持续采集，直到stop()被调用或(非阻塞模式下)读完当前binlog"""
+        from pymysqlreplication.row_event import WriteRowsEvent
+
+        stream = self.open_stream(blocking)
+        self.running = True
+        pending = 0
+        last_checkpoint = time.monotonic()
+        total = 0
+
+        try:
+            for binlog_event in stream:
+                action = 'insert' if isinstance(binlog_event, WriteRowsEvent) else 'update'
+                for row in binlog_event.rows:
+                    if action == 'insert':
+                        data = row['values']
+                    else:
+                        data = (row['before_values'], row['after_values'])
+                    count = self.dispatch(binlog_event.table, action, data, binlog_event.timestamp)
+                    pending += count
+                    total += count
+
+                if pending >= CHECKPOINT_EVENTS or time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+                    self.save_position(stream.log_file, stream.log_pos)
+                    pending = 0
+                    last_checkpoint = time.monotonic()
+
+                if not self.running:
+                    break
+        finally:
+            if stream.log_file:
+                self.save_position(stream.log_file, stream.log_pos)
+            stream.close()
+            logger.info(f"binlog采集结束，本次处理{total}个事件")
+        return total
+
+    def stop(self):
+        self.running = False
+
+
+def print_stats(hours):
+    """打印计数器中最近几小时的汇总"""
+    end = datetime.now()
+    start = end - timedelta(hours=hours)
+    summary = ActivityCounters().load().summary(start, end)
+
+    print(f"=== 实时活动计数 {start.strftime('%m-%d %H:%M')} 至 {end.strftime('%m-%d %H:%M')} ===")
+    print(f"新注册: {summary['register'][0]} 人")
+    print(f"登录: {summary['login'][0]} 次")
+    print(f"购买: {summary['purchase'][0]} 笔")
+    print(f"支付订单: {summary['order_paid'][0]} 笔 ¥{summary['order_paid'][1]:.2f}")
+    print(f"课程观看: {summary['watch'][0]} 次 {summary['watch'][2] + summary['watch_time'][2]:.0f} 分钟")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基于binlog的用户活动增量采集')
+    parser.add_argument('command', choices=['run', 'stats'])
+    parser.add_argument('--hours', type=int, default=24, help='stats汇总最近多少小时')
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        print_stats(args.hours)
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from event_store import EventStore
+    from timeline import TimelineIndex
+
+    counters = ActivityCounters().load()
+    store = EventStore()
+    store.start_compactor()
+    index = TimelineIndex()
+    feed = BinlogActivityFeed([counters, EventStreamWriter(), store, index])
+    # SIGTERM时正常退出，finally中会保存位点和计数器
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        feed.run()
+    except KeyboardInterrupt:
+        feed.stop()
+    finally:
+        store.close()
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
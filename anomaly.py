@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+活动量异常检测
+为注册、购买、金额、登录、观看五项指标按 (星期几, 小时) 维护EWMA均值和方差基线，共168个时段。
+每小时只读取刚结束那一小时的数值（优先使用activity_cdc的实时计数器或事件库，计数器开始采集之前、
+超过保留期、事件库没有该天的段或计数器不存在时查询MySQL，登录只取binlog采集的事件），
+与对应时段的基线比较后更新基线，不需要回查历史。偏离超过阈值时立即发送提醒，
+日报也会用窗口内各小时基线之和标出异常的指标。
+用法:
+    python3 anomaly.py check                  # 建议每小时第5分钟执行
+    python3 anomaly.py check --source mysql --catchup-hours 672   # 首次使用，用最近4周建立基线
+    python3 anomaly.py show --metric purchases
+"""
+
+import os
+import sys
+import json
+import math
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+import delivery
+
+# 状态目录
+STATE_DIR = Path("/www/wwwroot/ana/state")
+
+# 指标及中文名
+METRICS = {
+    'registrations': '注册',
+    'purchases': '购买',
+    'revenue': '金额',
+    'logins': '登录',
+    'watches': '观看',
+}
+
+# EWMA平滑系数，每个时段每周更新一次
+ALPHA = 0.3
+
+# 时段至少积累几次样本后才开始判断
+MIN_SAMPLES = 4
+
+# 偏离多少个标准差视为异常，以及最小的绝对偏离（避免小数值的噪声）
+Z_THRESHOLD = 3.0
+MIN_DEVIATION = {
+    'registrations': 3,
+    'purchases': 2,
+    'revenue': 100,
+    'logins': 5,
+    'watches': 5,
+}
+
+# 一次最多补算多少个小时
+MAX_CATCHUP_HOURS = 48
+
+logger = logging.getLogger(__name__)
+
+
+def slot_of(hour_start):
+    """(星期几, 小时) 对应的时段编号"""
+    return hour_start.weekday() * 24 + hour_start.hour
+
+
+class AnomalyDetector:
+    """按时段维护EWMA基线并判断偏离"""
+
+    def __init__(self, path=None, alpha=ALPHA):
+        self.path = Path(path) if path else STATE_DIR / 'anomaly_baseline.json'
+        self.alpha = alpha
+        # {metric: {slot: [均值, 方差, 样本数]}}
+        self.baselines = {metric: {} for metric in METRICS}
+        self.last_hour = None
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.baselines = {metric: {int(slot): v for slot, v in slots.items()}
+                              for metric, slots in data['baselines'].items()}
+            if data.get('last_hour'):
+                self.last_hour = datetime.strptime(data['last_hour'], '%Y-%m-%d %H:%M')
+        except FileNotFoundError:
+            pass
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'baselines': self.baselines,
+                'last_hour': self.last_hour.strftime('%Y-%m-%d %H:%M') if self.last_hour else None,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def update(self, metric, slot, value):
+        stats = self.baselines.setdefault(metric, {}).get(slot)
+        if stats is None:
+            self.baselines[metric][slot] = [float(value), 0.0, 1]
+            return
+        mean, var, n = stats
+        delta = value - mean
+        mean += self.alpha * delta
+        var = (1 - self.alpha) * (var + self.alpha * delta * delta)
+        self.baselines[metric][slot] = [mean, var, n + 1]
+
+    def expected(self, metric, start, end):
+        """[start, end) 内各时段基线之和，返回(均值, 标准差)；样本不足时返回None
+
+        窗口不在整点开始或结束时，首尾两个小时按覆盖的比例计入。
+        """
+        mean_sum, var_sum = 0.0, 0.0
+        hour = start.replace(minute=0, second=0, microsecond=0)
+        while hour < end:
+            next_hour = hour + timedelta(hours=1)
+            share = (min(end, next_hour) - max(start, hour)).total_seconds() / 3600
+            stats = self.baselines.get(metric, {}).get(slot_of(hour))
+            if not stats or stats[2] < MIN_SAMPLES:
+                return None
+            mean_sum += stats[0] * share
+            var_sum += stats[1] * share
+            hour = next_hour
+        return mean_sum, math.sqrt(var_sum)
+
+    def check(self, metric, value, start, end):
+        """判断窗口内的数值是否偏离基线，正常时返回None"""
+        expected = self.expected(metric, start, end)
+        if expected is None:
+            return None
+        mean, std = expected
+        deviation = value - mean
+        if abs(deviation) < MIN_DEVIATION.get(metric, 1):
+            return None
+        # 方差很小时至少按均值的平方根（泊松噪声）估计波动
+        z = deviation / max(std, math.sqrt(max(mean, 1.0)))
+        if abs(z) < Z_THRESHOLD:
+            return None
+        return {'metric': metric, 'value': value, 'mean': mean, 'std': std, 'z': z}
+
+    def process_hour(self, hour_start, values):
+        """检查一个整点小时的数值，然后更新基线，返回异常列表"""
+        hour_end = hour_start + timedelta(hours=1)
+        anomalies = [a for a in (self.check(m, v, hour_start, hour_end) for m, v in values.items()) if a]
+        slot = slot_of(hour_start)
+        for metric, value in values.items():
+            self.update(metric, slot, value)
+        self.last_hour = hour_start
+        return anomalies
+
+
+def values_from_counters(counters, start, end):
+    """从activity_cdc的实时计数器（或summary格式相同的事件库）读取窗口内各指标"""
+    summary = counters.summary(start, end)
+    return {
+        'registrations': summary['register'][0],
+        'purchases': summary['purchase'][0],
+        'revenue': summary['order_paid'][1],
+        'logins': summary['login'][0],
+        'watches': summary['watch'][0],
+    }
+
+
+def values_from_mysql(conn, start, end):
+    """查询MySQL中窗口内各指标，每项一条走时间索引的COUNT/SUM
+
+    不包含登录：wy_user.last_time每次登录都会覆盖，过去窗口的登录数偏少，与binlog登录事件的口径不同，
+    混入同一时段的基线会拉低均值，登录基线只用实时计数器或事件库中采集到的登录事件。
+    """
+    params = [int(start.timestamp()), int(end.timestamp())]
+    queries = {
+        'registrations': "SELECT COUNT(*) as v FROM wy_user WHERE add_time >= %s AND add_time < %s",
+        'purchases': "SELECT COUNT(*) as v FROM wy_special_buy WHERE add_time >= %s AND add_time < %s AND is_del = 0",
+        'revenue': "SELECT COALESCE(SUM(pay_price), 0) as v FROM wy_store_order "
+                   "WHERE add_time >= %s AND add_time < %s AND paid = 1",
+        'watches': "SELECT COUNT(*) as v FROM wy_special_watch WHERE add_time >= %s AND add_time < %s",
+    }
+    values = {}
+    with conn.cursor() as cursor:
+        for metric, sql in queries.items():
+            cursor.execute(sql, params)
+            values[metric] = float(cursor.fetchone()['v'] or 0)
+    return values
+
+
+def format_anomalies(anomalies, title):
+    lines = [title]
+    for a in anomalies:
+        direction = "偏高" if a['z'] > 0 else "偏低"
+        lines.append(f"{METRICS[a['metric']]}{direction}: {a['value']:.0f}（通常{a['mean']:.0f}±{a['std']:.0f}）")
+    return "\n".join(lines)
+
+
+def report_anomalies(sections, start, end, path=None):
+    """检查日报窗口内完整统计的指标（注册、购买、金额），基线不足或读取失败时返回空列表
+
+    金额与基线一样取已支付订单的合计（paid_orders分项），购买明细中一笔订单的多门课程会重复计入订单金额，不能直接相加。
+    """
+    try:
+        detector = AnomalyDetector(path).load()
+        values = {
+            'registrations': len(sections.get('new_users') or []),
+            'purchases': len(sections.get('purchases') or []),
+        }
+        paid_orders = sections.get('paid_orders')
+        if paid_orders:
+            values['revenue'] = float(paid_orders[0].get('revenue') or 0)
+        return [a for a in (detector.check(m, v, start, end) for m, v in values.items()) if a]
+    except Exception as e:
+        logger.warning(f"异常检测失败: {e}")
+        return []
+
+
+def open_source(source):
+    """按source打开实时计数器或事件库，mysql或auto时计数器不存在返回None"""
+    if source == 'store':
+        from event_store import EventStore
+        return EventStore()
+    if source in ('auto', 'counters'):
+        from activity_cdc import ActivityCounters
+        counters = ActivityCounters()
+        if counters.path.exists():
+            return counters.load()
+        if source == 'counters':
+            raise RuntimeError("实时计数器不存在，请先运行 activity_cdc.py run")
+    return None
+
+
+def run_check(now=None, source='auto', catchup_hours=MAX_CATCHUP_HOURS):
+    """处理上次之后所有已结束的整点小时，最近一小时的异常立即发送提醒"""
+    now = now or datetime.now()
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    detector = AnomalyDetector().load()
+
+    first_hour = current_hour - timedelta(hours=catchup_hours)
+    if detector.last_hour and detector.last_hour + timedelta(hours=1) > first_hour:
+        first_hour = detector.last_hour + timedelta(hours=1)
+
+    counters = open_source(source)
+    source_name = '事件库' if source == 'store' else '实时计数器'
+    conn = None
+    latest = []
+    try:
+        hour = first_hour
+        while hour < current_hour:
+            end = hour + timedelta(hours=1)
+            if counters is not None and counters.covers(hour, end, now):
+                values = values_from_counters(counters, hour, end)
+                if not counters.covers(hour, end, now, kind='login'):
+                    # 事件库中从MySQL导入的日期没有登录事件
+                    del values['logins']
+            else:
+                # 计数器开始采集之前、超过保留期或事件库没有段的小时读出来是0，会拉低基线，改查MySQL
+                if counters is not None:
+                    logger.info(f"{hour.strftime('%m-%d %H:00')} 不在{source_name}范围内，改用MySQL")
+                if conn is None:
+                    conn = db.connect_report()
+                values = values_from_mysql(conn, hour, end)
+            anomalies = detector.process_hour(hour, values)
+            if anomalies:
+                logger.warning(format_anomalies(anomalies, f"{hour.strftime('%m-%d %H:00')} 异常"))
+            if end == current_hour:
+                latest = anomalies
+            hour = end
+    finally:
+        if conn:
+            conn.close()
+        detector.save()
+
+    if latest:
+        hour_label = (current_hour - timedelta(hours=1)).strftime('%m-%d %H:00')
+        delivery.broadcast(format_anomalies(latest, f"⚠️ 6页网活动异常({hour_label})"))
+    return latest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='活动量异常检测')
+    parser.add_argument('command', choices=['check', 'show'])
+    parser.add_argument('--source', choices=['auto', 'counters', 'store', 'mysql'], default='auto',
+                        help='数值来源，auto在存在实时计数器时使用计数器，store使用本地事件库')
+    parser.add_argument('--catchup-hours', type=int, default=MAX_CATCHUP_HOURS,
+                        help='最多补算多少小时，首次使用可设为672（4周）从MySQL建立基线')
+    parser.add_argument('--metric', choices=sorted(METRICS), default='purchases', help='show显示的指标')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == 'check':
+        anomalies = run_check(source=args.source, catchup_hours=args.catchup_hours)
+        print(f"发现{len(anomalies)}项异常" if anomalies else "✅ 无异常")
+        return
+
+    detector = AnomalyDetector().load()
+    weekdays = '一二三四五六日'
+    for slot, (mean, var, n) in sorted(detector.baselines.get(args.metric, {}).items()):
+        print(f"周{weekdays[slot // 24]} {slot % 24:02d}:00  均值{mean:8.1f}  标准差{math.sqrt(var):7.1f}  样本{n}")
+
+
+if __name__ == "__main__":
+    main()
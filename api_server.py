@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地HTTP接口
+基于asyncio的轻量服务，供看板读取活动数据：
+- GET /activity?window=6h   最近N小时各分项数据（JSON）
+- GET /report/latest        最近一次渲染好的日报（来自报告缓存，缓存过期后仍返回）
+- GET /health               服务和数据库状态
+
+同一窗口的结果在TTL内只查询一次数据库，并发的请求等待同一次查询；
+响应带ETag，客户端带If-None-Match请求且内容未变时返回304。
+用法:
+    python3 api_server.py --port 8809
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+import settings
+from exporter import to_jsonable
+
+# 监听地址
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8809
+
+# 结果缓存有效期（秒）
+ACTIVITY_TTL = 60
+HEALTH_TTL = 10
+
+# 窗口上限（小时）
+MAX_WINDOW_HOURS = 72
+
+# 连接池大小
+POOL_SIZE = 4
+
+# 请求头最大长度
+MAX_HEADER_BYTES = 16384
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+logger = logging.getLogger(__name__)
+
+
+def json_body(data):
+    return json.dumps(data, ensure_ascii=False, default=to_jsonable).encode('utf-8')
+
+
+class CachedResult:
+    def __init__(self, body, status=200):
+        self.body = body
+        self.status = status
+        self.created = time.monotonic()
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+class TTLCache:
+    """按键缓存生成结果，过期后由第一个请求重新生成，其余并发请求等待同一次生成"""
+
+    def __init__(self):
+        self.entries = {}
+        self.inflight = {}
+
+    async def get(self, key, ttl, producer):
+        entry = self.entries.get(key)
+        if entry and time.monotonic() - entry.created < ttl:
+            return entry
+
+        future = self.inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, producer)
+            self.inflight[key] = future
+            try:
+                result = await future
+            finally:
+                del self.inflight[key]
+            entry = as_result(result)
+            self.entries[key] = entry
+            return entry
+
+        result = await asyncio.shield(future)
+        return self.entries.get(key) or as_result(result)
+
+
+def as_result(value):
+    return value if isinstance(value, CachedResult) else CachedResult(value)
+
+
+def parse_window(value):
+    """解析 6h / 24h / 12 形式的窗口，返回小时数"""
+    value = (value or '6h').strip().lower()
+    if value.endswith('h'):
+        value = value[:-1]
+    hours = int(value)
+    if not 1 <= hours <= MAX_WINDOW_HOURS:
+        raise ValueError(f"window需要在1-{MAX_WINDOW_HOURS}小时之间")
+    return hours
+
+
+class ActivityApi:
+    """各接口的数据来源"""
+
+    def __init__(self, pool=None, cache=None):
+        self.pool = pool or db.ConnectionPool(POOL_SIZE)
+        self.cache = cache or TTLCache()
+        self.started = time.time()
+
+    def load_activity(self, hours):
+        """在线程池中执行: 查询窗口内各分项"""
+        from query_6hours_activity import SixHoursActivityQuery, SECTION_QUERIES
+
+        end_time = datetime.now().replace(second=0, microsecond=0)
+        query = SixHoursActivityQuery(end_time=end_time, hours=hours)
+        with self.pool.connection() as conn:
+            sections = {name: [row for batch in query.stream_section(conn, name) for row in batch]
+                        for name in SECTION_QUERIES}
+        return json_body({
+            'start_time': query.start_time,
+            'end_time': query.end_time,
+            'hours': hours,
+            'counts': {name: len(rows) for name, rows in sections.items()},
+            'sections': sections,
+        })
+
+    def load_latest_report(self):
+        from report_cache import ReportCache
+
+        # 缓存过期只表示不再复用查询结果，最近一次的日报在下一次日报之前一直有效
+        entry = ReportCache().latest('daily', include_expired=True)
+        if not entry:
+            return CachedResult(json_body({'error': '没有缓存的报告'}), status=404)
+        return json_body({
+            'key': json.loads(entry['key']),
+            'created': datetime.fromtimestamp(entry['created']),
+            'payload': entry['payload'],
+        })
+
+    def load_health(self):
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            database = 'ok'
+        except Exception as e:
+            logger.warning(f"健康检查数据库失败: {e}")
+            database = 'error'
+        status = 200 if database == 'ok' else 503
+        return CachedResult(json_body({
+            'status': 'ok' if status == 200 else 'degraded',
+            'database': database,
+            'uptime': int(time.time() - self.started),
+        }), status=status)
+
+    async def route(self, method, target):
+        """返回CachedResult"""
+        if method not in ('GET', 'HEAD'):
+            return CachedResult(json_body({'error': 'method not allowed'}), status=405)
+
+        url = urlsplit(target)
+        if url.path == '/activity':
+            try:
+                hours = parse_window(parse_qs(url.query).get('window', ['6h'])[0])
+            except ValueError as e:
+                return CachedResult(json_body({'error': str(e)}), status=400)
+            return await self.cache.get(('activity', hours), ACTIVITY_TTL, lambda: self.load_activity(hours))
+        if url.path == '/report/latest':
+            return await self.cache.get(('report',), ACTIVITY_TTL, self.load_latest_report)
+        if url.path == '/health':
+            return await self.cache.get(('health',), HEALTH_TTL, self.load_health)
+        return CachedResult(json_body({'error': 'not found'}), status=404)
+
+
+async def read_request(reader):
+    """读取请求行和请求头，返回(方法, 路径, 请求头)"""
+    data = await reader.readuntil(b'\r\n\r\n')
+    if len(data) > MAX_HEADER_BYTES:
+        raise ValueError("请求头过长")
+    lines = data.decode('latin-1').split('\r\n')
+    method, target, _ = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method.upper(), target, headers
+
+
+def build_response(status, body=b'', etag=None, head=False):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}",
+             "Content-Type: application/json; charset=utf-8",
+             f"Content-Length: {len(body)}",
+             "Cache-Control: no-cache",
+             "Connection: close"]
+    if etag:
+        lines.append(f"ETag: {etag}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + (b'' if head else body)
+
+
+def make_handler(api):
+    async def handle(reader, writer):
+        try:
+            method, target, headers = await asyncio.wait_for(read_request(reader), timeout=10)
+            try:
+                result = await api.route(method, target)
+            except Exception as e:
+                logger.error(f"处理请求失败 {target}: {e}")
+                result = CachedResult(json_body({'error': '查询失败'}), status=500)
+
+            if result.status == 200 and headers.get('if-none-match') == result.etag:
+                response = build_response(304, etag=result.etag)
+            else:
+                response = build_response(result.status, result.body,
+                                          result.etag if result.status == 200 else None, head=(method == 'HEAD'))
+            writer.write(response)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host, port, api=None):
+    api = api or ActivityApi()
+    server = await asyncio.start_server(make_handler(api), host, port, limit=MAX_HEADER_BYTES)
+    logger.info(f"HTTP接口已启动 http://{host}:{port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    watcher = asyncio.create_task(watch_settings(api, stop))
+    async with server:
+        await stop.wait()
+    await watcher
+    api.pool.close()
+
+
+async def watch_settings(api, stop, interval=settings.RELOAD_INTERVAL):
+    """config.py修改后重新加载，关闭空闲连接，之后借出的连接按新配置建立"""
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            if settings.reload_if_changed():
+                api.pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='活动数据HTTP接口')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
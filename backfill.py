@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史报告回填
+为任意历史日期范围重新生成日报/6小时报告：
+- 每张事实表按 (时间列, 主键) 做键集分页，每页一条短查询，不会长时间持有锁或返回超大结果集
+- 用户、课程等维度数据按id批量补齐
+- 每一天交给一个工作进程，多天并行
+- 每完成一天写一次断点，中断后重新执行会跳过已完成的日期
+
+注意: wy_user.last_time 会被覆盖，历史窗口的"老用户登录"只能反映最后一次登录时间落在窗口内的用户。
+用法:
+    python3 backfill.py --start 2025-08-01 --end 2025-08-31 --type daily --workers 4
+"""
+
+import os
+import sys
+import io
+import json
+import logging
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+
+# 输出和断点目录
+OUTPUT_DIR = Path("/www/wwwroot/ana/webhook-log/backfill")
+STATE_DIR = Path("/www/wwwroot/ana/state")
+
+# 每页行数
+PAGE_SIZE = 2000
+
+# IN查询每批的id数
+LOOKUP_BATCH = 1000
+
+# 报告类型: 窗口长度（小时）
+REPORT_WINDOWS = {
+    'daily': 24,
+    '6h': 6,
+}
+
+# 日报中登录和观看只展示前20条，与webhook.py一致
+DAILY_TOP_LIMIT = 20
+
+logger = logging.getLogger(__name__)
+
+
+def keyset_scan(conn, table, columns, time_col, key_col, start_ts, end_ts, where='', page_size=PAGE_SIZE,
+                after=None):
+    """按 (time_col, key_col) 键集分页读取 [start_ts, end_ts) 内的行，逐页返回
+
+    after为上次读到的 (time, key)，用于从中断处继续
+    """
+    select = ', '.join(columns)
+    extra = f"AND {where}" if where else ''
+    sql = f"""
+    SELECT {select}
+    FROM {table}
+    WHERE {time_col} >= %s AND {time_col} < %s
+    AND ({time_col} > %s OR ({time_col} = %s AND {key_col} > %s))
+    {extra}
+    ORDER BY {time_col}, {key_col}
+    LIMIT %s
+    """
+    last_time, last_key = after or (start_ts - 1, 0)
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, [start_ts, end_ts, last_time, last_time, last_key, page_size])
+            page = cursor.fetchall()
+        if page:
+            yield page
+            last_time, last_key = page[-1][time_col], page[-1][key_col]
+        if len(page) < page_size:
+            return
+
+
+def scan_all(conn, *args, **kwargs):
+    """读取全部分页"""
+    rows = []
+    for page in keyset_scan(conn, *args, **kwargs):
+        rows.extend(page)
+    return rows
+
+
+class DimensionCache:
+    """按id批量补齐用户、课程、订单等维度数据，已读过的id不重复查询"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.users = {}
+        self.specials = {}
+        self.order_prices = {}
+        self.order_products = {}
+
+    def _lookup(self, store, ids, sql, key, value=None, multi=False):
+        missing = [i for i in set(ids) if i not in store]
+        for offset in range(0, len(missing), LOOKUP_BATCH):
+            batch = missing[offset:offset + LOOKUP_BATCH]
+            placeholders = ', '.join(['%s'] * len(batch))
+            with self.conn.cursor() as cursor:
+                cursor.execute(sql.format(placeholders=placeholders), batch)
+                rows = cursor.fetchall()
+            for item in batch:
+                store.setdefault(item, [] if multi else None)
+            for row in rows:
+                item = value(row) if value else row
+                if multi:
+                    store[row[key]].append(item)
+                else:
+                    store[row[key]] = item
+
+    def load_users(self, uids):
+        self._lookup(self.users, uids, """
+            SELECT u.uid, u.nickname, u.phone, u.add_time, u.status, wu.nickname as wechat_name, wu.openid
+            FROM wy_user u
+            LEFT JOIN wy_wechat_user wu ON u.uid = wu.uid
+            WHERE u.uid IN ({placeholders})
+        """, 'uid')
+
+    def load_specials(self, ids):
+        self._lookup(self.specials, ids,
+                     "SELECT id, title, is_del FROM wy_special WHERE id IN ({placeholders})", 'id')
+
+    def load_order_prices(self, order_ids):
+        self._lookup(self.order_prices, order_ids,
+                     "SELECT order_id, pay_price FROM wy_store_order WHERE order_id IN ({placeholders})",
+                     'order_id', value=lambda row: row['pay_price'])
+
+    def load_order_products(self, oids):
+        self._lookup(self.order_products, oids, """
+            SELECT ci.oid, s.title
+            FROM wy_store_order_cart_info ci
+            JOIN wy_special s ON ci.product_id = s.id
+            WHERE ci.oid IN ({placeholders})
+        """, 'oid', value=lambda row: row['title'], multi=True)
+
+    def prefetch(self, start_ts, end_ts):
+        """预读整个时间范围内会用到的维度: 全部课程和范围内有活动的用户"""
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT id, title, is_del FROM wy_special")
+            for row in cursor.fetchall():
+                self.specials[row['id']] = row
+
+            cursor.execute("""
+                SELECT uid FROM wy_user WHERE add_time >= %s AND add_time < %s
+                UNION SELECT uid FROM wy_user WHERE last_time >= %s AND last_time < %s
+                UNION SELECT uid FROM wy_special_buy WHERE add_time >= %s AND add_time < %s
+                UNION SELECT uid FROM wy_store_order WHERE add_time >= %s AND add_time < %s
+                UNION SELECT uid FROM wy_special_watch WHERE add_time >= %s AND add_time < %s
+            """, [start_ts, end_ts] * 5)
+            uids = [row['uid'] for row in cursor.fetchall()]
+        self.load_users(uids)
+        return self
+
+    def snapshot(self):
+        """导出维度数据，用于传给工作进程"""
+        return {
+            'users': self.users,
+            'specials': self.specials,
+            'order_prices': self.order_prices,
+            'order_products': self.order_products,
+        }
+
+    def restore(self, snapshot):
+        for name, values in snapshot.items():
+            getattr(self, name).update(values)
+        return self
+
+
+def to_datetime(ts):
+    return datetime.fromtimestamp(ts) if ts else None
+
+
+def build_daily_sections(conn, dims, start, end, page_size=PAGE_SIZE):
+    """按webhook.py日报的口径生成各分项数据"""
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    user_cols = ['uid', 'add_time', 'last_time']
+
+    registrations = scan_all(conn, 'wy_user', user_cols, 'add_time', 'uid', start_ts, end_ts,
+                             page_size=page_size)
+    buys = scan_all(conn, 'wy_special_buy', ['id', 'uid', 'special_id', 'order_id', 'add_time'],
+                    'add_time', 'id', start_ts, end_ts, where='is_del = 0', page_size=page_size)
+    logins = scan_all(conn, 'wy_user', user_cols, 'last_time', 'uid', start_ts, end_ts,
+                      where=f'add_time < {start_ts}', page_size=page_size)
+    watches = scan_all(conn, 'wy_special_watch', ['id', 'uid', 'special_id', 'viewing_time', 'percentage', 'add_time'],
+                       'add_time', 'id', start_ts, end_ts,
+                       page_size=page_size)
+
+    dims.load_users([r['uid'] for r in registrations + buys + logins + watches])
+    dims.load_specials([r['special_id'] for r in buys + watches])
+    dims.load_order_prices([r['order_id'] for r in buys if r['order_id']])
+
+    def user_fields(uid):
+        user = dims.users.get(uid) or {}
+        return {'uid': uid, 'phone': user.get('phone'), 'nickname': user.get('nickname'),
+                'wechat_name': user.get('wechat_name')}
+
+    def title(special_id):
+        return (dims.specials.get(special_id) or {}).get('title')
+
+    new_users = [dict(user_fields(r['uid']), register_time=to_datetime(r['add_time']))
+                 for r in sorted(registrations, key=lambda r: r['add_time'], reverse=True)]
+    purchases = [dict(user_fields(r['uid']), product_name=title(r['special_id']),
+                      pay_price=dims.order_prices.get(r['order_id']), purchase_time=to_datetime(r['add_time']))
+                 for r in sorted(buys, key=lambda r: r['add_time'], reverse=True) if dims.users.get(r['uid'])]
+    login_rows = [dict(user_fields(r['uid']), last_login_time=to_datetime(r['last_time']), register_time=r['add_time'])
+                  for r in sorted(logins, key=lambda r: r['last_time'], reverse=True)[:DAILY_TOP_LIMIT]]
+    course_watches = [dict(user_fields(r['uid']), course_name=title(r['special_id']), viewing_time=r['viewing_time'],
+                           percentage=r['percentage'], watch_time=to_datetime(r['add_time']))
+                      for r in sorted(watches, key=lambda r: r['viewing_time'] or 0, reverse=True)
+                      if dims.users.get(r['uid'])][:DAILY_TOP_LIMIT]
+
+    return {
+        'new_users': new_users,
+        'purchases': purchases,
+        'logins': login_rows,
+        'course_watches': course_watches,
+    }
+
+
+def build_6h_sections(conn, dims, start, end, page_size=PAGE_SIZE):
+    """按query_6hours_activity.py的口径生成各分项数据，窗口为 (start, end]"""
+    start_ts, end_ts = int(start.timestamp()) + 1, int(end.timestamp()) + 1
+    user_cols = ['uid', 'add_time', 'last_time']
+
+    registrations = scan_all(conn, 'wy_user', user_cols, 'add_time', 'uid', start_ts, end_ts,
+                             where='status = 1', page_size=page_size)
+    orders = scan_all(conn, 'wy_store_order', ['id', 'order_id', 'uid', 'pay_price', 'add_time'],
+                      'add_time', 'id', start_ts, end_ts, where='paid = 1', page_size=page_size)
+    old_user_before = int((end - timedelta(days=1)).timestamp())
+    logins = scan_all(conn, 'wy_user', user_cols, 'last_time', 'uid', start_ts, end_ts,
+                      where=f'add_time < {old_user_before} AND status = 1', page_size=page_size)
+    watches = scan_all(conn, 'wy_special_watch',
+                       ['id', 'uid', 'special_id', 'viewing_time', 'percentage', 'is_complete', 'add_time'],
+                       'add_time', 'id', start_ts, end_ts,
+                       page_size=page_size)
+
+    dims.load_users([r['uid'] for r in registrations + orders + logins + watches])
+    dims.load_specials([r['special_id'] for r in watches])
+    dims.load_order_products([r['id'] for r in orders])
+
+    def user_fields(uid):
+        user = dims.users.get(uid) or {}
+        return {'uid': uid, 'user_name': user.get('nickname'), 'phone': user.get('phone'),
+                'wechat_name': user.get('wechat_name')}
+
+    new_users = [dict(user_fields(r['uid']), register_time=to_datetime(r['add_time']),
+                      register_type='微信注册' if (dims.users.get(r['uid']) or {}).get('openid') else '手机注册')
+                 for r in sorted(registrations, key=lambda r: r['add_time'], reverse=True)]
+    purchases = [dict(user_fields(r['uid']), order_id=r['order_id'], pay_price=r['pay_price'],
+                      purchase_time=to_datetime(r['add_time']),
+                      products=', '.join(sorted(set(dims.order_products.get(r['id']) or []))) or None)
+                 for r in sorted(orders, key=lambda r: r['add_time'], reverse=True)]
+    login_rows = [dict(user_fields(r['uid']), last_login_time=to_datetime(r['last_time']),
+                       register_time=to_datetime(r['add_time']),
+                       register_days_ago=(end.date() - to_datetime(r['add_time']).date()).days)
+                  for r in sorted(logins, key=lambda r: r['last_time'], reverse=True)]
+
+    watching = []
+    for r in sorted(watches, key=lambda r: r['add_time'], reverse=True):
+        user = dims.users.get(r['uid'])
+        special = dims.specials.get(r['special_id'])
+        if not user or user.get('status') != 1 or not special or special.get('is_del') != 0:
+            continue
+        watching.append(dict(user_fields(r['uid']), course_name=special.get('title'),
+                             watch_duration_minutes=r['viewing_time'], completion_percentage=r['percentage'],
+                             watch_start_time=to_datetime(r['add_time']),
+                             watch_status='已完成' if r['is_complete'] == 1 else '观看中'))
+
+    return {
+        'new_users': new_users,
+        'purchases': purchases,
+        'logins': login_rows,
+        'watching': watching,
+    }
+
+
+def render(report_type, end, sections):
+    """用线上报告同样的格式渲染"""
+    if report_type == 'daily':
+        from webhook import UserActivityReporter
+        return UserActivityReporter(now=end).render_report(sections)
+
+    from query_6hours_activity import SixHoursActivityQuery
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        SixHoursActivityQuery(end_time=end, hours=REPORT_WINDOWS['6h']).format_results(sections)
+    return buffer.getvalue()
+
+
+def day_windows(day, report_type):
+    """一天内各报告窗口的结束时间"""
+    hours = REPORT_WINDOWS[report_type]
+    return [day + timedelta(hours=h) for h in range(hours, 25, hours)]
+
+
+def build_day(day_str, report_type, output_dir, page_size=PAGE_SIZE):
+    """工作进程入口: 生成一天内的所有报告，返回(日期, 报告数)"""
+    day = datetime.strptime(day_str, '%Y-%m-%d')
+    hours = REPORT_WINDOWS[report_type]
+    build = build_daily_sections if report_type == 'daily' else build_6h_sections
+    target_dir = Path(output_dir) / report_type
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    conn = db.connect_report()
+    conn.autocommit(True)
+    try:
+        dims = DimensionCache(conn)
+        for end in day_windows(day, report_type):
+            sections = build(conn, dims, end - timedelta(hours=hours), end, page_size)
+            report = render(report_type, end, sections)
+            path = target_dir / f"report_{end.strftime('%Y%m%d_%H%M')}.txt"
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(report)
+    finally:
+        conn.close()
+    return day_str, len(day_windows(day, report_type))
+
+
+class Checkpoint:
+    """记录已完成的日期，支持断点续跑"""
+
+    def __init__(self, report_type, path=None):
+        self.path = Path(path) if path else STATE_DIR / f"backfill_{report_type}.json"
+        self.done = set()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.done = set(json.load(f)['done'])
+        except FileNotFoundError:
+            pass
+        return self
+
+    def mark(self, day_str):
+        self.done.add(day_str)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.done = set()
+        if self.path.exists():
+            self.path.unlink()
+
+
+def date_range(start, end):
+    day = start
+    while day <= end:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+
+def run_backfill(start, end, report_type, workers, output_dir, page_size=PAGE_SIZE, restart=False):
+    """回填[start, end]内每一天的报告，返回失败的日期列表"""
+    checkpoint = Checkpoint(report_type)
+    if restart:
+        checkpoint.reset()
+    checkpoint.load()
+
+    days = [d for d in date_range(start, end) if d not in checkpoint.done]
+    skipped = len(list(date_range(start, end))) - len(days)
+    if skipped:
+        logger.info(f"跳过已完成的{skipped}天")
+    if not days:
+        return []
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(build_day, d, report_type, str(output_dir), page_size): d for d in days}
+        for future in as_completed(futures):
+            day_str = futures[future]
+            try:
+                _, count = future.result()
+                checkpoint.mark(day_str)
+                logger.info(f"{day_str} 完成，生成{count}份报告")
+            except Exception as e:
+                failed.append(day_str)
+                logger.error(f"{day_str} 回填失败: {e}")
+    return sorted(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='历史报告回填')
+    parser.add_argument('--start', required=True, help='开始日期 YYYY-MM-DD')
+    parser.add_argument('--end', required=True, help='结束日期 YYYY-MM-DD（包含）')
+    parser.add_argument('--type', choices=sorted(REPORT_WINDOWS), default='daily', help='报告类型')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='并行进程数')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='键集分页每页行数')
+    parser.add_argument('--output-dir', default=str(OUTPUT_DIR), help='报告输出目录')
+    parser.add_argument('--restart', action='store_true', help='忽略断点，全部重新生成')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    start = datetime.strptime(args.start, '%Y-%m-%d')
+    end = datetime.strptime(args.end, '%Y-%m-%d')
+
+    failed = run_backfill(start, end, args.type, args.workers, args.output_dir, args.page_size, args.restart)
+    if failed:
+        print(f"❌ {len(failed)}天回填失败: {', '.join(failed)}，重新执行即可续跑")
+        sys.exit(1)
+    print("✅ 回填完成")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量报告
+在进程池中并行生成大量报告，按输入顺序合并结果：
+- windows: 按时间窗口拆分，例如最近一周的逐小时明细
+- courses: 按课程拆分，每门课程一份观看/购买报告
+
+主进程先一次性预读课程和范围内活跃用户等维度数据，通过进程池初始化函数交给每个工作进程，
+工作进程只读取事实表。
+用法:
+    python3 batch_reports.py windows --days 7 --hours 1
+    python3 batch_reports.py courses --days 30 --course 12 --course 15
+"""
+
+import os
+import sys
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+from backfill import DimensionCache, build_6h_sections, scan_all, PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内的连接和维度数据，由 _init_worker 设置
+_worker = {}
+
+
+def _init_worker(snapshot, page_size):
+    conn = db.connect_report()
+    conn.autocommit(True)
+    _worker['conn'] = conn
+    _worker['dims'] = DimensionCache(conn).restore(snapshot)
+    _worker['page_size'] = page_size
+
+
+def summarize_window(sections):
+    """窗口内各项指标"""
+    return {
+        'new_users': len(sections['new_users']),
+        'purchases': len(sections['purchases']),
+        'revenue': sum(float(p.get('pay_price') or 0) for p in sections['purchases']),
+        'logins': len(sections['logins']),
+        'watches': len(sections['watching']),
+        'watch_minutes': sum(float(w.get('watch_duration_minutes') or 0) for w in sections['watching']),
+    }
+
+
+def window_task(window):
+    """工作进程: 生成一个时间窗口的汇总，窗口为 (start, end]"""
+    start, end = window
+    sections = build_6h_sections(_worker['conn'], _worker['dims'], start, end, _worker['page_size'])
+    return summarize_window(sections)
+
+
+def course_task(task):
+    """工作进程: 生成一门课程在 [start, end) 内的观看和购买汇总"""
+    special_id, start_ts, end_ts = task
+    conn, dims, page_size = _worker['conn'], _worker['dims'], _worker['page_size']
+
+    watches = scan_all(conn, 'wy_special_watch', ['id', 'uid', 'viewing_time', 'percentage', 'is_complete', 'add_time'],
+                       'add_time', 'id', start_ts, end_ts, where=f'special_id = {int(special_id)}',
+                       page_size=page_size)
+    buys = scan_all(conn, 'wy_special_buy', ['id', 'uid', 'order_id', 'add_time'],
+                    'add_time', 'id', start_ts, end_ts, where=f'special_id = {int(special_id)} AND is_del = 0',
+                    page_size=page_size)
+    dims.load_order_prices([b['order_id'] for b in buys if b['order_id']])
+
+    return {
+        'special_id': special_id,
+        'title': (dims.specials.get(special_id) or {}).get('title') or f"课程{special_id}",
+        'watches': len(watches),
+        'viewers': len({w['uid'] for w in watches}),
+        'watch_minutes': sum(float(w['viewing_time'] or 0) for w in watches),
+        'completed': sum(1 for w in watches if w['is_complete'] == 1),
+        'purchases': len(buys),
+        'revenue': sum(float(dims.order_prices.get(b['order_id']) or 0) for b in buys),
+    }
+
+
+class BatchReportRunner:
+    """预读维度数据后在进程池中并行执行任务，结果按任务顺序返回"""
+
+    def __init__(self, start, end, workers=None, page_size=PAGE_SIZE):
+        self.start = start
+        self.end = end
+        self.workers = workers or os.cpu_count() or 2
+        self.page_size = page_size
+
+    def prefetch(self):
+        conn = db.connect_report()
+        try:
+            dims = DimensionCache(conn).prefetch(int(self.start.timestamp()), int(self.end.timestamp()) + 1)
+            logger.info(f"预读维度: {len(dims.users)}个用户, {len(dims.specials)}门课程")
+            return dims.snapshot()
+        finally:
+            conn.close()
+
+    def map(self, func, tasks):
+        tasks = list(tasks)
+        if not tasks:
+            return []
+        snapshot = self.prefetch()
+        chunksize = max(1, len(tasks) // (self.workers * 4))
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(snapshot, self.page_size)) as pool:
+            return list(pool.map(func, tasks, chunksize=chunksize))
+
+    def windows(self, hours):
+        """按hours小时拆分 (start, end]，返回[(窗口结束时间, 汇总), ...]"""
+        windows = []
+        end = self.start + timedelta(hours=hours)
+        while end <= self.end:
+            windows.append((end - timedelta(hours=hours), end))
+            end += timedelta(hours=hours)
+        results = self.map(window_task, windows)
+        return [(window[1], summary) for window, summary in zip(windows, results)]
+
+    def active_courses(self):
+        """范围内有观看或购买的课程"""
+        conn = db.connect_report()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT special_id FROM wy_special_watch WHERE add_time >= %s AND add_time < %s
+                    UNION SELECT special_id FROM wy_special_buy WHERE add_time >= %s AND add_time < %s AND is_del = 0
+                """, [int(self.start.timestamp()), int(self.end.timestamp())] * 2)
+                return sorted(row['special_id'] for row in cursor.fetchall())
+        finally:
+            conn.close()
+
+    def courses(self, special_ids=None):
+        """按课程并行汇总，结果顺序与课程列表一致"""
+        special_ids = special_ids or self.active_courses()
+        start_ts, end_ts = int(self.start.timestamp()), int(self.end.timestamp())
+        return self.map(course_task, [(special_id, start_ts, end_ts) for special_id in special_ids])
+
+
+def format_windows(results):
+    lines = ["窗口结束         注册  订单  金额      登录  观看  观看分钟"]
+    for end, s in results:
+        lines.append(f"{end.strftime('%m-%d %H:%M'):<16} {s['new_users']:>4}  {s['purchases']:>4}  "
+                     f"{s['revenue']:>8.0f}  {s['logins']:>4}  {s['watches']:>4}  {s['watch_minutes']:>8.0f}")
+    return "\n".join(lines)
+
+
+def format_courses(results):
+    lines = []
+    for c in results:
+        lines.append(f"📚 {c['title']}(#{c['special_id']})")
+        lines.append(f"  观看{c['watches']}次 {c['viewers']}人 {c['watch_minutes']:.0f}分钟 完成{c['completed']}次")
+        lines.append(f"  购买{c['purchases']}笔 ¥{c['revenue']:.0f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量并行生成报告')
+    parser.add_argument('mode', choices=['windows', 'courses'])
+    parser.add_argument('--days', type=int, default=7, help='统计最近多少天')
+    parser.add_argument('--hours', type=int, default=1, help='windows模式的窗口长度（小时）')
+    parser.add_argument('--course', type=int, action='append', help='courses模式只统计指定课程，可重复')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数，默认为CPU核数')
+    parser.add_argument('--output', help='合并结果写入的文件')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    runner = BatchReportRunner(end - timedelta(days=args.days), end, args.workers)
+
+    if args.mode == 'windows':
+        text = format_windows(runner.windows(args.hours))
+    else:
+        text = format_courses(runner.courses(args.course))
+
+    print(text)
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(text + "\n", encoding='utf-8')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+投递链路压测
+启动本地企业微信模拟服务（fake_wecom.py），按指定并发反复调用发送路径，
+统计吞吐、延迟分位数、成功率和重试次数，并与本机保存的基线比较。
+基线是绝对耗时，只能与同一台机器上的结果比较，所以不提交到仓库，在每台机器上用 --save-baseline 生成。
+- send: 日报发送路径（UserActivityReporter.send_webhook -> delivery.broadcast）
+- monitor: 监控脚本的webhook连通性检查（WebhookMonitor.check_webhook_connectivity）
+用法:
+    python3 bench_delivery.py --concurrency 8 --requests 200 --error-rate 0.05
+    python3 bench_delivery.py --save-baseline        # 记录当前结果为基线
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import delivery
+from fake_wecom import FakeWeComServer, FaultConfig
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 本机基线文件（不提交到仓库）
+BASELINE_FILE = os.path.join(SCRIPT_DIR, 'bench_delivery_baseline.json')
+
+# 与基线相比允许的退化比例
+TOLERANCE = 0.25
+
+MESSAGE = "📊 6页网24小时活动报告(压测)\n🆕 新注册3人：微信:测试 手机:1234\n💰 购买1笔¥99"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def make_call(scenario):
+    """返回一次调用的函数，返回值为是否成功"""
+    if scenario == 'monitor':
+        from webhook_monitor import WebhookMonitor
+        monitor = WebhookMonitor.__new__(WebhookMonitor)
+        monitor.logger = logging.getLogger('webhook_monitor')
+        return monitor.check_webhook_connectivity
+
+    from webhook import UserActivityReporter
+    reporter = UserActivityReporter.__new__(UserActivityReporter)
+    return lambda: reporter.send_webhook(MESSAGE)
+
+
+def run_load(args, server):
+    """在并发线程中执行requests次调用，返回统计结果"""
+    target = delivery.WeComTarget('bench', server.url, timeout=args.client_timeout,
+                                  rate_per_minute=args.client_rate or None,
+                                  retries=args.retries, backoff=args.backoff)
+    router = delivery.WebhookRouter([target])
+    call = make_call(args.scenario)
+
+    latencies = []
+    outcomes = []
+    lock = threading.Lock()
+
+    def one(_):
+        started = time.perf_counter()
+        success = call()
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            outcomes.append(success)
+
+    with patch.object(delivery, 'get_router', return_value=router):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(one, range(args.requests)))
+        wall = time.perf_counter() - started
+
+    attempts = server.stats['requests']
+    return {
+        'scenario': args.scenario,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'faults': {'latency_ms': args.latency_ms, 'error_rate': args.error_rate,
+                   'timeout_rate': args.timeout_rate, 'rate_limit': args.rate_limit},
+        'throughput': args.requests / wall if wall else 0.0,
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies),
+        'success_rate': sum(outcomes) / len(outcomes),
+        'attempts': attempts,
+        'retries': max(attempts - args.requests, 0),
+        'server': dict(server.stats),
+    }
+
+
+def compare(result, baseline, tolerance=TOLERANCE):
+    """与基线比较，返回退化项列表"""
+    regressions = []
+    if result['throughput'] < baseline['throughput'] * (1 - tolerance):
+        regressions.append(f"吞吐 {result['throughput']:.1f}/s < 基线 {baseline['throughput']:.1f}/s")
+    for key in ('p95_ms', 'p99_ms'):
+        if result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {result[key]:.1f} > 基线 {baseline[key]:.1f}")
+    if result['success_rate'] < baseline['success_rate'] - 0.05:
+        regressions.append(f"成功率 {result['success_rate']:.1%} < 基线 {baseline['success_rate']:.1%}")
+    return regressions
+
+
+def baseline_key(result):
+    faults = result['faults']
+    return (f"{result['scenario']}-c{result['concurrency']}-lat{faults['latency_ms']:g}-err{faults['error_rate']:g}"
+            f"-to{faults['timeout_rate']:g}-rl{faults['rate_limit']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='投递链路压测')
+    parser.add_argument('--scenario', choices=['send', 'monitor'], default='send')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=20, help='模拟服务固定延迟')
+    parser.add_argument('--jitter-ms', type=float, default=10, help='模拟服务随机附加延迟')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='模拟服务返回502的比例')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='模拟服务不响应的比例')
+    parser.add_argument('--rate-limit', type=int, default=0, help='模拟服务每个key每分钟允许的消息数，0为不限制')
+    parser.add_argument('--client-timeout', type=float, default=2.0, help='客户端请求超时（秒）')
+    parser.add_argument('--client-rate', type=int, default=0, help='客户端限速（条/分钟），0为不限速')
+    parser.add_argument('--retries', type=int, default=delivery.DEFAULT_RETRIES)
+    parser.add_argument('--backoff', type=float, default=0.1, help='重试退避（秒），线上默认1秒')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--baseline-file', default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    faults = FaultConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.timeout_rate,
+                         hang_seconds=args.client_timeout + 1, rate_limit=args.rate_limit, seed=args.seed)
+    with FakeWeComServer(faults=faults) as server:
+        result = run_load(args, server)
+
+    print(f"场景: {result['scenario']}  并发: {result['concurrency']}  调用: {result['requests']}")
+    print(f"吞吐: {result['throughput']:.1f} 次/秒  成功率: {result['success_rate']:.1%}")
+    print(f"延迟: p50 {result['p50_ms']:.1f}ms  p95 {result['p95_ms']:.1f}ms  "
+          f"p99 {result['p99_ms']:.1f}ms  max {result['max_ms']:.1f}ms")
+    print(f"服务端请求: {result['attempts']}  重试: {result['retries']}  明细: {result['server']}")
+
+    baselines = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file, encoding='utf-8') as f:
+            baselines = json.load(f)
+
+    key = baseline_key(result)
+    if args.save_baseline:
+        baselines[key] = result
+        with open(args.baseline_file, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"已保存基线: {key}")
+        return
+
+    if key not in baselines:
+        print(f"本机没有基线 {key}，使用 --save-baseline 记录")
+        return
+    regressions = compare(result, baselines[key])
+    for item in regressions:
+        print(f"❌ {item}")
+    if regressions:
+        sys.exit(1)
+    print("✅ 未超出基线")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+脚本导入耗时基准测试
+在独立子进程中多次导入各模块，统计启动耗时、最慢的依赖以及是否提前加载了重量级依赖
+用法: python3 bench_import.py [模块名...] [--runs N] [--max-ms 毫秒]
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import time
+
+# 需要保持快速启动的模块
+DEFAULT_MODULES = ['webhook', 'webhook_monitor', 'query_6hours_activity', 'db', 'delivery']
+
+# 导入阶段不应加载的重量级依赖
+HEAVY_MODULES = ['pymysql', 'requests', 'config']
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_import(module):
+    """在新进程中导入模块，返回(总耗时ms, importtime输出, 已加载的重量级依赖)"""
+    code = (
+        f"import sys; import {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=SCRIPT_DIR, capture_output=True, text=True
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    loaded = [m for m in result.stdout.strip().split(',') if m]
+    return elapsed, result.stderr, loaded
+
+
+def slowest_imports(importtime_output, limit=5):
+    """解析 -X importtime 输出，返回累计耗时最长的模块"""
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='脚本导入耗时基准测试')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--runs', type=int, default=5, help='每个模块的测试次数')
+    parser.add_argument('--max-ms', type=float, default=None, help='中位数超过该值时返回非0')
+    args = parser.parse_args()
+
+    # 解释器自身的启动时间作为基线
+    baseline = statistics.median(run_import('sys')[0] for _ in range(args.runs))
+    print(f"解释器启动基线: {baseline:.1f}ms")
+    print("=" * 60)
+
+    failed = False
+    for module in args.modules:
+        try:
+            samples = [run_import(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<24} 导入失败: {e}")
+            failed = True
+            continue
+
+        median = statistics.median(s[0] for s in samples)
+        loaded = samples[-1][2]
+        status = "✅"
+        if loaded or (args.max_ms is not None and median > args.max_ms):
+            status = "❌"
+            failed = True
+
+        print(f"{status} {module:<24} {median:>7.1f}ms (除去基线 {median - baseline:.1f}ms)")
+        if loaded:
+            print(f"   导入时加载了重量级依赖: {', '.join(loaded)}")
+        for cumulative, name in slowest_imports(samples[-1][1]):
+            print(f"   {cumulative / 1000:>7.1f}ms  {name}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
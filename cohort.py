@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+注册周队列留存分析
+按 wy_user.add_time 所在周划分注册队列，计算 D1/D7/D30 滚动留存（注册N天后仍有活动）和购买转化。
+
+每个用户只保存三个日期（按uid下标存放在数组中）：
+- first_seen: 注册日
+- last_seen: 最后一次活动日（登录、观看、购买）
+- first_purchase: 首次购买日
+每次更新只按键集游标读取上次之后的新注册、登录、观看和购买，不重新扫描全部用户。
+更新操作都是取最大/最小值，中断后重复应用同一批数据不会出错。
+用法:
+    python3 cohort.py update            # 增量更新，建议每天执行
+    python3 cohort.py report --weeks 8  # 输出最近8个注册周的留存
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from array import array
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+from backfill import keyset_scan
+
+# 状态目录
+STATE_DIR = Path("/www/wwwroot/ana/state")
+
+# 留存天数
+RETENTION_DAYS = (1, 7, 30)
+
+# 数组中的空值
+MISSING = -1
+
+# 增量数据来源: 名称 -> (表, 字段, 时间列, 主键, 额外条件)
+SOURCES = OrderedDict([
+    ('register', ('wy_user', ['uid', 'add_time'], 'add_time', 'uid', '')),
+    ('login', ('wy_user', ['uid', 'last_time'], 'last_time', 'uid', '')),
+    ('watch', ('wy_special_watch', ['id', 'uid', 'add_time'], 'add_time', 'id', '')),
+    ('purchase', ('wy_special_buy', ['id', 'uid', 'add_time'], 'add_time', 'id', 'is_del = 0')),
+])
+
+logger = logging.getLogger(__name__)
+
+
+def day_number(ts):
+    """时间戳对应的本地日期序号"""
+    return date.fromtimestamp(ts).toordinal()
+
+
+class CohortStore:
+    """按uid存放首次/最后活动日和首次购买日的数组"""
+
+    FIELDS = ('first_seen', 'last_seen', 'first_purchase')
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory) if directory else STATE_DIR / 'cohort'
+        self.arrays = {name: array('i') for name in self.FIELDS}
+        # 每个来源上次读到的 (时间, 主键)
+        self.cursors = {}
+
+    def _ensure(self, uid):
+        size = len(self.arrays['first_seen'])
+        if uid >= size:
+            padding = array('i', [MISSING]) * (uid + 1 - size)
+            for values in self.arrays.values():
+                values.extend(padding)
+
+    def register(self, uid, day):
+        self._ensure(uid)
+        first = self.arrays['first_seen']
+        if first[uid] == MISSING or day < first[uid]:
+            first[uid] = day
+        self.touch(uid, day)
+
+    def touch(self, uid, day):
+        self._ensure(uid)
+        if day > self.arrays['last_seen'][uid]:
+            self.arrays['last_seen'][uid] = day
+
+    def purchase(self, uid, day):
+        self._ensure(uid)
+        bought = self.arrays['first_purchase']
+        if bought[uid] == MISSING or day < bought[uid]:
+            bought[uid] = day
+        self.touch(uid, day)
+
+    def apply(self, source, uid, ts):
+        if not uid or not ts:
+            return
+        day = day_number(ts)
+        if source == 'register':
+            self.register(uid, day)
+        elif source == 'purchase':
+            self.purchase(uid, day)
+        else:
+            self.touch(uid, day)
+
+    def load(self):
+        try:
+            with open(self.directory / 'cursors.json', encoding='utf-8') as f:
+                self.cursors = {k: tuple(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return self
+
+        for name, values in self.arrays.items():
+            path = self.directory / f"{name}.bin"
+            with open(path, 'rb') as f:
+                values.fromfile(f, os.path.getsize(path) // values.itemsize)
+        return self
+
+    def save(self):
+        """先写数组再写游标，游标文件是最后的提交点"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for name, values in self.arrays.items():
+            tmp_path = self.directory / f"{name}.tmp"
+            with open(tmp_path, 'wb') as f:
+                values.tofile(f)
+            os.replace(tmp_path, self.directory / f"{name}.bin")
+
+        tmp_path = self.directory / 'cursors.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cursors, f)
+        os.replace(tmp_path, self.directory / 'cursors.json')
+
+    def update(self, conn, now=None, page_size=5000):
+        """读取各来源上次游标之后的新数据，返回读取的行数"""
+        end_ts = int(now or time.time())
+        total = 0
+        for source, (table, columns, time_col, key_col, where) in SOURCES.items():
+            after = self.cursors.get(source)
+            start_ts = after[0] if after else 0
+            for page in keyset_scan(conn, table, columns, time_col, key_col, start_ts, end_ts,
+                                    where=where, page_size=page_size, after=after):
+                for row in page:
+                    self.apply(source, row['uid'], row[time_col])
+                self.cursors[source] = (page[-1][time_col], page[-1][key_col])
+                total += len(page)
+        return total
+
+    def cohorts(self, today=None, weeks=8):
+        """最近weeks个注册周的队列统计，按周升序返回"""
+        today = (today or date.today()).toordinal()
+        this_monday = today - (today - 1) % 7
+        first_week = this_monday - 7 * (weeks - 1)
+        first, last, bought = (self.arrays[name] for name in self.FIELDS)
+
+        stats = OrderedDict((week, {'size': 0, 'buyers': 0, 'eligible': {n: 0 for n in RETENTION_DAYS},
+                                    'retained': {n: 0 for n in RETENTION_DAYS}})
+                            for week in range(first_week, this_monday + 1, 7))
+        for uid in range(len(first)):
+            joined = first[uid]
+            if joined < first_week or joined > today:
+                continue
+            cohort = stats[joined - (joined - 1) % 7]
+            cohort['size'] += 1
+            if bought[uid] != MISSING:
+                cohort['buyers'] += 1
+            for n in RETENTION_DAYS:
+                if today - joined >= n:
+                    cohort['eligible'][n] += 1
+                    if last[uid] - joined >= n:
+                        cohort['retained'][n] += 1
+
+        return [dict(week=date.fromordinal(week), **cohort) for week, cohort in stats.items()]
+
+
+def format_cohorts(cohorts):
+    """生成留存表格，样本未满N天的显示为 -"""
+    lines = ["注册周      人数    " + "  ".join(f"D{n:<4}" for n in RETENTION_DAYS) + "  购买转化"]
+    for c in cohorts:
+        rates = []
+        for n in RETENTION_DAYS:
+            eligible = c['eligible'][n]
+            rates.append(f"{c['retained'][n] / eligible:>5.1%}" if eligible else "  -  ")
+        conversion = f"{c['buyers'] / c['size']:.1%}" if c['size'] else "-"
+        lines.append(f"{c['week'].strftime('%Y-%m-%d')}  {c['size']:>6}  " + "  ".join(rates) + f"  {conversion}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='注册周队列留存分析')
+    parser.add_argument('command', choices=['update', 'report'])
+    parser.add_argument('--weeks', type=int, default=8, help='report显示最近多少个注册周')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = CohortStore().load()
+
+    if args.command == 'update':
+        conn = db.connect_report()
+        try:
+            rows = store.update(conn)
+        finally:
+            conn.close()
+        store.save()
+        logger.info(f"留存数据已更新，读取{rows}行，用户数组长度{len(store.arrays['first_seen'])}")
+        return
+
+    print(format_cohorts(store.cohorts(weeks=args.weeks)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+课程观看统计
+按天、按课程汇总 wy_special_watch：观看次数、观看人数、观看分钟数、完课数、
+未完课的进度分布（中途放弃的位置）和单次观看时长分布。
+
+每天的汇总由MySQL一次GROUP BY完成，结果存入本地sqlite；每次更新重新汇总最近 REFRESH_DAYS 天和上次之后的日期：
+观看记录按开始观看的add_time归到某一天，之后继续观看还会更新viewing_time、percentage和is_complete，
+最近几天的汇总需要重算才能反映这些变化。按周/按月的查询只读取本地汇总表。
+用法:
+    python3 course_stats.py update               # 增量更新，建议每小时执行
+    python3 course_stats.py report --days 7      # 最近7天各课程统计
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+
+# 本地汇总库
+STATS_DB = Path("/www/wwwroot/ana/state/course_stats.db")
+
+# 首次更新时回溯的天数
+INITIAL_DAYS = 90
+
+# 每次更新重新汇总的最近天数（含当天），与日报的近7天排行一致
+REFRESH_DAYS = 7
+
+# 未完课进度分桶（百分比上限）和观看时长分桶（分钟上限）
+PROGRESS_BUCKETS = (25, 50, 75, 100)
+MINUTE_BUCKETS = (5, 15, 30, 60)
+
+PROGRESS_COLUMNS = [f"drop_{upper}" for upper in PROGRESS_BUCKETS]
+MINUTE_COLUMNS = [f"minutes_lt_{upper}" for upper in MINUTE_BUCKETS] + [f"minutes_ge_{MINUTE_BUCKETS[-1]}"]
+
+logger = logging.getLogger(__name__)
+
+
+def bucket_expressions():
+    """生成分桶的SUM表达式"""
+    expressions = []
+    lower = 0
+    for upper, column in zip(PROGRESS_BUCKETS, PROGRESS_COLUMNS):
+        expressions.append(f"SUM(is_complete <> 1 AND percentage >= {lower} AND percentage < {upper}) as {column}")
+        lower = upper
+    lower = 0
+    for upper, column in zip(MINUTE_BUCKETS, MINUTE_COLUMNS):
+        expressions.append(f"SUM(viewing_time >= {lower} AND viewing_time < {upper}) as {column}")
+        lower = upper
+    expressions.append(f"SUM(viewing_time >= {lower}) as {MINUTE_COLUMNS[-1]}")
+    return ",\n            ".join(expressions)
+
+
+class CourseStatsStore:
+    """本地sqlite中的课程日汇总"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else STATS_DB
+        self.conn = None
+
+    def open(self):
+        if self.conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path))
+            self.conn.row_factory = sqlite3.Row
+            self.conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS course_daily (
+                    day TEXT NOT NULL,
+                    special_id INTEGER NOT NULL,
+                    watches INTEGER NOT NULL,
+                    minutes REAL NOT NULL,
+                    completed INTEGER NOT NULL,
+                    {', '.join(f'{c} INTEGER NOT NULL' for c in PROGRESS_COLUMNS + MINUTE_COLUMNS)},
+                    PRIMARY KEY (day, special_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS course_viewers (
+                    day TEXT NOT NULL,
+                    special_id INTEGER NOT NULL,
+                    uid INTEGER NOT NULL,
+                    PRIMARY KEY (day, special_id, uid)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS courses (
+                    special_id INTEGER PRIMARY KEY,
+                    title TEXT
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def last_day(self):
+        """最后汇总过的日期，没有观看数据的日期也会记录"""
+        row = self.open().execute("SELECT value FROM meta WHERE key = 'last_day'").fetchone()
+        return datetime.strptime(row[0], '%Y-%m-%d').date() if row else None
+
+    def replace_day(self, day, rows, viewers, titles):
+        """用重新汇总的结果替换一天的数据"""
+        conn = self.open()
+        day_str = day.strftime('%Y-%m-%d')
+        columns = ['watches', 'minutes', 'completed'] + PROGRESS_COLUMNS + MINUTE_COLUMNS
+        with conn:
+            conn.execute("DELETE FROM course_daily WHERE day = ?", [day_str])
+            conn.execute("DELETE FROM course_viewers WHERE day = ?", [day_str])
+            conn.executemany(
+                f"INSERT INTO course_daily (day, special_id, {', '.join(columns)}) "
+                f"VALUES (?, ?, {', '.join(['?'] * len(columns))})",
+                [[day_str, row['special_id']] + [float(row[c] or 0) for c in columns] for row in rows])
+            conn.executemany("INSERT INTO course_viewers (day, special_id, uid) VALUES (?, ?, ?)",
+                             [[day_str, row['special_id'], row['uid']] for row in viewers])
+            conn.executemany("INSERT OR REPLACE INTO courses (special_id, title) VALUES (?, ?)",
+                             [[row['id'], row['title']] for row in titles])
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_day', ?)", [day_str])
+
+    def summary(self, start_day, end_day, limit=None):
+        """[start_day, end_day] 内各课程汇总，按观看分钟数降序"""
+        columns = ['watches', 'minutes', 'completed'] + PROGRESS_COLUMNS + MINUTE_COLUMNS
+        sums = ', '.join(f"SUM(d.{c}) as {c}" for c in columns)
+        sql = f"""
+            SELECT d.special_id, c.title, {sums},
+                (SELECT COUNT(DISTINCT v.uid) FROM course_viewers v
+                 WHERE v.special_id = d.special_id AND v.day BETWEEN ? AND ?) as viewers
+            FROM course_daily d
+            LEFT JOIN courses c ON c.special_id = d.special_id
+            WHERE d.day BETWEEN ? AND ?
+            GROUP BY d.special_id
+            ORDER BY minutes DESC
+        """
+        params = [start_day.strftime('%Y-%m-%d'), end_day.strftime('%Y-%m-%d')] * 2
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self.open().execute(sql, params)]
+
+
+def aggregate_day(conn, day):
+    """在MySQL中汇总一天的观看数据，返回(按课程汇总, 去重观看用户, 课程标题)"""
+    start = datetime.combine(day, datetime.min.time())
+    start_ts, end_ts = int(start.timestamp()), int((start + timedelta(days=1)).timestamp())
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+        SELECT
+            special_id,
+            COUNT(*) as watches,
+            SUM(viewing_time) as minutes,
+            SUM(is_complete = 1) as completed,
+            {bucket_expressions()}
+        FROM wy_special_watch
+        WHERE add_time >= %s AND add_time < %s
+        GROUP BY special_id
+        """, [start_ts, end_ts])
+        rows = cursor.fetchall()
+
+        cursor.execute("""
+        SELECT DISTINCT special_id, uid
+        FROM wy_special_watch
+        WHERE add_time >= %s AND add_time < %s
+        """, [start_ts, end_ts])
+        viewers = cursor.fetchall()
+
+        titles = []
+        if rows:
+            ids = [row['special_id'] for row in rows]
+            cursor.execute(f"SELECT id, title FROM wy_special WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+            titles = cursor.fetchall()
+
+    return rows, viewers, titles
+
+
+def update(store, conn, today=None):
+    """重新汇总最近REFRESH_DAYS天以及上次最后一天到今天的数据，返回汇总的天数"""
+    today = today or date.today()
+    last = store.last_day()
+    day = min(last, today - timedelta(days=REFRESH_DAYS - 1)) if last else today - timedelta(days=INITIAL_DAYS)
+
+    days = 0
+    while day <= today:
+        store.replace_day(day, *aggregate_day(conn, day))
+        day += timedelta(days=1)
+        days += 1
+    return days
+
+
+def recent_ranking(days=7, limit=3, path=None, end=None):
+    """截至end（报告窗口结束时间，不含）的最近几天观看最多的课程，本地没有汇总数据时返回空列表"""
+    store = CourseStatsStore(path)
+    if not store.path.exists():
+        return []
+    try:
+        last_day = (end - timedelta(microseconds=1)).date() if end else date.today()
+        return store.summary(last_day - timedelta(days=days - 1), last_day, limit)
+    except Exception as e:
+        logger.warning(f"读取课程统计失败: {e}")
+        return []
+    finally:
+        store.close()
+
+
+def format_summary(rows):
+    lines = []
+    for row in rows:
+        watches = row['watches'] or 0
+        completion = row['completed'] / watches if watches else 0
+        drops = " ".join(f"<{upper}%:{int(row[c])}" for upper, c in zip(PROGRESS_BUCKETS, PROGRESS_COLUMNS))
+        minutes = " ".join(f"{c.replace('minutes_', '')}:{int(row[c])}" for c in MINUTE_COLUMNS)
+        lines.append(f"📚 {row['title'] or '课程'}(#{row['special_id']}) {row['viewers']}人 {int(watches)}次 "
+                     f"{row['minutes']:.0f}分钟 完课率{completion:.0%}")
+        lines.append(f"  未完课进度 {drops}")
+        lines.append(f"  观看时长 {minutes}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='课程观看统计')
+    parser.add_argument('command', choices=['update', 'report'])
+    parser.add_argument('--days', type=int, default=7, help='report统计最近多少天')
+    parser.add_argument('--limit', type=int, default=20, help='report最多显示多少门课程')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = CourseStatsStore()
+    try:
+        if args.command == 'update':
+            conn = db.connect_report()
+            try:
+                days = update(store, conn)
+            finally:
+                conn.close()
+            logger.info(f"课程统计已更新{days}天")
+        else:
+            end = date.today()
+            print(format_summary(store.summary(end - timedelta(days=args.days - 1), end, args.limit)))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+数据库连接工具
+pymysql在第一次建立连接时才导入，连接参数来自 settings（config.py和ANA_DB_*环境变量）
+
+报告查询通过 connect_report() 连接只读从库：
+- config.py 中的 REPORT_REPLICAS 列出从库（只需写与主库不同的字段，如host），按复制延迟选择
+- 延迟超过 REPLICA_MAX_LAG 秒、复制中断或连不上的从库会被跳过，全部不可用时回退到主库
+- 选择结果在进程内复用 REPLICA_CHECK_INTERVAL 秒，期间的报告连接直接连选中的库，不再逐个检查从库
+- 报告连接设置语句执行上限（MAX_EXECUTION_TIME）和socket读超时，慢查询不会无限挂起
+"""
+
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+import settings
+from profiler import phase
+
+# 报告连接的默认超时
+CONNECT_TIMEOUT = 10
+
+logger = logging.getLogger(__name__)
+
+# 进程内复用的从库选择 {(主库, 从库列表): (过期时间, 选中的连接配置，None表示使用主库)}
+_replica_choices = {}
+_replica_lock = threading.Lock()
+
+
+def load_database_config(profile=settings.DEFAULT_PROFILE):
+    """读取数据库配置，profile为DATABASE_PROFILES中的名称"""
+    return settings.get_settings().database(profile)
+
+
+def load_report_settings():
+    """读取从库和超时配置，未配置时使用默认值"""
+    return settings.get_settings().report_settings()
+
+
+def connect(db_config=None, read_timeout=None, connect_timeout=CONNECT_TIMEOUT):
+    """建立数据库连接，失败时抛出异常"""
+    import pymysql
+    import pymysql.cursors
+
+    if db_config is None:
+        db_config = load_database_config()
+
+    with phase('connect'):
+        return pymysql.connect(
+            host=db_config['host'],
+            port=db_config['port'],
+            user=db_config['user'],
+            password=db_config['password'],
+            database=db_config['database'],
+            charset=db_config['charset'],
+            cursorclass=pymysql.cursors.DictCursor,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout
+        )
+
+
+def set_statement_timeout(conn, timeout_ms):
+    """设置会话内单条SELECT的执行上限，MySQL用毫秒，MariaDB用秒"""
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute("SET SESSION MAX_EXECUTION_TIME = %s", [int(timeout_ms)])
+        except Exception:
+            try:
+                cursor.execute("SET SESSION max_statement_time = %s", [timeout_ms / 1000.0])
+            except Exception as e:
+                logger.warning(f"无法设置查询超时: {e}")
+
+
+def replication_lag(conn):
+    """返回从库复制延迟（秒），复制中断或不是从库时返回None"""
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Exception:
+            cursor.execute("SHOW SLAVE STATUS")
+        status = cursor.fetchone()
+
+    if not status:
+        return None
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return None if lag is None else int(lag)
+
+
+def pick_replica(primary_config, report_settings):
+    """连接所有从库，返回复制延迟最小且不超过上限的 (连接, 连接配置)，没有可用从库时返回 (None, None)"""
+    best, best_config, best_lag = None, None, None
+    for overrides in report_settings['replicas']:
+        replica_config = dict(primary_config, **overrides)
+        name = replica_config.get('name') or f"{replica_config['host']}:{replica_config['port']}"
+        try:
+            conn = connect(replica_config, read_timeout=report_settings['read_timeout'])
+        except Exception as e:
+            logger.warning(f"从库 {name} 连接失败: {e}")
+            continue
+
+        try:
+            lag = replication_lag(conn)
+        except Exception as e:
+            logger.warning(f"从库 {name} 读取复制状态失败: {e}")
+            lag = None
+
+        if lag is None or lag > report_settings['max_lag']:
+            logger.warning(f"跳过从库 {name}，复制延迟: {lag}")
+            conn.close()
+        elif best_lag is None or lag < best_lag:
+            if best is not None:
+                best.close()
+            best, best_config, best_lag = conn, replica_config, lag
+        else:
+            conn.close()
+
+    return best, best_config
+
+
+def _replica_key(db_config, report_settings):
+    return repr((sorted(db_config.items()), report_settings['replicas']))
+
+
+def connect_report(db_config=None):
+    """建立报告查询连接：优先延迟最小的从库，否则回退到主库，失败时抛出异常
+
+    一个报告的每个分项各建一次连接，选择结果在check_interval秒内复用，
+    不会每次都连接全部从库检查复制延迟。
+    """
+    if db_config is None:
+        db_config = load_database_config()
+    report_settings = load_report_settings()
+
+    conn = None
+    if report_settings['replicas']:
+        key = _replica_key(db_config, report_settings)
+        with _replica_lock:
+            expires_at, chosen = _replica_choices.get(key, (0, None))
+        fresh = expires_at > time.monotonic()
+        if fresh and chosen is not None:
+            try:
+                conn = connect(chosen, read_timeout=report_settings['read_timeout'])
+            except Exception as e:
+                logger.warning(f"从库 {chosen['host']} 连接失败，重新选择: {e}")
+                fresh = False
+        if not fresh:
+            conn, chosen = pick_replica(db_config, report_settings)
+            if conn is None:
+                logger.warning("没有可用的从库，报告查询回退到主库")
+            with _replica_lock:
+                _replica_choices[key] = (time.monotonic() + report_settings.get('check_interval', 0), chosen)
+
+    if conn is None:
+        conn = connect(db_config, read_timeout=report_settings['read_timeout'])
+
+    set_statement_timeout(conn, report_settings['query_timeout_ms'])
+    return conn
+
+
+def get_db_connection(db_config=None):
+    """获取数据库连接，失败时记录日志并返回None"""
+    try:
+        return connect(db_config)
+    except Exception as e:
+        logger.error(f"数据库连接失败: {e}")
+        return None
+
+
+def get_report_connection(db_config=None):
+    """获取报告查询连接，失败时记录日志并返回None"""
+    try:
+        return connect_report(db_config)
+    except Exception as e:
+        logger.error(f"数据库连接失败: {e}")
+        return None
+
+
+class ConnectionPool:
+    """线程安全的连接池，最多同时借出size个连接，取出空闲连接时先ping检查
+
+    池中的连接开启autocommit：长期复用的连接如果停留在一个事务里，
+    InnoDB的REPEATABLE READ快照会一直保留，之后的查询只能读到旧数据。
+    """
+
+    def __init__(self, size=4, factory=None):
+        self.factory = factory or connect_report
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _create(self):
+        conn = self.factory()
+        conn.autocommit(True)
+        return conn
+
+    def _checkout(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._create()
+        try:
+            conn.ping(reconnect=False)
+            return conn
+        except Exception:
+            _close_quietly(conn)
+            return self._create()
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，使用中出错的连接不会放回池中"""
+        self._slots.acquire()
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except Exception:
+            if conn is not None:
+                _close_quietly(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                _close_quietly(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+企业微信webhook消息发送
+支持把一份报告同时投递到多个目标（多个企业微信机器人、文件、邮件、本地HTTP服务），
+每个目标有独立的连接池、重试和限速，一个目标变慢不会拖慢其他目标。
+投递目标来自 settings（config.py的WEBHOOK_TARGETS/WEBHOOK_PROFILES/WEBHOOK_URL或环境变量ANA_WEBHOOK_URL），
+配置重新加载后路由器随之重建。requests在第一次发送时才导入，导入本模块没有任何副作用
+"""
+
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import settings
+import tracing
+from payload import build_messages, text_message
+
+# 企业微信限制每个机器人每分钟最多20条消息
+WECOM_RATE_PER_MINUTE = 20
+
+# 企业微信频率超限的错误码
+WECOM_RATE_LIMITED = 45009
+
+# 一份报告拆成多条消息时，相邻两条的发送间隔（秒）
+PART_INTERVAL = 1.0
+
+# 默认重试次数和退避时间（秒）
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0
+
+logger = logging.getLogger(__name__)
+
+# 各profile的 (配置版本, 路由器)
+_routers = {}
+_router_lock = threading.Lock()
+
+
+class RateLimiter:
+    """令牌桶限速器，按每分钟条数限速"""
+
+    def __init__(self, per_minute):
+        self.capacity = max(per_minute, 1)
+        self.interval = 60.0 / self.capacity
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，没有令牌时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.interval
+            time.sleep(wait)
+
+
+class DeliveryTarget:
+    """投递目标基类，子类实现_send"""
+
+    def __init__(self, name, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, rate_per_minute=None):
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(rate_per_minute) if rate_per_minute else None
+
+    def _send(self, message):
+        """发送一次，返回(是否成功, 是否值得重试)"""
+        raise NotImplementedError
+
+    def deliver(self, message):
+        """带限速和重试地投递消息，成功返回True"""
+        for attempt in range(self.retries + 1):
+            with tracing.span('send.attempt', target=self.name, attempt=attempt + 1) as current:
+                if self.rate_limiter:
+                    waited = time.perf_counter()
+                    self.rate_limiter.acquire()
+                    current.set('rate_wait_ms', round((time.perf_counter() - waited) * 1000, 1))
+
+                try:
+                    success, retryable = self._send(message)
+                except Exception as e:
+                    logger.error(f"[{self.name}] 发送失败: {e}")
+                    success, retryable = False, False
+                if not success:
+                    tracing.mark_failed()
+
+            if success:
+                return True
+            if not retryable or attempt == self.retries:
+                break
+
+            delay = self.backoff * (2 ** attempt)
+            logger.warning(f"[{self.name}] 第{attempt + 1}次发送失败，{delay:.1f}秒后重试")
+            time.sleep(delay)
+
+        return False
+
+
+class WeComTarget(DeliveryTarget):
+    """企业微信群机器人"""
+
+    # 是否按企业微信长度上限拆分报告
+    split_messages = True
+
+    def __init__(self, name, url, timeout=30, rate_per_minute=WECOM_RATE_PER_MINUTE, **kwargs):
+        super().__init__(name, rate_per_minute=rate_per_minute, **kwargs)
+        self.url = url
+        self.timeout = timeout
+        self._session = None
+
+    @property
+    def session(self):
+        """每个目标独立的连接池，多次发送复用同一个连接"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            self._session = session
+        return self._session
+
+    def deliver(self, message):
+        """超过企业微信长度上限的报告拆成多条（或文件）按间隔逐条发送，任一条失败即返回False"""
+        if not isinstance(message, str) or not self.split_messages:
+            return super().deliver(message)
+
+        messages = build_messages(message)
+        for index, part in enumerate(messages):
+            if index:
+                time.sleep(PART_INTERVAL)
+            if not super().deliver(part):
+                if len(messages) > 1:
+                    logger.error(f"[{self.name}] 第{index + 1}/{len(messages)}条发送失败，停止发送剩余部分")
+                return False
+        return True
+
+    @property
+    def upload_url(self):
+        return self.url.replace('/webhook/send', '/webhook/upload_media', 1) + '&type=file'
+
+    def upload(self, data, filename):
+        """上传文件，返回(media_id, 是否值得重试)"""
+        import requests
+
+        try:
+            response = self.session.post(self.upload_url, files={'media': (filename, data)}, timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.error(f"[{self.name}] 上传文件失败: {e}")
+            return None, True
+
+        if response.status_code != 200:
+            logger.error(f"[{self.name}] 上传文件HTTP请求失败: {response.status_code}")
+            return None, response.status_code >= 500 or response.status_code == 429
+        result = response.json()
+        if result.get('errcode') != 0:
+            logger.error(f"[{self.name}] 上传文件失败: {result}")
+            return None, result.get('errcode') == WECOM_RATE_LIMITED
+        return result.get('media_id'), False
+
+    def _send(self, message):
+        import requests
+
+        data = text_message(message) if isinstance(message, str) else message
+        if data.get('msgtype') == 'file' and 'data' in data:
+            media_id, retryable = self.upload(data['data'], data['filename'])
+            if not media_id:
+                return False, retryable
+            data = {"msgtype": "file", "file": {"media_id": media_id}}
+
+        tracing.set_attribute('msgtype', data.get('msgtype'))
+        tracing.set_attribute('bytes', len(json.dumps(data, ensure_ascii=False).encode('utf-8')))
+        try:
+            response = self.session.post(self.url, json=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.error(f"[{self.name}] 发送webhook失败: {e}")
+            tracing.set_attribute('error', type(e).__name__)
+            return False, True
+
+        tracing.set_attribute('status_code', response.status_code)
+        if response.status_code == 200:
+            result = response.json()
+            tracing.set_attribute('errcode', result.get('errcode'))
+            if result.get('errcode') == 0:
+                logger.info(f"[{self.name}] Webhook发送成功")
+                return True, False
+            logger.error(f"[{self.name}] Webhook发送失败: {result}")
+            return False, result.get('errcode') == WECOM_RATE_LIMITED
+
+        logger.error(f"[{self.name}] HTTP请求失败: {response.status_code}")
+        return False, response.status_code >= 500 or response.status_code == 429
+
+
+class HttpTarget(WeComTarget):
+    """通用HTTP接收端（如本地联调服务），按企业微信格式发送，2xx即视为成功"""
+
+    split_messages = False
+
+    def __init__(self, name, url, timeout=10, rate_per_minute=None, **kwargs):
+        super().__init__(name, url, timeout=timeout, rate_per_minute=rate_per_minute, **kwargs)
+
+    def _send(self, message):
+        import requests
+
+        tracing.set_attribute('bytes', len(message.encode('utf-8')))
+        try:
+            response = self.session.post(self.url, json={"msgtype": "text", "text": {"content": message}},
+                                         timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.error(f"[{self.name}] HTTP发送失败: {e}")
+            tracing.set_attribute('error', type(e).__name__)
+            return False, True
+
+        tracing.set_attribute('status_code', response.status_code)
+        if 200 <= response.status_code < 300:
+            logger.info(f"[{self.name}] HTTP发送成功")
+            return True, False
+        logger.error(f"[{self.name}] HTTP请求失败: {response.status_code}")
+        return False, response.status_code >= 500 or response.status_code == 429
+
+
+class FileTarget(DeliveryTarget):
+    """追加写入本地文件"""
+
+    def __init__(self, name, path, retries=0, **kwargs):
+        super().__init__(name, retries=retries, **kwargs)
+        self.path = path
+
+    def _send(self, message):
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"[{timestamp}]\n{message}\n\n")
+        logger.info(f"[{self.name}] 已写入文件: {self.path}")
+        return True, False
+
+
+class EmailTarget(DeliveryTarget):
+    """通过SMTP发送邮件"""
+
+    def __init__(self, name, host, recipients, sender, port=465, user=None, password=None,
+                 subject='6页网活动报告', use_ssl=True, timeout=30, **kwargs):
+        super().__init__(name, **kwargs)
+        self.host = host
+        self.port = port
+        self.recipients = recipients
+        self.sender = sender
+        self.user = user
+        self.password = password
+        self.subject = subject
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+
+    def _send(self, message):
+        import smtplib
+        from email.mime.text import MIMEText
+
+        mail = MIMEText(message, 'plain', 'utf-8')
+        mail['Subject'] = self.subject
+        mail['From'] = self.sender
+        mail['To'] = ', '.join(self.recipients)
+
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        try:
+            with smtp_class(self.host, self.port, timeout=self.timeout) as smtp:
+                if self.user:
+                    smtp.login(self.user, self.password)
+                smtp.sendmail(self.sender, self.recipients, mail.as_string())
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError) as e:
+            logger.error(f"[{self.name}] 邮件发送失败: {e}")
+            return False, True
+
+        logger.info(f"[{self.name}] 邮件发送成功")
+        return True, False
+
+
+TARGET_TYPES = {
+    'wecom': WeComTarget,
+    'http': HttpTarget,
+    'file': FileTarget,
+    'email': EmailTarget,
+}
+
+
+def build_target(target_config):
+    """根据配置字典创建投递目标，如 {'type': 'wecom', 'name': '运营群', 'url': ...}"""
+    options = dict(target_config)
+    target_type = options.pop('type', 'wecom')
+    if target_type not in TARGET_TYPES:
+        raise ValueError(f"未知的投递目标类型: {target_type}")
+    options['name'] = options.get('name') or target_type
+    return TARGET_TYPES[target_type](**options)
+
+
+def load_target_configs(profile=settings.DEFAULT_PROFILE):
+    """读取投递目标配置，profile为WEBHOOK_PROFILES中的名称"""
+    return settings.get_settings().webhook_targets(profile)
+
+
+class WebhookRouter:
+    """把同一条消息并发投递到所有目标"""
+
+    def __init__(self, targets):
+        self.targets = list(targets)
+        names = [target.name for target in self.targets]
+        duplicated = sorted({name for name in names if names.count(name) > 1})
+        if duplicated:
+            # 结果按目标名汇总，重名时其中一个目标的失败会被覆盖
+            raise ValueError(f"投递目标名重复: {', '.join(duplicated)}")
+
+    def deliver(self, message):
+        """并发投递，返回 {目标名: 是否成功}"""
+        if not self.targets:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=len(self.targets), thread_name_prefix='delivery') as pool:
+            # 投递线程中的span挂在调用方的send下
+            futures = [(target, pool.submit(tracing.wrap(target.deliver), message)) for target in self.targets]
+            return {target.name: future.result() for target, future in futures}
+
+
+def get_router(profile=settings.DEFAULT_PROFILE):
+    """获取按配置创建的路由器，同一进程内复用各目标的连接池，配置重新加载后重建"""
+    version = settings.get_settings().version
+    with _router_lock:
+        cached = _routers.get(profile)
+        if cached is None or cached[0] != version:
+            cached = (version, WebhookRouter(build_target(c) for c in load_target_configs(profile)))
+            _routers[profile] = cached
+        return cached[1]
+
+
+def broadcast(message, profile=settings.DEFAULT_PROFILE):
+    """把消息发送到profile的所有目标，全部成功时返回True"""
+    results = get_router(profile).deliver(message)
+    failed = [name for name, success in results.items() if not success]
+    if failed:
+        logger.error(f"以下目标发送失败: {', '.join(failed)}")
+    return bool(results) and not failed
+
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地活动事件库
+注册、购买、支付、登录、观看事件以定长二进制记录按天分段保存：
+- <YYYYMMDD>.log  当天的追加段，按到达顺序写入
+- <YYYYMMDD>.seg  封存段，按时间排序；过去日期的追加段由后台线程合并进封存段
+窗口查询用mmap打开段文件：封存段二分查找起止位置后直接在映射内存上解包，
+追加段顺序扫描，不需要查询MySQL，也不受实时计数器分桶精度和保留期的限制。
+读取一天的数据时先打开该天的所有段再核对文件没有被封存替换，其他进程正在封存时重新打开，不会漏读或重复读。
+
+记录里只有uid、课程id和金额，用于计数和汇总（异常检测 anomaly.py --source store、stats）；
+日报和6小时报告的明细需要手机号、微信昵称、课程名称，仍然查询MySQL。
+
+记录格式（小端，28字节）: ts uint32, kind uint8, uid uint32, special_id uint32, 金额(分) int64, 分钟 float32
+用法:
+    python3 event_store.py import --days 7     # 从MySQL导入最近7天（登录只能从binlog采集）
+    python3 event_store.py stats --hours 6     # 最近6小时汇总
+    python3 event_store.py compact             # 立即封存过去日期的追加段
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from activity_cdc import STATE_DIR, EVENT_KINDS, ActivityEvent, make_event
+
+RECORD = struct.Struct('<IB3xIIqf')
+TS_FIELD = struct.Struct('<I')
+
+KIND_CODES = {kind: code for code, kind in enumerate(EVENT_KINDS)}
+
+# 后台封存的间隔（秒）
+COMPACT_INTERVAL = 600
+
+# 写入缓冲区大小
+BUFFER_SIZE = 1 << 16
+
+# 一天的段：(后缀, 是否按时间排序)，读取顺序与封存的先后一致
+DAY_SEGMENTS = (('seg', True), ('compacting', False), ('log', False))
+
+# 读取一天的段时遇到封存替换文件的最多重试次数
+OPEN_RETRIES = 5
+
+# 从MySQL导入时能还原的事件类型，登录只能从binlog采集
+IMPORTED_KINDS = ('register', 'purchase', 'order_paid', 'watch')
+
+logger = logging.getLogger(__name__)
+
+
+def day_of(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y%m%d')
+
+
+def pack_event(event):
+    return RECORD.pack(event.ts, KIND_CODES[event.kind], event.uid, event.special_id,
+                       int(round(event.amount * 100)), event.minutes)
+
+
+def file_identity(path):
+    """文件的(设备, inode)，不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def unpack_record(record):
+    ts, code, uid, special_id, cents, minutes = record
+    return ActivityEvent(EVENT_KINDS[code], uid, ts, special_id, cents / 100.0, minutes, None)
+
+
+class Segment:
+    """只读映射一个段文件，文件为空或不存在时没有记录"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.identity = None
+        self._file = None
+        self._map = None
+        try:
+            self._file = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        stat = os.fstat(self._file.fileno())
+        self.identity = (stat.st_dev, stat.st_ino)
+        size = stat.st_size
+        # 追加段末尾可能有写了一半的记录
+        self.count = size // RECORD.size
+        if self.count:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def ts_at(self, index):
+        return TS_FIELD.unpack_from(self._map, index * RECORD.size)[0]
+
+    def lower_bound(self, ts):
+        """第一个时间 >= ts 的记录位置（仅用于已排序的封存段）"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.ts_at(middle) < ts:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def records(self, start=0, stop=None):
+        """解包[start, stop)范围内的记录，直接读取映射内存"""
+        stop = self.count if stop is None else stop
+        if not self._map or start >= stop:
+            return
+        with memoryview(self._map) as view:
+            yield from RECORD.iter_unpack(view[start * RECORD.size:stop * RECORD.size])
+
+    def raw_records(self):
+        """逐条返回记录的原始字节"""
+        for index in range(self.count):
+            yield self._map[index * RECORD.size:(index + 1) * RECORD.size]
+
+    def window(self, start_ts, end_ts, sorted_segment):
+        if sorted_segment:
+            for record in self.records(self.lower_bound(start_ts), self.lower_bound(end_ts)):
+                yield record
+        else:
+            for record in self.records():
+                if start_ts <= record[0] < end_ts:
+                    yield record
+
+    def close(self):
+        if self._map:
+            self._map.close()
+            self._map = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class EventStore:
+    """按天分段的事件库，可以作为 activity_cdc.BinlogActivityFeed 的sink"""
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory) if directory else STATE_DIR / 'event_store'
+        self._files = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._compactor = None
+
+    def path(self, day, suffix):
+        return self.directory / f"{day}.{suffix}"
+
+    def add(self, event):
+        day = day_of(event.ts)
+        with self._lock:
+            handle = self._files.get(day)
+            if handle is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                handle = open(self.path(day, 'log'), 'ab', buffering=BUFFER_SIZE)
+                self._files[day] = handle
+            handle.write(pack_event(event))
+
+    def save(self):
+        with self._lock:
+            for handle in self._files.values():
+                handle.flush()
+
+    def close(self):
+        self._stopping.set()
+        if self._compactor:
+            self._compactor.join()
+        with self._lock:
+            for handle in self._files.values():
+                handle.close()
+            self._files.clear()
+
+    def days(self, start_ts, end_ts):
+        day = datetime.fromtimestamp(start_ts).replace(hour=0, minute=0, second=0, microsecond=0)
+        while day.timestamp() < end_ts:
+            yield day.strftime('%Y%m%d')
+            day += timedelta(days=1)
+
+    def open_day(self, day):
+        """打开一天的所有段，返回[(段, 是否排序)]
+
+        封存依次执行 log→compacting、写入新seg、删除compacting，打开过程中发生其中任何一步，
+        某个路径对应的文件就会与已打开的不同，此时重新打开，保证读到的是同一时刻的一组段。
+        """
+        paths = [self.path(day, suffix) for suffix, _ in DAY_SEGMENTS]
+        for _ in range(OPEN_RETRIES):
+            segments = [(Segment(path), is_sorted) for path, (_, is_sorted) in zip(paths, DAY_SEGMENTS)]
+            if [segment.identity for segment, _ in segments] == [file_identity(path) for path in paths]:
+                return segments
+            for segment, _ in segments:
+                segment.close()
+        raise RuntimeError(f"事件库 {day} 正在封存，多次重试后仍无法读取")
+
+    def scan_records(self, start_ts, end_ts):
+        """返回[start_ts, end_ts)内的原始记录元组"""
+        for day in self.days(start_ts, end_ts):
+            segments = self.open_day(day)
+            try:
+                for segment, is_sorted in segments:
+                    yield from segment.window(start_ts, end_ts, is_sorted)
+            finally:
+                for segment, _ in segments:
+                    segment.close()
+
+    def covers(self, start, end, now=None, kind=None):
+        """[start, end)涉及的每一天都有段文件（已导入或采集过），没有段的日期读出来全是0
+
+        指定kind时还要求该类事件在窗口内有记录来源：从MySQL导入的时间范围内没有登录事件。
+        """
+        start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+        if not all(any(self.path(day, suffix).exists() for suffix, _ in DAY_SEGMENTS)
+                   for day in self.days(start_ts, end_ts)):
+            return False
+        if kind is not None and kind not in IMPORTED_KINDS:
+            return not any(s < end_ts and start_ts < e for s, e in self.imported_ranges())
+        return True
+
+    def imported_ranges(self):
+        """从MySQL导入过的 [(开始, 结束)] 时间戳范围"""
+        try:
+            with open(self.directory / 'imported.json', encoding='utf-8') as f:
+                return [tuple(r) for r in json.load(f)]
+        except FileNotFoundError:
+            return []
+
+    def mark_imported(self, start_ts, end_ts):
+        path = self.directory / 'imported.json'
+        ranges = self.imported_ranges() + [(start_ts, end_ts)]
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(sorted(ranges), f)
+        os.replace(tmp_path, path)
+
+    def scan(self, start, end, kinds=None):
+        """返回窗口内的事件"""
+        codes = {KIND_CODES[k] for k in kinds} if kinds else None
+        for record in self.scan_records(int(start.timestamp()), int(end.timestamp())):
+            if codes is None or record[1] in codes:
+                yield unpack_record(record)
+
+    def summary(self, start, end):
+        """各类事件在[start, end)内的(次数, 金额, 分钟)，与ActivityCounters.summary格式相同"""
+        totals = [[0, 0, 0.0] for _ in EVENT_KINDS]
+        for _, code, _, _, cents, minutes in self.scan_records(int(start.timestamp()), int(end.timestamp())):
+            stats = totals[code]
+            stats[0] += 1
+            stats[1] += cents
+            stats[2] += minutes
+        return {kind: (stats[0], stats[1] / 100.0, stats[2]) for kind, stats in zip(EVENT_KINDS, totals)}
+
+    def window(self, kind, start, end):
+        return self.summary(start, end)[kind]
+
+    def distinct_uids(self, kind, start, end):
+        code = KIND_CODES[kind]
+        return {record[2] for record in self.scan_records(int(start.timestamp()), int(end.timestamp()))
+                if record[1] == code}
+
+    def compact_day(self, day):
+        """把一天的追加段合并进封存段，按时间排序"""
+        log_path = self.path(day, 'log')
+        compacting = self.path(day, 'compacting')
+        with self._lock:
+            handle = self._files.pop(day, None)
+            if handle:
+                handle.close()
+            if log_path.exists() and not compacting.exists():
+                os.replace(log_path, compacting)
+        if not compacting.exists():
+            return 0
+
+        records = []
+        for suffix in ('seg', 'compacting'):
+            segment = Segment(self.path(day, suffix))
+            try:
+                records.extend(segment.raw_records())
+            finally:
+                segment.close()
+        records.sort(key=lambda data: TS_FIELD.unpack_from(data)[0])
+
+        sealed = self.path(day, 'seg')
+        tmp_path = sealed.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, sealed)
+        compacting.unlink()
+        return len(records)
+
+    def compact(self, today=None):
+        """封存今天之前所有还有追加段的日期，返回处理的天数"""
+        today = today or datetime.now().strftime('%Y%m%d')
+        if not self.directory.exists():
+            return 0
+        days = sorted({p.stem for p in self.directory.iterdir() if p.suffix in ('.log', '.compacting')})
+        compacted = 0
+        for day in days:
+            if day < today:
+                count = self.compact_day(day)
+                logger.info(f"事件库 {day} 已封存，共{count}条")
+                compacted += 1
+        return compacted
+
+    def start_compactor(self, interval=COMPACT_INTERVAL):
+        """启动后台封存线程，close()时停止"""
+        def loop():
+            while not self._stopping.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"事件库封存失败: {e}")
+
+        self._compactor = threading.Thread(target=loop, name='event-store-compactor', daemon=True)
+        self._compactor.start()
+        return self._compactor
+
+
+def import_history(store, conn, start, end):
+    """从MySQL导入窗口内的注册、购买、支付和观看事件，返回导入条数，只能导入事件库中还没有的日期"""
+    from backfill import keyset_scan
+
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    existing = [day for day in store.days(start_ts, end_ts)
+                if any(store.path(day, suffix).exists() for suffix, _ in DAY_SEGMENTS)]
+    if existing:
+        raise RuntimeError(f"事件库中已有 {existing[0]} 等{len(existing)}天的数据，重复导入会产生重复事件")
+
+    sources = [
+        ('wy_user', ['uid', 'add_time'], 'uid', '',
+         lambda r: make_event('register', r['uid'], r['add_time'])),
+        ('wy_special_buy', ['id', 'uid', 'special_id', 'add_time'], 'id', 'is_del = 0',
+         lambda r: make_event('purchase', r['uid'], r['add_time'], special_id=r['special_id'])),
+        ('wy_store_order', ['id', 'uid', 'pay_price', 'add_time'], 'id', 'paid = 1',
+         lambda r: make_event('order_paid', r['uid'], r['add_time'], amount=r['pay_price'])),
+        ('wy_special_watch', ['id', 'uid', 'special_id', 'viewing_time', 'add_time'], 'id', '',
+         lambda r: make_event('watch', r['uid'], r['add_time'], special_id=r['special_id'],
+                              minutes=r['viewing_time'])),
+    ]
+    total = 0
+    for table, columns, key_col, where, to_event in sources:
+        for page in keyset_scan(conn, table, columns, 'add_time', key_col, start_ts, end_ts, where=where):
+            for row in page:
+                store.add(to_event(row))
+            total += len(page)
+        logger.info(f"已导入 {table}")
+    store.save()
+    store.mark_imported(start_ts, end_ts)
+    return total
+
+
+def print_stats(store, hours):
+    end = datetime.now()
+    start = end - timedelta(hours=hours)
+    summary = store.summary(start, end)
+    print(f"=== 事件库 {start.strftime('%m-%d %H:%M')} 至 {end.strftime('%m-%d %H:%M')} ===")
+    print(f"新注册: {summary['register'][0]} 人")
+    print(f"登录: {summary['login'][0]} 次 {len(store.distinct_uids('login', start, end))} 人")
+    print(f"购买: {summary['purchase'][0]} 笔")
+    print(f"支付订单: {summary['order_paid'][0]} 笔 ¥{summary['order_paid'][1]:.2f}")
+    print(f"课程观看: {summary['watch'][0]} 次 {summary['watch'][2] + summary['watch_time'][2]:.0f} 分钟")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地活动事件库')
+    parser.add_argument('command', choices=['import', 'stats', 'compact'])
+    parser.add_argument('--days', type=int, default=7, help='import导入最近多少天')
+    parser.add_argument('--hours', type=int, default=24, help='stats汇总最近多少小时')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = EventStore()
+    try:
+        if args.command == 'import':
+            import db
+            end = datetime.now()
+            conn = db.connect_report()
+            try:
+                total = import_history(store, conn, end - timedelta(days=args.days), end)
+            finally:
+                conn.close()
+            store.compact()
+            print(f"已导入 {total} 条事件")
+        elif args.command == 'compact':
+            print(f"已封存 {store.compact()} 天")
+        else:
+            print_stats(store, args.hours)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+查询结果导出
+把按批读取的行直接写成 JSON / JSON Lines / CSV / Parquet，内存占用只与一批的大小有关。
+Decimal在JSON中写成数字、在CSV中保留原始精度，datetime写成 "YYYY-MM-DD HH:MM:SS"。
+Parquet需要安装pyarrow（pip3 install pyarrow），列类型按游标的description确定，不依赖第一批数据的推断。
+"""
+
+import io
+import sys
+import csv
+import json
+import gzip
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+# 导出格式
+FORMATS = ('json', 'jsonl', 'csv', 'parquet')
+
+# 输出缓冲区大小
+BUFFER_SIZE = 1 << 16
+
+
+def to_jsonable(value):
+    """把数据库返回的值转换成JSON可写的类型"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def csv_value(value):
+    """CSV单元格的文本，None写成空串，Decimal保留原始精度"""
+    if value is None:
+        return ''
+    if isinstance(value, Decimal):
+        return str(value)
+    return to_jsonable(value)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=to_jsonable)
+
+
+def open_output(path=None, compress=False):
+    """打开带缓冲的二进制输出，path为空时写到标准输出；compress或.gz结尾时gzip压缩"""
+    if path and path != '-':
+        raw = open(path, 'wb', buffering=BUFFER_SIZE)
+        compress = compress or str(path).endswith('.gz')
+    else:
+        raw = sys.stdout.buffer
+    if compress:
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6), raw
+    return raw, raw
+
+
+def close_output(out, raw):
+    if out is not raw:
+        out.close()
+    if raw is sys.stdout.buffer:
+        raw.flush()
+    else:
+        raw.close()
+
+
+def _text(out):
+    return io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=False)
+
+
+def _detach(text):
+    text.flush()
+    text.detach()
+
+
+def write_json(out, meta, sections):
+    """写成一个JSON对象: {meta..., "sections": {名称: [行, ...]}}，各分项按批写出"""
+    text = _text(out)
+    head = _dumps(dict(meta))
+    text.write(head[:-1] + (', ' if meta else '') + '"sections": {')
+    for index, (name, batches) in enumerate(sections):
+        text.write(('' if index == 0 else ', ') + _dumps(name) + ': [')
+        first = True
+        for batch in batches:
+            for row in batch:
+                text.write(('' if first else ', ') + _dumps(row))
+                first = False
+        text.write(']')
+    text.write('}}\n')
+    _detach(text)
+
+
+def write_jsonl(out, sections):
+    """每行一个JSON对象，section字段为分项名称"""
+    text = _text(out)
+    for name, batches in sections:
+        for batch in batches:
+            text.write(''.join(_dumps(dict(row, section=name)) + '\n' for row in batch))
+    _detach(text)
+
+
+def write_csv(out, batches, description=None):
+    """写成CSV，表头取自游标的字段描述，没有description时取自第一行的字段
+
+    description与write_parquet相同，没有数据行时也按它写出表头。
+    """
+    text = _text(out)
+    writer = None
+    for batch in batches:
+        for row in batch:
+            if writer is None:
+                fieldnames = [column[0] for column in description] if description else list(row.keys())
+                writer = csv.DictWriter(text, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow({k: csv_value(v) for k, v in row.items()})
+    if writer is None and description:
+        csv.writer(text).writerow([column[0] for column in description])
+    _detach(text)
+
+
+def parquet_schema(description):
+    """按pymysql游标的description生成Parquet结构
+
+    第一批中全为NULL的列会被推断成null类型，不同批次的Decimal精度也可能不同，
+    后面的批次按推断的结构转换时会失败，所以列类型取自数据库返回的字段类型。
+    Decimal统一用最大精度38位、保留字段的小数位数。
+    """
+    import pyarrow as pa
+    from pymysql.constants import FIELD_TYPE
+
+    types = {
+        FIELD_TYPE.TINY: pa.int64(), FIELD_TYPE.SHORT: pa.int64(), FIELD_TYPE.LONG: pa.int64(),
+        FIELD_TYPE.INT24: pa.int64(), FIELD_TYPE.LONGLONG: pa.int64(), FIELD_TYPE.YEAR: pa.int64(),
+        FIELD_TYPE.FLOAT: pa.float64(), FIELD_TYPE.DOUBLE: pa.float64(),
+        FIELD_TYPE.DATETIME: pa.timestamp('us'), FIELD_TYPE.TIMESTAMP: pa.timestamp('us'),
+        FIELD_TYPE.DATE: pa.date32(), FIELD_TYPE.NEWDATE: pa.date32(), FIELD_TYPE.TIME: pa.duration('us'),
+    }
+    fields = []
+    for name, type_code, _, _, _, scale, _ in description:
+        if type_code in (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+            fields.append(pa.field(name, pa.decimal128(38, scale or 0)))
+        else:
+            fields.append(pa.field(name, types.get(type_code, pa.string())))
+    return pa.schema(fields)
+
+
+def write_parquet(out, batches, description=None):
+    """写成Parquet，每批一个row group
+
+    description为游标的字段描述（列表），可以在第一批读出之前为空、由产生批次的生成器填入；
+    没有description时结构取自第一批。没有数据行时按description写出只有结构的文件。
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("parquet格式需要安装pyarrow: pip3 install pyarrow")
+
+    writer = None
+    try:
+        for batch in batches:
+            if not batch:
+                continue
+            rows = [{k: (v.decode('utf-8', errors='replace') if isinstance(v, (bytes, bytearray)) else v)
+                     for k, v in row.items()} for row in batch]
+            if writer is None:
+                table = pa.Table.from_pylist(rows, schema=parquet_schema(description) if description else None)
+                writer = pq.ParquetWriter(out, table.schema)
+            else:
+                table = pa.Table.from_pylist(rows, schema=writer.schema)
+            writer.write_table(table)
+        if writer is None and description:
+            writer = pq.ParquetWriter(out, parquet_schema(description))
+    finally:
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地企业微信webhook模拟服务
+按企业微信群机器人接口返回结果（text/markdown长度检查、文件上传），
+可以注入延迟、5xx错误、超时（不响应）和45009频率限制，
+用于压测和联调投递链路，不会真的发消息到群里。
+用法:
+    python3 fake_wecom.py --port 8808 --latency-ms 50 --error-rate 0.05 --rate-limit 20
+    然后把投递目标的url设置为 http://127.0.0.1:8808/cgi-bin/webhook/send?key=test
+"""
+
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from collections import deque, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# 企业微信各类消息内容上限（字节）
+CONTENT_MAX_BYTES = {'text': 2048, 'markdown': 4096}
+
+# 企业微信错误码
+ERRCODE_OK = 0
+ERRCODE_RATE_LIMITED = 45009
+ERRCODE_CONTENT_TOO_LONG = 40058
+ERRCODE_INVALID_KEY = 93000
+
+logger = logging.getLogger(__name__)
+
+
+class FaultConfig:
+    """故障注入配置"""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, timeout_rate=0.0, hang_seconds=35,
+                 rate_limit=0, rate_window=60, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        # 每个key在rate_window秒内允许的消息数，0为不限制（企业微信为每分钟20条）
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.random = random.Random(seed)
+
+
+class FakeWeComServer:
+    """在后台线程中运行的模拟服务，记录收到的消息和各类响应次数"""
+
+    def __init__(self, host='127.0.0.1', port=0, faults=None):
+        self.faults = faults or FaultConfig()
+        self.stats = Counter()
+        self.messages = []
+        # media_id -> 上传的原始请求体
+        self.uploads = {}
+        self._sent = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/cgi-bin/webhook/send?key=test"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-wecom', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _rate_limited(self, key):
+        """滑动窗口限流，窗口内超过条数时返回True"""
+        limit = self.faults.rate_limit
+        if not limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            sent = self._sent.setdefault(key, deque())
+            while sent and now - sent[0] >= self.faults.rate_window:
+                sent.popleft()
+            if len(sent) >= limit:
+                return True
+            sent.append(now)
+            return False
+
+    def respond(self, key, body):
+        """按故障配置决定响应，返回(HTTP状态码, 响应内容)，hang时返回None"""
+        faults = self.faults
+        with self._lock:
+            roll = faults.random.random()
+            delay = faults.latency_ms + faults.random.uniform(0, faults.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000.0)
+
+        if roll < faults.timeout_rate:
+            self.count('timeout')
+            self._stopping.wait(faults.hang_seconds)
+            return None
+        if roll < faults.timeout_rate + faults.error_rate:
+            self.count('server_error')
+            return 502, {'error': 'bad gateway'}
+        if not key:
+            self.count('invalid_key')
+            return 200, {'errcode': ERRCODE_INVALID_KEY, 'errmsg': 'invalid webhook url'}
+        if self._rate_limited(key):
+            self.count('rate_limited')
+            return 200, {'errcode': ERRCODE_RATE_LIMITED, 'errmsg': 'api freq out of limit'}
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self.count('bad_request')
+            return 200, {'errcode': 40008, 'errmsg': 'invalid message type'}
+        msgtype = payload.get('msgtype') or 'text'
+        if msgtype == 'file' and (payload.get('file') or {}).get('media_id') not in self.uploads:
+            self.count('bad_request')
+            return 200, {'errcode': 40007, 'errmsg': 'invalid media_id'}
+        content = ((payload.get(msgtype) or {}).get('content') or '')
+        if len(content.encode('utf-8')) > CONTENT_MAX_BYTES.get(msgtype, 2048):
+            self.count('too_long')
+            return 200, {'errcode': ERRCODE_CONTENT_TOO_LONG, 'errmsg': 'content exceed max length'}
+
+        self.count('ok')
+        with self._lock:
+            self.messages.append(payload)
+        return 200, {'errcode': ERRCODE_OK, 'errmsg': 'ok'}
+
+    def upload(self, key, body):
+        """文件上传，返回media_id（不解析multipart，原样保存请求体）"""
+        if not key:
+            return 200, {'errcode': ERRCODE_INVALID_KEY, 'errmsg': 'invalid webhook url'}
+        self.count('upload')
+        with self._lock:
+            media_id = f"media-{len(self.uploads) + 1}"
+            self.uploads[media_id] = body
+        return 200, {'errcode': ERRCODE_OK, 'errmsg': 'ok', 'type': 'file', 'media_id': media_id}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                server.count('requests')
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                url = urlsplit(self.path)
+                key = parse_qs(url.query).get('key', [''])[0]
+
+                if url.path.endswith('/upload_media'):
+                    result = server.upload(key, body)
+                else:
+                    result = server.respond(key, body)
+                if result is None:
+                    self.close_connection = True
+                    return
+                status, data = result
+                encoded = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, fmt, *args):
+                logger.debug(fmt % args)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地企业微信webhook模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--latency-ms', type=float, default=0, help='固定延迟')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='随机附加延迟上限')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回502的比例')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='不响应的比例')
+    parser.add_argument('--rate-limit', type=int, default=0, help='每个key每分钟允许的消息数，0为不限制')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    faults = FaultConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.timeout_rate,
+                         rate_limit=args.rate_limit)
+    server = FakeWeComServer(args.host, args.port, faults)
+    print(f"模拟服务已启动: {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"统计: {dict(server.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志清理
+对每个日志目录（默认 logs/ 和 webhook-log/，含子目录）做一次 os.scandir 遍历：
+- 修改时间超过 LOG_COMPRESS_DAYS 天的日志压缩为 .gz（保留原修改时间），多个线程并行压缩
+- 超过 LOG_RETENTION_DAYS 天的日志（含已压缩的）删除，按批删除并每批记录一行日志
+只处理 *.log、*.log.N、*.log.gz 和追踪文件 *.jsonl 这类文件，回填报告、剖析结果等其他文件不动。
+重叠的目录、指向同一目录的符号链接只遍历一次；遍历、压缩和删除都是流式的，
+内存占用与文件总数无关。
+用法:
+    python3 log_janitor.py --dry-run     # 只输出将要压缩和删除的文件统计
+    python3 log_janitor.py
+"""
+
+import os
+import sys
+import gzip
+import shutil
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import settings
+from profiler import phase
+
+# 默认清理的日志目录，可在config.py中用 LOG_ROOTS 覆盖
+LOG_ROOTS = ['/www/wwwroot/ana/logs', '/www/wwwroot/ana/webhook-log']
+
+# 压缩和删除的天数
+LOG_COMPRESS_DAYS = 7
+LOG_RETENTION_DAYS = 30
+
+# 每批删除/压缩的文件数
+BATCH_SIZE = 500
+
+# 并行压缩的线程数
+COMPRESS_WORKERS = 4
+
+# dry-run报告中列出的示例文件数
+SAMPLE_FILES = 10
+
+logger = logging.getLogger(__name__)
+
+
+def is_log_file(name):
+    """日志文件及其轮转、压缩后的文件，不包括压缩中途留下的临时文件"""
+    return (name.endswith(('.log', '.jsonl')) or '.log.' in name or '.jsonl.' in name) and not name.endswith('.tmp')
+
+
+class JanitorReport:
+    """一次清理的统计"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.scanned = 0
+        self.compressed = 0
+        self.deleted = 0
+        self.bytes_freed = 0
+        self.errors = 0
+        self.samples = []
+
+    def sample(self, action, path):
+        if len(self.samples) < SAMPLE_FILES:
+            self.samples.append((action, path))
+
+    def format(self):
+        verb = "将" if self.dry_run else "已"
+        lines = [f"扫描{self.scanned}个日志文件，{verb}压缩{self.compressed}个，{verb}删除{self.deleted}个，"
+                 f"释放{self.bytes_freed / (1024 * 1024):.1f}MB" + (f"，失败{self.errors}个" if self.errors else "")]
+        lines.extend(f"  {action} {path}" for action, path in self.samples)
+        return "\n".join(lines)
+
+
+def scan_logs(roots):
+    """遍历日志目录，逐个返回日志文件的 (路径, stat)，每个目录只访问一次"""
+    seen = set()
+    stack = []
+    for root in roots:
+        try:
+            stack.append(os.path.realpath(root))
+        except OSError:
+            continue
+    while stack:
+        directory = stack.pop()
+        try:
+            info = os.stat(directory)
+        except OSError:
+            continue
+        key = (info.st_dev, info.st_ino)
+        if key in seen:
+            continue
+        seen.add(key)
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False) and is_log_file(entry.name):
+                            yield entry.path, entry.stat(follow_symlinks=False)
+                    except OSError as e:
+                        logger.warning(f"读取文件信息失败 {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"读取日志目录失败 {directory}: {e}")
+
+
+def compress_file(path, mtime):
+    """压缩为path.gz并删除原文件，返回节省的字节数"""
+    target = path + '.gz'
+    if os.path.exists(target):
+        raise FileExistsError(f"{target} 已存在")
+    tmp_path = target + '.tmp'
+    with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.utime(tmp_path, (mtime, mtime))
+    os.replace(tmp_path, target)
+    saved = os.stat(path).st_size - os.stat(target).st_size
+    os.unlink(path)
+    return saved
+
+
+class LogJanitor:
+    def __init__(self, roots=None, compress_days=None, retention_days=None, workers=COMPRESS_WORKERS,
+                 batch_size=BATCH_SIZE, dry_run=False, now=None):
+        current = settings.get_settings()
+        self.roots = roots or current.get('LOG_ROOTS', LOG_ROOTS)
+        self.compress_days = compress_days or current.get('LOG_COMPRESS_DAYS', LOG_COMPRESS_DAYS)
+        self.retention_days = retention_days or current.get('LOG_RETENTION_DAYS', LOG_RETENTION_DAYS)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.now = now or datetime.now()
+
+    def run(self):
+        report = JanitorReport(dry_run=self.dry_run)
+        compress_before = (self.now - timedelta(days=self.compress_days)).timestamp()
+        delete_before = (self.now - timedelta(days=self.retention_days)).timestamp()
+        to_compress, to_delete = [], []
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='janitor') as pool:
+            for path, info in scan_logs(self.roots):
+                report.scanned += 1
+                if info.st_mtime < delete_before:
+                    to_delete.append((path, info.st_size))
+                    if len(to_delete) >= self.batch_size:
+                        self.delete_batch(to_delete, report)
+                elif info.st_mtime < compress_before and not path.endswith('.gz'):
+                    to_compress.append((path, info.st_mtime, info.st_size))
+                    if len(to_compress) >= self.batch_size:
+                        self.compress_batch(pool, to_compress, report)
+            self.delete_batch(to_delete, report)
+            self.compress_batch(pool, to_compress, report)
+        return report
+
+    def delete_batch(self, batch, report):
+        deleted, freed = 0, 0
+        with phase('log_clean'):
+            for path, size in batch:
+                report.sample('删除', path)
+                if self.dry_run:
+                    deleted, freed = deleted + 1, freed + size
+                    continue
+                try:
+                    os.unlink(path)
+                    deleted, freed = deleted + 1, freed + size
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    report.errors += 1
+                    logger.warning(f"删除日志文件失败 {path}: {e}")
+        if deleted and not self.dry_run:
+            logger.info(f"删除旧日志{deleted}个，释放{freed / (1024 * 1024):.1f}MB")
+        report.deleted += deleted
+        report.bytes_freed += freed
+        batch.clear()
+
+    def compress_batch(self, pool, batch, report):
+        if not batch:
+            return
+        for path, _, _ in batch:
+            report.sample('压缩', path)
+        if self.dry_run:
+            report.compressed += len(batch)
+            batch.clear()
+            return
+
+        futures = [(path, pool.submit(compress_file, path, mtime)) for path, mtime, _ in batch]
+        compressed, saved = 0, 0
+        for path, future in futures:
+            try:
+                saved += future.result()
+                compressed += 1
+            except OSError as e:
+                report.errors += 1
+                logger.warning(f"压缩日志文件失败 {path}: {e}")
+        if compressed:
+            logger.info(f"压缩旧日志{compressed}个，节省{saved / (1024 * 1024):.1f}MB")
+        report.compressed += compressed
+        report.bytes_freed += saved
+        batch.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日志清理')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不压缩和删除')
+    parser.add_argument('--compress-days', type=int, help=f'压缩多少天前的日志，默认{LOG_COMPRESS_DAYS}')
+    parser.add_argument('--retention-days', type=int, help=f'删除多少天前的日志，默认{LOG_RETENTION_DAYS}')
+    parser.add_argument('--workers', type=int, default=COMPRESS_WORKERS, help='并行压缩的线程数')
+    parser.add_argument('roots', nargs='*', help='日志目录，默认LOG_ROOTS')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    janitor = LogJanitor(args.roots, args.compress_days, args.retention_days, args.workers, dry_run=args.dry_run)
+    print(janitor.run().format())
+
+
+if __name__ == "__main__":
+    main()
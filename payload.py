@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+企业微信消息拆分
+企业微信群机器人的text消息内容最长2048字节、markdown最长4096字节（均按UTF-8计算），
+超长会返回40058被拒收。这里按行累计UTF-8字节数，把报告装进尽量少的消息：
+- 一条text放得下时保持原样发送
+- 需要多条时，超过 MAX_PARTS 条改用markdown（单条容量翻倍）
+- markdown仍超过 MAX_PARTS 条时，上传为文件发送，另附一条摘要
+多条消息时每条开头加 (序号/总数)，发送由 delivery.WeComTarget 按间隔逐条进行。
+"""
+
+# 企业微信单条消息内容上限（字节）
+TEXT_MAX_BYTES = 2048
+MARKDOWN_MAX_BYTES = 4096
+
+# 文件上传大小上限（字节）
+FILE_MAX_BYTES = 20 * 1024 * 1024
+
+# 超过这个条数时换用更大的消息类型
+MAX_PARTS = 3
+
+# 给 "(序号/总数)\n" 预留的字节数
+PART_PREFIX_BYTES = 12
+
+
+def utf8_len(text):
+    return len(text.encode('utf-8'))
+
+
+def split_bytes(text, limit):
+    """按字节上限切分一段文本，不会把一个字符切成两半"""
+    pieces = []
+    current, size = [], 0
+    for char in text:
+        width = utf8_len(char)
+        if size + width > limit and current:
+            pieces.append(''.join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    if current:
+        pieces.append(''.join(current))
+    return pieces
+
+
+def split_line(line, limit):
+    """单行超长时先按 ; 分隔的条目切分，单个条目仍超长时按字节切分"""
+    pieces = []
+    current = ''
+    for item in line.split(';'):
+        candidate = f"{current};{item}" if current else item
+        if utf8_len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if utf8_len(item) <= limit:
+            current = item
+        else:
+            chunks = split_bytes(item, limit)
+            pieces.extend(chunks[:-1])
+            current = chunks[-1]
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pack_lines(text, limit):
+    """把文本按行装进不超过limit字节的若干段，尽量少分段"""
+    parts = []
+    current, size = [], 0
+    for line in text.split('\n'):
+        lines = [line] if utf8_len(line) <= limit else split_line(line, limit)
+        for piece in lines:
+            width = utf8_len(piece) + (1 if current else 0)
+            if current and size + width > limit:
+                parts.append('\n'.join(current))
+                current, size = [], 0
+                width = utf8_len(piece)
+            current.append(piece)
+            size += width
+    if current:
+        parts.append('\n'.join(current))
+    return parts
+
+
+def number_parts(parts):
+    if len(parts) == 1:
+        return parts
+    return [f"({index}/{len(parts)})\n{part}" for index, part in enumerate(parts, 1)]
+
+
+def text_message(content):
+    return {"msgtype": "text", "text": {"content": content}}
+
+
+def markdown_message(content):
+    return {"msgtype": "markdown", "markdown": {"content": content}}
+
+
+def file_message(data, filename):
+    """待上传的文件，发送前由WeComTarget上传换成media_id"""
+    return {"msgtype": "file", "filename": filename, "data": data}
+
+
+def build_messages(report, filename='report.txt', max_parts=MAX_PARTS):
+    """把报告拆成企业微信消息列表，按发送顺序排列"""
+    if utf8_len(report) <= TEXT_MAX_BYTES:
+        return [text_message(report)]
+
+    parts = pack_lines(report, TEXT_MAX_BYTES - PART_PREFIX_BYTES)
+    if len(parts) <= max_parts:
+        return [text_message(part) for part in number_parts(parts)]
+
+    parts = pack_lines(report, MARKDOWN_MAX_BYTES - PART_PREFIX_BYTES)
+    if len(parts) <= max_parts:
+        return [markdown_message(part) for part in number_parts(parts)]
+
+    data = report.encode('utf-8')
+    if len(data) > FILE_MAX_BYTES:
+        data = data[:FILE_MAX_BYTES].decode('utf-8', errors='ignore').encode('utf-8')
+    summary = pack_lines(report, TEXT_MAX_BYTES - 128)[0]
+    summary = f"{summary}\n…完整报告({len(data) // 1024 + 1}KB)见附件 {filename}"
+    return [text_message(split_bytes(summary, TEXT_MAX_BYTES)[0]), file_message(data, filename)]
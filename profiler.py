@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告任务性能剖析工具
+--profile 模式下统计各阶段耗时（连接、查询、取数、渲染、发送、写日志、清理日志），
+并输出 cProfile 的 pstats 文件和采样得到的折叠栈文件（可直接生成火焰图）
+"""
+
+import os
+import sys
+import time
+import threading
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# 剖析结果输出目录
+PROFILE_DIR = Path("/www/wwwroot/ana/logs/profile")
+
+# 报告任务的标准阶段
+PHASES = ('connect', 'query', 'fetch', 'render', 'send', 'log_write', 'log_clean')
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+logger = logging.getLogger(__name__)
+
+# 当前生效的剖析器，未开启剖析时为None
+_active = None
+
+
+@contextmanager
+def phase(name):
+    """记录一个阶段的耗时，未开启剖析时不做任何事"""
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+
+    profiler.enter_phase(name)
+    try:
+        yield
+    finally:
+        profiler.exit_phase()
+
+
+def extract_profile_flag(argv):
+    """从命令行参数中取出--profile开关，返回(是否开启, 剩余参数)"""
+    args = [arg for arg in argv if arg != '--profile']
+    return len(args) != len(argv), args
+
+
+class StackSampler:
+    """定时采样目标线程的调用栈，汇总成折叠栈"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def write(self, path):
+        """按 "栈 次数" 的折叠格式写出，供 flamegraph.pl / speedscope 使用"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RunProfiler:
+    """一次报告运行的剖析器"""
+
+    def __init__(self, name, output_dir=None, interval=SAMPLE_INTERVAL):
+        self.name = name
+        self.output_dir = Path(output_dir) if output_dir else PROFILE_DIR
+        self.interval = interval
+        self.timings = {}
+        self.counts = Counter()
+        self.total = 0.0
+        self._stack = []
+        self._started = None
+        self._profile = None
+        self._sampler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        """开始剖析"""
+        import cProfile
+
+        global _active
+        _active = self
+        self._profile = cProfile.Profile()
+        self._sampler = StackSampler(threading.get_ident(), self.interval)
+        self._sampler.start()
+        self._started = time.perf_counter()
+        self._profile.enable()
+
+    def stop(self):
+        """结束剖析并写出结果文件"""
+        global _active
+        self._profile.disable()
+        self.total = time.perf_counter() - self._started
+        self._sampler.stop()
+        _active = None
+
+        try:
+            self.write_results()
+        except Exception as e:
+            logger.error(f"保存剖析结果失败: {e}")
+        print(self.summary())
+
+    def enter_phase(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def exit_phase(self):
+        """记录阶段的独占耗时，嵌套阶段的时间从外层阶段中扣除"""
+        name, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.timings[name] = self.timings.get(name, 0.0) + elapsed - nested
+        self.counts[name] += 1
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def summary(self):
+        """生成各阶段耗时汇总"""
+        lines = [f"=== 性能剖析: {self.name} 总耗时 {self.total * 1000:.1f}ms ==="]
+        names = list(PHASES) + sorted(set(self.timings) - set(PHASES))
+        accounted = 0.0
+        for name in names:
+            if name not in self.timings:
+                continue
+            elapsed = self.timings[name]
+            accounted += elapsed
+            share = elapsed / self.total * 100 if self.total else 0
+            lines.append(f"{name:<10} {elapsed * 1000:>10.1f}ms {share:>5.1f}%  ({self.counts[name]}次)")
+        other = max(self.total - accounted, 0.0)
+        lines.append(f"{'other':<10} {other * 1000:>10.1f}ms")
+        return "\n".join(lines)
+
+    def write_results(self):
+        """写出pstats、折叠栈和阶段汇总文件"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        prefix = self.output_dir / f"{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+        self._profile.dump_stats(f"{prefix}.pstats")
+        self._sampler.write(f"{prefix}.collapsed")
+        with open(f"{prefix}.phases.txt", 'w', encoding='utf-8') as f:
+            f.write(self.summary() + "\n")
+
+        logger.info(f"剖析结果已保存到: {prefix}.*")
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实时购买提醒
+持续发现 wy_store_order 中新支付的订单，在合并窗口内攒成一条企业微信消息发送。
+
+轮询模式：按 (add_time, id) 做键集分页，稳态下每个周期只有一条走索引的查询；
+下单时未支付的订单会记下id，每 PENDING_CHECK_INTERVAL 秒按主键检查一次是否已支付，直到超过等待时间；
+游标只在有变化时写盘。已读出但还没发送成功的订单id随游标保存，发送失败时留在合并窗口中下个周期重发，
+进程重启后重新读取这些订单并提醒。
+CDC模式：复用 activity_cdc 的binlog采集，订单变为已支付时立即进入合并窗口；
+第一次启动从主库当前binlog位置开始，与轮询模式一样不提醒历史订单。
+
+建议索引: ALTER TABLE wy_store_order ADD INDEX idx_add_time_id (add_time, id);
+用法:
+    python3 purchase_alert.py                 # 轮询模式
+    python3 purchase_alert.py --source cdc    # binlog模式
+    python3 purchase_alert.py --webhook-profile sales   # 发送到WEBHOOK_PROFILES中的sales目标
+config.py修改后自动重新加载，数据库连接和投递目标随之重建，无需重启。
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+import delivery
+import settings
+from webhook import format_user_info
+
+# 状态目录
+STATE_DIR = Path("/www/wwwroot/ana/state")
+
+# 轮询间隔和合并窗口（秒）
+POLL_INTERVAL = 15
+COALESCE_SECONDS = 30
+
+# 每次最多读取的新订单数
+PAGE_SIZE = 200
+
+# 未支付订单最长等待多久（秒），超过后不再检查
+PENDING_TTL = 1800
+
+# 检查未支付订单是否已支付的间隔（秒）
+PENDING_CHECK_INTERVAL = 60
+
+# 一条提醒消息中最多列出的订单数
+MAX_LISTED_ORDERS = 10
+
+logger = logging.getLogger(__name__)
+
+
+class AlertCoalescer:
+    """把合并窗口内的订单攒成一条消息发送"""
+
+    def __init__(self, window=COALESCE_SECONDS, send=None, profile=settings.DEFAULT_PROFILE):
+        self.window = window
+        self.send = send or (lambda message: delivery.broadcast(message, profile))
+        self.orders = []
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def add(self, order):
+        with self._lock:
+            if not self.orders:
+                self.opened_at = time.monotonic()
+            self.orders.append(order)
+
+    def due(self):
+        with self._lock:
+            return bool(self.orders) and time.monotonic() - self.opened_at >= self.window
+
+    def flush(self):
+        """发送攒下的订单，返回是否发送成功；失败的订单放回窗口，下次flush时重发"""
+        with self._lock:
+            orders, self.orders = self.orders, []
+            opened_at = self.opened_at
+        if not orders:
+            return True
+
+        success = self.send(format_alert(orders))
+        if not success:
+            logger.error(f"购买提醒发送失败，{len(orders)}笔订单等待重发")
+            with self._lock:
+                self.orders = orders + self.orders
+                self.opened_at = opened_at
+        return success
+
+
+def format_alert(orders):
+    """生成购买提醒消息"""
+    total = sum(float(o.get('pay_price') or 0) for o in orders)
+    lines = [f"💰 新订单{len(orders)}笔 ¥{total:.0f}"]
+    for order in orders[:MAX_LISTED_ORDERS]:
+        products = order.get('products') or '课程'
+        lines.append(f"{format_user_info(order)} ¥{float(order.get('pay_price') or 0):.0f} {products}")
+    if len(orders) > MAX_LISTED_ORDERS:
+        lines.append(f"等{len(orders)}笔")
+    return "\n".join(lines)
+
+
+class PaidOrderPoller:
+    """按 (add_time, id) 键集分页发现新支付订单"""
+
+    def __init__(self, db_config=None, cursor_path=None, page_size=PAGE_SIZE,
+                 pending_check_interval=PENDING_CHECK_INTERVAL):
+        self.db_config = db_config
+        self.cursor_path = Path(cursor_path) if cursor_path else STATE_DIR / 'purchase_alert_cursor.json'
+        self.page_size = page_size
+        self.pending_check_interval = pending_check_interval
+        self.conn = None
+        self.last_add_time = None
+        self.last_id = 0
+        # 未支付订单 {id: add_time}
+        self.pending = {}
+        # 已发现支付但还没读到详情的订单id，查询失败时下个周期重试
+        self.backlog = []
+        # 已读出详情交给合并窗口、还没发送成功的订单id
+        self.unsent = []
+        self._pending_checked_at = None
+        # 最后一次写盘的游标，没有变化时不重写文件
+        self._saved_state = None
+
+    def load_cursor(self):
+        try:
+            with open(self.cursor_path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.last_add_time = state['add_time']
+            self.last_id = state['id']
+            self.pending = {int(k): v for k, v in state.get('pending', {}).items()}
+            # 上次没有发送成功的订单重新读取详情再提醒
+            self.backlog = state.get('backlog', []) + state.get('unsent', [])
+            self._saved_state = self.cursor_state()
+        except FileNotFoundError:
+            # 第一次启动从当前时间开始，不提醒历史订单
+            self.last_add_time = int(time.time())
+            self.last_id = 0
+
+    def cursor_state(self):
+        return {'add_time': self.last_add_time, 'id': self.last_id,
+                'pending': {str(k): v for k, v in self.pending.items()}, 'backlog': list(self.backlog),
+                'unsent': list(self.unsent)}
+
+    def save_cursor(self):
+        """游标有变化时写盘，返回是否写入"""
+        state = self.cursor_state()
+        if state == self._saved_state:
+            return False
+        self.cursor_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cursor_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.cursor_path)
+        self._saved_state = state
+        return True
+
+    def query(self, sql, params):
+        if self.conn is None:
+            self.conn = db.connect(self.db_config)
+            self.conn.autocommit(True)
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+        except Exception:
+            # 连接可能已断开，下个周期重连
+            self.close()
+            raise
+
+    def fetch_new_orders(self):
+        """读取游标之后的新订单（含未支付），每页一条索引范围查询"""
+        sql = """
+        SELECT id, paid, add_time
+        FROM wy_store_order
+        WHERE add_time >= %s
+        AND (add_time > %s OR id > %s)
+        ORDER BY add_time, id
+        LIMIT %s
+        """
+        rows = []
+        while True:
+            page = self.query(sql, [self.last_add_time, self.last_add_time, self.last_id, self.page_size])
+            rows.extend(page)
+            if page:
+                self.last_add_time = page[-1]['add_time']
+                self.last_id = page[-1]['id']
+            if len(page) < self.page_size:
+                return rows
+
+    def fetch_order_details(self, order_ids):
+        """按主键读取订单的用户和产品信息"""
+        placeholders = ', '.join(['%s'] * len(order_ids))
+        sql = f"""
+        SELECT
+            o.id,
+            o.order_id,
+            o.uid,
+            o.pay_price,
+            o.paid,
+            u.phone,
+            wu.nickname as wechat_name,
+            GROUP_CONCAT(DISTINCT s.title ORDER BY s.title SEPARATOR ', ') as products
+        FROM wy_store_order o
+        LEFT JOIN wy_user u ON o.uid = u.uid
+        LEFT JOIN wy_wechat_user wu ON u.uid = wu.uid
+        LEFT JOIN wy_store_order_cart_info ci ON o.id = ci.oid
+        LEFT JOIN wy_special s ON ci.product_id = s.id
+        WHERE o.id IN ({placeholders})
+        GROUP BY o.id, o.order_id, o.uid, o.pay_price, o.paid, o.add_time, u.phone, wu.nickname
+        ORDER BY o.add_time, o.id
+        """
+        return self.query(sql, list(order_ids))
+
+    def poll(self):
+        """执行一次轮询，返回新支付的订单详情"""
+        for row in self.fetch_new_orders():
+            if row['paid'] == 1:
+                self.backlog.append(row['id'])
+            else:
+                self.pending[row['id']] = row['add_time']
+
+        # 检查之前未支付的订单，超过等待时间的不再跟踪
+        now = time.time()
+        if self.pending and (self._pending_checked_at is None
+                             or now - self._pending_checked_at >= self.pending_check_interval):
+            self._pending_checked_at = now
+            expire_before = now - PENDING_TTL
+            self.pending = {k: v for k, v in self.pending.items() if v >= expire_before}
+            if self.pending:
+                placeholders = ', '.join(['%s'] * len(self.pending))
+                rows = self.query(f"SELECT id FROM wy_store_order WHERE paid = 1 AND id IN ({placeholders})",
+                                  list(self.pending))
+                for row in rows:
+                    self.backlog.append(row['id'])
+                    del self.pending[row['id']]
+
+        orders = self.fetch_order_details(self.backlog) if self.backlog else []
+        self.unsent.extend(self.backlog)
+        self.backlog = []
+        self.save_cursor()
+        return orders
+
+    def mark_sent(self):
+        """合并窗口中的订单已全部发送成功"""
+        self.unsent = []
+        self.save_cursor()
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+
+
+class OrderPaidSink:
+    """CDC模式下把binlog中的支付事件送入合并窗口"""
+
+    def __init__(self, poller, coalescer):
+        self.poller = poller
+        self.coalescer = coalescer
+
+    def add(self, event):
+        if event.kind != 'order_paid':
+            return
+        try:
+            orders = self.poller.fetch_order_details([event.ref_id])
+        except Exception as e:
+            logger.error(f"读取订单详情失败: {e}")
+            orders = [{'uid': event.uid, 'pay_price': event.amount}]
+        for order in orders:
+            self.coalescer.add(order)
+
+    def save(self):
+        pass
+
+
+class PurchaseAlertStream:
+    """实时购买提醒主循环"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL, coalesce_seconds=COALESCE_SECONDS,
+                 profile=settings.DEFAULT_PROFILE):
+        self.poll_interval = poll_interval
+        self.coalescer = AlertCoalescer(coalesce_seconds, profile=profile)
+        self.running = False
+
+    def run_polling(self):
+        poller = PaidOrderPoller()
+        poller.load_cursor()
+        self.running = True
+        logger.info("购买提醒已启动（轮询模式）")
+
+        try:
+            while self.running:
+                started = time.monotonic()
+                try:
+                    for order in poller.poll():
+                        self.coalescer.add(order)
+                except Exception as e:
+                    logger.error(f"轮询订单失败: {e}")
+
+                if settings.reload_if_changed():
+                    # 下个周期按新配置重新连接
+                    poller.close()
+                if self.coalescer.due():
+                    self.flush(poller)
+
+                time.sleep(max(self.poll_interval - (time.monotonic() - started), 0))
+        finally:
+            self.flush(poller)
+            poller.close()
+
+    def flush(self, poller):
+        """发送合并窗口内的订单，发送成功后才从游标中去掉这些订单"""
+        if self.coalescer.flush():
+            poller.mark_sent()
+
+    def run_cdc(self):
+        from activity_cdc import BinlogActivityFeed
+
+        poller = PaidOrderPoller()
+
+        def flusher():
+            while self.running:
+                settings.reload_if_changed()
+                if self.coalescer.due():
+                    self.coalescer.flush()
+                time.sleep(1)
+
+        self.running = True
+        threading.Thread(target=flusher, name='alert-flusher', daemon=True).start()
+        # 第一次启动从主库当前位置开始，不把当前binlog中的历史支付当作新订单提醒
+        feed = BinlogActivityFeed([OrderPaidSink(poller, self.coalescer)],
+                                  checkpoint_path=STATE_DIR / 'purchase_alert_binlog.json', start_at_current=True)
+        logger.info("购买提醒已启动（binlog模式）")
+        try:
+            feed.run()
+        finally:
+            self.running = False
+            self.coalescer.flush()
+            poller.close()
+
+    def stop(self):
+        self.running = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='实时购买提醒')
+    parser.add_argument('--source', choices=['poll', 'cdc'], default='poll')
+    parser.add_argument('--interval', type=int, default=POLL_INTERVAL, help='轮询间隔（秒）')
+    parser.add_argument('--coalesce', type=int, default=COALESCE_SECONDS, help='合并窗口（秒）')
+    parser.add_argument('--webhook-profile', default=settings.DEFAULT_PROFILE, help='WEBHOOK_PROFILES中的投递目标')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stream = PurchaseAlertStream(args.interval, args.coalesce, args.webhook_profile)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        if args.source == 'cdc':
+            stream.run_cdc()
+        else:
+            stream.run_polling()
+    except KeyboardInterrupt:
+        stream.stop()
+
+
+if __name__ == "__main__":
+    main()
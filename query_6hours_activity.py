@@ -2,53 +2,65 @@
 """
 查询过去6小时用户活动数据
 包括：新用户注册、产品购买、老用户登录、课程观看等信息
+查看单个用户的活动时间线（读取timeline.py的本地索引）:
+    python3 query_6hours_activity.py timeline --uid 123 --days 30
 """
-import pymysql
 import sys
 import os
 from datetime import datetime, timedelta
-import json
 
-# 数据库配置
-DATABASE_CONFIG = {
-    'host': 'localhost',
-    'port': 3306,
-    'user': '6page',
-    'password': '5NsFLLBFFsnZb3fh',
-    'database': '6page',
-    'charset': 'utf8mb4'
+import argparse
+
+import db
+import exporter
+from profiler import phase, RunProfiler
+from report_cache import ReportCache, make_key
+
+# 报告类型（缓存键的一部分）
+REPORT_TYPE = '6h'
+
+# 导出时各分项对应的查询方法
+SECTION_QUERIES = {
+    'new_users': 'new_registrations_query',
+    'purchases': 'product_purchases_query',
+    'logins': 'user_logins_query',
+    'watching': 'course_watching_query',
 }
 
+# 导出时每批从游标读取的行数
+EXPORT_BATCH = 1000
+
 class SixHoursActivityQuery:
-    def __init__(self):
-        self.config = DATABASE_CONFIG
+    def __init__(self, end_time=None, hours=6, cache=None, db_profile=None):
+        # 数据库配置来自settings（config.py或ANA_DB_*环境变量）
+        self.config = db.load_database_config(db_profile or 'default')
+        self.end_time = end_time or datetime.now()
+        self.hours = hours
+        self.start_time = self.end_time - timedelta(hours=hours)
+        self.cache = cache
+        self.query_failed = False
         
     def get_connection(self):
-        return pymysql.connect(
-            host=self.config['host'],
-            port=self.config['port'],
-            user=self.config['user'],
-            password=self.config['password'],
-            database=self.config['database'],
-            charset=self.config['charset'],
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        return db.connect_report(self.config)
     
     def execute_query(self, sql, params=None):
         """执行查询并返回结果"""
         conn = self.get_connection()
         try:
             with conn.cursor() as cursor:
-                cursor.execute(sql, params)
-                return cursor.fetchall()
+                with phase('query'):
+                    cursor.execute(sql, params)
+                with phase('fetch'):
+                    return cursor.fetchall()
         except Exception as e:
             print(f"查询出错: {e}")
+            self.query_failed = True
             return []
         finally:
             conn.close()
     
-    def get_new_registrations(self):
-        """查询过去6小时新用户注册"""
+    def new_registrations_query(self):
+        """查询时间窗口内新用户注册的SQL和参数"""
         sql = """
         SELECT 
             u.uid,
@@ -62,14 +74,15 @@ class SixHoursActivityQuery:
             wu.nickname as wechat_name
         FROM wy_user u
         LEFT JOIN wy_wechat_user wu ON u.uid = wu.uid
-        WHERE u.add_time > UNIX_TIMESTAMP(DATE_SUB(NOW(), INTERVAL 6 HOUR))
+        WHERE u.add_time > UNIX_TIMESTAMP(%s)
+        AND u.add_time <= UNIX_TIMESTAMP(%s)
         AND u.status = 1
         ORDER BY u.add_time DESC
         """
-        return self.execute_query(sql)
+        return sql, [self.start_time, self.end_time]
     
-    def get_product_purchases(self):
-        """查询过去6小时产品购买"""
+    def product_purchases_query(self):
+        """查询时间窗口内产品购买的SQL和参数"""
         sql = """
         SELECT 
             o.uid,
@@ -86,14 +99,15 @@ class SixHoursActivityQuery:
         LEFT JOIN wy_store_order_cart_info ci ON o.id = ci.oid
         LEFT JOIN wy_special s ON ci.product_id = s.id
         WHERE o.paid = 1 
-        AND o.add_time > UNIX_TIMESTAMP(DATE_SUB(NOW(), INTERVAL 6 HOUR))
+        AND o.add_time > UNIX_TIMESTAMP(%s)
+        AND o.add_time <= UNIX_TIMESTAMP(%s)
         GROUP BY o.id, o.uid, u.nickname, u.phone, wu.nickname, o.order_id, o.pay_price, o.add_time
         ORDER BY o.add_time DESC
         """
-        return self.execute_query(sql)
+        return sql, [self.start_time, self.end_time]
     
-    def get_user_logins(self):
-        """查询过去6小时老用户登录（基于last_time更新）"""
+    def user_logins_query(self):
+        """查询时间窗口内老用户登录（基于last_time更新）的SQL和参数"""
         sql = """
         SELECT 
             u.uid,
@@ -102,18 +116,20 @@ class SixHoursActivityQuery:
             wu.nickname as wechat_name,
             FROM_UNIXTIME(u.last_time) as last_login_time,
             FROM_UNIXTIME(u.add_time) as register_time,
-            DATEDIFF(NOW(), FROM_UNIXTIME(u.add_time)) as register_days_ago
+            DATEDIFF(%s, FROM_UNIXTIME(u.add_time)) as register_days_ago
         FROM wy_user u
         LEFT JOIN wy_wechat_user wu ON u.uid = wu.uid
-        WHERE u.last_time > UNIX_TIMESTAMP(DATE_SUB(NOW(), INTERVAL 6 HOUR))
-        AND u.add_time < UNIX_TIMESTAMP(DATE_SUB(NOW(), INTERVAL 1 DAY))  -- 排除新用户
+        WHERE u.last_time > UNIX_TIMESTAMP(%s)
+        AND u.last_time <= UNIX_TIMESTAMP(%s)
+        AND u.add_time < UNIX_TIMESTAMP(%s)  -- 排除新用户
         AND u.status = 1
         ORDER BY u.last_time DESC
         """
-        return self.execute_query(sql)
+        return sql, [self.end_time, self.start_time, self.end_time,
+                     self.end_time - timedelta(days=1)]
     
-    def get_course_watching(self):
-        """查询过去6小时课程观看"""
+    def course_watching_query(self):
+        """查询时间窗口内课程观看的SQL和参数"""
         sql = """
         SELECT 
             sw.uid,
@@ -132,24 +148,118 @@ class SixHoursActivityQuery:
         LEFT JOIN wy_user u ON sw.uid = u.uid
         LEFT JOIN wy_wechat_user wu ON u.uid = wu.uid
         LEFT JOIN wy_special s ON sw.special_id = s.id
-        WHERE sw.add_time > UNIX_TIMESTAMP(DATE_SUB(NOW(), INTERVAL 6 HOUR))
+        WHERE sw.add_time > UNIX_TIMESTAMP(%s)
+        AND sw.add_time <= UNIX_TIMESTAMP(%s)
         AND u.status = 1
         AND s.is_del = 0
         ORDER BY sw.add_time DESC
         """
-        return self.execute_query(sql)
+        return sql, [self.start_time, self.end_time]
+    
+    def get_new_registrations(self):
+        """查询时间窗口内新用户注册"""
+        return self.execute_query(*self.new_registrations_query())
+    
+    def get_product_purchases(self):
+        """查询时间窗口内产品购买"""
+        return self.execute_query(*self.product_purchases_query())
+    
+    def get_user_logins(self):
+        """查询时间窗口内老用户登录（基于last_time更新）"""
+        return self.execute_query(*self.user_logins_query())
     
-    def format_results(self):
-        """格式化并输出所有结果"""
-        current_time = datetime.now()
-        six_hours_ago = current_time - timedelta(hours=6)
+    def get_course_watching(self):
+        """查询时间窗口内课程观看"""
+        return self.execute_query(*self.course_watching_query())
+    
+    def load_sections(self):
+        """获取各分项数据，同一窗口在缓存有效期内不重复查询"""
+        key = make_key(REPORT_TYPE, self.start_time, self.end_time, {'hours': self.hours})
+        if self.cache:
+            entry = self.cache.get(key)
+            if entry and 'sections' in entry:
+                return entry['sections']
+        
+        self.query_failed = False
+        sections = {
+            'new_users': self.get_new_registrations(),
+            'purchases': self.get_product_purchases(),
+            'logins': self.get_user_logins(),
+            'watching': self.get_course_watching(),
+        }
+        if self.cache and not self.query_failed:
+            self.cache.put(key, sections=sections)
+        return sections
+    
+    def stream_section(self, conn, name, batch_size=EXPORT_BATCH, description=None):
+        """用非缓冲游标逐批读取一个分项，不把整个结果集载入内存；description列表会填入游标的字段描述"""
+        import pymysql.cursors
+        
+        sql, params = getattr(self, SECTION_QUERIES[name])()
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            with phase('query'):
+                cursor.execute(sql, params)
+            if description is not None:
+                description[:] = cursor.description
+            while True:
+                with phase('fetch'):
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+    
+    def export(self, fmt, output=None, sections=None, compress=False):
+        """把各分项导出为json/jsonl/csv/parquet，csv和parquet每个分项一个文件"""
+        sections = list(sections or SECTION_QUERIES)
+        if fmt in ('csv', 'parquet') and len(sections) > 1:
+            if not output or output == '-':
+                raise ValueError(f"{fmt}格式导出多个分项时 --output 需要指定目录，或用 --section 选择一个分项")
+            os.makedirs(output, exist_ok=True)
+            suffix = '.gz' if compress and fmt == 'csv' else ''
+            targets = [(name, os.path.join(output, f"{name}.{fmt}{suffix}")) for name in sections]
+        else:
+            targets = [(None, output)]
+        
+        conn = db.connect_report(self.config)
+        try:
+            for name, path in targets:
+                out, raw = exporter.open_output(path, compress)
+                try:
+                    with phase('render'):
+                        if fmt == 'json':
+                            meta = {'start_time': self.start_time, 'end_time': self.end_time, 'hours': self.hours}
+                            exporter.write_json(out, {k: exporter.to_jsonable(v) for k, v in meta.items()},
+                                                ((n, self.stream_section(conn, n)) for n in sections))
+                        elif fmt == 'jsonl':
+                            exporter.write_jsonl(out, ((n, self.stream_section(conn, n)) for n in sections))
+                        elif fmt == 'csv':
+                            # 表头取自字段描述，分项没有数据时也写出表头
+                            description = []
+                            exporter.write_csv(out, self.stream_section(conn, name or sections[0],
+                                                                        description=description),
+                                               description)
+                        else:
+                            # 列类型按字段描述确定，第一批全为NULL的列不会被推断成null类型
+                            description = []
+                            exporter.write_parquet(out, self.stream_section(conn, name or sections[0],
+                                                                            description=description),
+                                                   description)
+                finally:
+                    exporter.close_output(out, raw)
+        finally:
+            conn.close()
+    
+    def format_results(self, sections=None):
+        """格式化并输出所有结果，sections为空时查询当前窗口"""
+        if sections is None:
+            sections = self.load_sections()
         
         print(f"\n=== 6页网用户活动报告 ===")
-        print(f"查询时间范围: {six_hours_ago.strftime('%Y-%m-%d %H:%M:%S')} 至 {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"查询时间范围: {self.start_time.strftime('%Y-%m-%d %H:%M:%S')} 至 {self.end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 80)
         
         # 1. 新用户注册
-        new_users = self.get_new_registrations()
+        new_users = sections['new_users']
         print(f"\n【新用户注册】共 {len(new_users)} 人")
         print("-" * 60)
         if new_users:
@@ -163,7 +273,7 @@ class SixHoursActivityQuery:
             print("暂无新用户注册")
         
         # 2. 产品购买
-        purchases = self.get_product_purchases()
+        purchases = sections['purchases']
         print(f"\n【产品购买】共 {len(purchases)} 笔订单")
         print("-" * 60)
         if purchases:
@@ -181,7 +291,7 @@ class SixHoursActivityQuery:
             print("暂无产品购买")
         
         # 3. 老用户登录
-        logins = self.get_user_logins()
+        logins = sections['logins']
         print(f"\n【老用户登录】共 {len(logins)} 人")
         print("-" * 60)
         if logins:
@@ -195,7 +305,7 @@ class SixHoursActivityQuery:
             print("暂无老用户登录")
         
         # 4. 课程观看
-        watching = self.get_course_watching()
+        watching = sections['watching']
         print(f"\n【课程观看】共 {len(watching)} 次观看")
         print("-" * 60)
         if watching:
@@ -220,10 +330,50 @@ class SixHoursActivityQuery:
         print(f"课程观看: {len(watching)} 次")
         print("=" * 80)
 
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='查询最近几小时用户活动')
+    parser.add_argument('command', nargs='?', choices=['report', 'timeline'], default='report',
+                        help='report为最近几小时活动报告（默认），timeline为单个用户的活动时间线')
+    parser.add_argument('--uid', type=int, help='timeline查看的用户ID')
+    parser.add_argument('--days', type=int, default=30, help='timeline查看最近多少天，默认30')
+    parser.add_argument('--limit', type=int, help='timeline只显示最近多少条')
+    parser.add_argument('--hours', type=int, default=6, help='查询最近多少小时，默认6')
+    parser.add_argument('--profile', action='store_true', help='输出各阶段耗时和火焰图数据')
+    parser.add_argument('--db-profile', default='default', help='使用config.py中DATABASE_PROFILES的哪套数据库配置')
+    parser.add_argument('--no-cache', action='store_true', help='不使用报告缓存，重新查询')
+    parser.add_argument('--format', choices=('text',) + exporter.FORMATS, default='text',
+                        help='输出格式，text为可读文本，其余格式直接从游标流式导出')
+    parser.add_argument('--output', help='导出文件（csv/parquet导出多个分项时为目录），默认标准输出')
+    parser.add_argument('--section', action='append', choices=sorted(SECTION_QUERIES),
+                        help='只导出指定分项，可重复')
+    parser.add_argument('--gzip', action='store_true', help='gzip压缩导出内容（文件名以.gz结尾时自动启用）')
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
     try:
-        query = SixHoursActivityQuery()
-        query.format_results()
+        args = parse_args()
+        if args.command == 'timeline':
+            # 读取本地时间线索引，不查询业务表
+            from timeline import print_timeline
+            if args.uid is None:
+                raise ValueError("timeline需要 --uid")
+            print_timeline(args.uid, args.days, limit=args.limit)
+            sys.exit(0)
+        cache = None if args.no_cache else ReportCache()
+        query = SixHoursActivityQuery(hours=args.hours, cache=cache, db_profile=args.db_profile)
+        if args.format != 'text':
+            if args.profile:
+                with RunProfiler('query_6hours_activity'):
+                    query.export(args.format, args.output, args.section, args.gzip)
+            else:
+                query.export(args.format, args.output, args.section, args.gzip)
+        elif args.profile:
+            with RunProfiler('query_6hours_activity'):
+                with phase('render'):
+                    query.format_results()
+        else:
+            query.format_results()
     except Exception as e:
         print(f"执行出错: {e}")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+报告结果缓存
+按(报告类型, 窗口开始, 窗口结束, 过滤条件)缓存各分项查询结果和渲染好的报告，
+手动重跑、测试发送和发送失败后的重发直接复用缓存，不再重复查询MySQL
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+from pathlib import Path
+
+# 缓存目录
+CACHE_DIR = Path("/www/wwwroot/ana/cache/reports")
+
+# 缓存有效期（秒）
+DEFAULT_TTL = 600
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(report_type, window_start, window_end, filters=None):
+    """生成缓存键，窗口时间精确到分钟"""
+    return json.dumps({
+        'type': report_type,
+        'start': window_start.strftime('%Y-%m-%d %H:%M'),
+        'end': window_end.strftime('%Y-%m-%d %H:%M'),
+        'filters': filters or {},
+    }, sort_keys=True, ensure_ascii=False)
+
+
+class ReportCache:
+    """基于本地文件的报告缓存，多个进程之间共享"""
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_TTL):
+        self.cache_dir = Path(cache_dir) if cache_dir else CACHE_DIR
+        self.ttl = ttl
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.cache_dir / f"{digest}.pkl"
+
+    def _load(self, path, include_expired=False):
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取缓存失败 {path.name}: {e}")
+            return None
+
+        if not include_expired and time.time() - entry['created'] > self.ttl:
+            return None
+        return entry
+
+    def get(self, key):
+        """读取未过期的缓存条目，不存在时返回None"""
+        return self._load(self._path(key))
+
+    def put(self, key, **fields):
+        """写入缓存字段（sections/payload等），与已有条目合并"""
+        try:
+            path = self._path(key)
+            entry = self._load(path) or {'key': key, 'type': json.loads(key)['type'], 'created': time.time()}
+            entry.update(fields)
+
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"写入缓存失败: {e}")
+
+    def latest(self, report_type, include_expired=False):
+        """返回指定类型最新的、带有渲染结果的未过期条目
+
+        include_expired为True时也返回过期条目，用于展示最近一次发送的报告（过期只影响查询结果的复用）
+        """
+        best = None
+        for path in self._entries():
+            entry = self._load(path, include_expired)
+            if not entry or entry.get('type') != report_type or 'payload' not in entry:
+                continue
+            if best is None or entry['created'] > best['created']:
+                best = entry
+        return best
+
+    def invalidate(self, key=None, report_type=None):
+        """删除指定键、指定类型或全部缓存，返回删除的条目数"""
+        if key is not None:
+            paths = [self._path(key)]
+        else:
+            paths = self._entries()
+
+        removed = 0
+        for path in paths:
+            if key is None and report_type is not None:
+                entry = self._load(path)
+                if entry is not None and entry.get('type') != report_type:
+                    continue
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _entries(self):
+        if not self.cache_dir.is_dir():
+            return []
+        return list(self.cache_dir.glob('*.pkl'))
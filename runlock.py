@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+定时报告的运行锁和去重
+同一个报告窗口只计算、发送一次。窗口按调度时段对齐（日报为10点/22点，临时报告按间隔整点），
+不同机器、cron和手动执行在不同分钟启动时也落在同一个窗口：
+1. 本机文件锁（fcntl）：cron重叠、手动执行时同一台机器上只有一个进程运行
+2. MySQL GET_LOCK：多台报告机之间按报告类型的租约，持有锁的连接断开（进程崩溃）时自动释放
+3. 幂等记录表 ana_report_runs：每个 (报告类型, 窗口) 一行，已发送的窗口直接跳过，
+   失败或中断（停留在running）的窗口可以被下一次执行接手
+租约和幂等记录必须在主库上，连不上主库时退化为只用本机文件锁。
+"""
+
+import os
+import socket
+import fcntl
+import hashlib
+import logging
+from datetime import timedelta
+from pathlib import Path
+
+import db
+from report_cache import make_key
+
+STATE_DIR = Path("/www/wwwroot/ana/state")
+
+# 幂等记录表
+RUNS_TABLE = 'ana_report_runs'
+
+# 固定日报的整点
+DAILY_SLOTS = (10, 22)
+
+# 等待集群租约的秒数，0表示拿不到立即跳过
+LEASE_WAIT = 0
+
+CREATE_RUNS_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+    run_key CHAR(40) NOT NULL PRIMARY KEY,
+    report_type VARCHAR(32) NOT NULL,
+    window_key VARCHAR(255) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    host VARCHAR(64) NOT NULL,
+    attempts INT NOT NULL DEFAULT 1,
+    started_at DATETIME NOT NULL,
+    finished_at DATETIME NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class LockBusy(Exception):
+    """锁已被其他进程持有，或窗口已经发送过"""
+
+
+class FileLock:
+    """基于fcntl.flock的本机互斥锁，进程退出时由内核释放"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = None
+
+    def acquire(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise LockBusy(f"本机已有进程持有 {self.path}")
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class MysqlLease:
+    """MySQL命名锁，锁与连接绑定，需要独占一个连接直到释放"""
+
+    def __init__(self, conn, name, wait=LEASE_WAIT):
+        self.conn = conn
+        # GET_LOCK的锁名最长64个字符
+        self.name = name[:64]
+        self.wait = wait
+        self.held = False
+
+    def acquire(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s) AS acquired", [self.name, self.wait])
+            row = cursor.fetchone()
+        if not row or row['acquired'] != 1:
+            raise LockBusy(f"其他节点持有租约 {self.name}")
+        self.held = True
+
+    def release(self):
+        if not self.held:
+            return
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", [self.name])
+        except Exception as e:
+            logger.warning(f"释放租约失败（连接关闭后会自动释放）: {e}")
+        self.held = False
+
+
+class RunLedger:
+    """ana_report_runs 表的读写，调用方需持有对应窗口的租约"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def ensure_table(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute(CREATE_RUNS_TABLE)
+        self.conn.commit()
+
+    def status(self, run_key):
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"SELECT status FROM {RUNS_TABLE} WHERE run_key = %s", [run_key])
+            row = cursor.fetchone()
+        return row['status'] if row else None
+
+    def start(self, run_key, report_type, window_key, host):
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {RUNS_TABLE} (run_key, report_type, window_key, status, host, started_at)
+                VALUES (%s, %s, %s, 'running', %s, NOW())
+                ON DUPLICATE KEY UPDATE status = 'running', host = VALUES(host),
+                    attempts = attempts + 1, started_at = NOW(), finished_at = NULL
+            """, [run_key, report_type, window_key, host])
+        self.conn.commit()
+
+    def finish(self, run_key, status):
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"UPDATE {RUNS_TABLE} SET status = %s, finished_at = NOW() WHERE run_key = %s",
+                           [status, run_key])
+        self.conn.commit()
+
+
+def report_slot(now, hours=24):
+    """now所属调度时段的起点：日报为最近一个固定日报整点，临时报告按hours小时对齐"""
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if hours == 24:
+        slots = [midnight + timedelta(days=day, hours=hour) for day in (-1, 0) for hour in DAILY_SLOTS]
+        return max(slot for slot in slots if slot <= now)
+    return midnight + timedelta(hours=now.hour // hours * hours)
+
+
+def window_key(report_type, now, hours=24):
+    """运行锁和幂等记录使用的窗口键，同一调度时段内启动的运行得到相同的键"""
+    slot = report_slot(now, hours)
+    return make_key(report_type, slot - timedelta(hours=hours), slot)
+
+
+def run_key(report_type, window_key):
+    return hashlib.sha1(f"{report_type}\n{window_key}".encode('utf-8')).hexdigest()
+
+
+class RunGuard:
+    """
+    报告运行守卫:
+        with RunGuard('daily', window_key('daily', now)) as guard:
+            if guard.acquired:
+                guard.finish(run())
+    force=True 时已发送的窗口也会再执行（重发），但仍然互斥。
+    """
+
+    def __init__(self, report_type, window_key, force=False, lock_dir=None, connect=None):
+        self.report_type = report_type
+        self.window_key = window_key
+        self.force = force
+        self.key = run_key(report_type, window_key)
+        self.host = socket.gethostname()[:64]
+        self.file_lock = FileLock(Path(lock_dir or STATE_DIR / 'locks') / f"{report_type}.lock")
+        self.connect = connect or db.connect
+        self.conn = None
+        self.lease = None
+        self.ledger = None
+        self.acquired = False
+        self.reason = None
+
+    def _open_cluster(self):
+        """连接主库并取得租约，主库不可用时返回False（退化为本机锁）"""
+        try:
+            self.conn = self.connect()
+        except Exception as e:
+            logger.warning(f"无法连接主库，只使用本机文件锁: {e}")
+            self.conn = None
+            return False
+
+        # 租约按报告类型命名，同一类型的报告在集群内串行，再由幂等记录判断窗口是否已发送
+        self.lease = MysqlLease(self.conn, f"ana_report:{self.report_type}")
+        self.lease.acquire()
+        self.ledger = RunLedger(self.conn)
+        try:
+            self.ledger.ensure_table()
+        except Exception as e:
+            logger.warning(f"无法创建幂等记录表，只使用租约: {e}")
+            self.ledger = None
+        return True
+
+    def _claim(self):
+        """在持有租约的前提下检查并登记窗口，已发送时抛出LockBusy"""
+        try:
+            status = self.ledger.status(self.key)
+        except Exception as e:
+            logger.warning(f"读取运行记录失败，只使用租约: {e}")
+            self.ledger = None
+            return
+        if status == 'sent' and not self.force:
+            raise LockBusy(f"窗口已发送: {self.window_key}")
+        self.ledger.start(self.key, self.report_type, self.window_key, self.host)
+
+    def __enter__(self):
+        try:
+            self.file_lock.acquire()
+            if self._open_cluster() and self.ledger:
+                self._claim()
+        except LockBusy as e:
+            self.reason = str(e)
+            logger.info(f"跳过本次运行: {self.reason}")
+            self._release()
+            return self
+        except Exception:
+            self._release()
+            raise
+
+        self.acquired = True
+        return self
+
+    def finish(self, success):
+        """记录本次运行结果，失败的窗口允许下次重试"""
+        if self.ledger:
+            try:
+                self.ledger.finish(self.key, 'sent' if success else 'failed')
+            except Exception as e:
+                logger.error(f"写入运行记录失败: {e}")
+
+    def _release(self):
+        if self.lease:
+            self.lease.release()
+        if self.conn:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+        self.file_lock.release()
+
+    def __exit__(self, *exc):
+        if self.acquired:
+            self._release()
+            self.acquired = False
+
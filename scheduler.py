@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应报告调度
+每5分钟由cron调用一次 tick。按当前活动等级决定是否探测、是否发送临时报告：
+- 探测只读取最近30分钟的注册和购买数（实时计数器存在时不查询MySQL，否则两条走add_time索引的COUNT）
+- 购买或注册速率超过阈值时进入高峰/繁忙等级，按等级间隔发送覆盖上一个间隔的临时报告
+- 平常只保留10点和22点的固定日报；持续空闲时探测间隔逐次翻倍，最长1小时，数据库开销随活动量下降
+固定日报前后 FIXED_SLOT_MARGIN 分钟内不发送临时报告。
+用法:
+    */5 * * * * cd /www/wwwroot/ana && python3 scheduler.py tick
+    python3 scheduler.py status
+"""
+
+import os
+import sys
+import json
+import math
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+import settings
+from runlock import DAILY_SLOTS
+
+STATE_FILE = Path("/www/wwwroot/ana/state/scheduler.json")
+
+# 固定日报的整点
+FIXED_HOURS = DAILY_SLOTS
+FIXED_SLOT_MARGIN = 20
+
+# 探测窗口（分钟）
+PROBE_WINDOW = 30
+
+# 实时计数器最后更新时间距今不超过这个秒数才使用
+COUNTERS_MAX_AGE = 300
+
+# 默认调度参数，可在config.py中用 ADAPTIVE_SCHEDULE 覆盖部分字段
+DEFAULT_SCHEDULE = {
+    # 每小时购买笔数/注册人数达到阈值时的等级：(名称, 购买阈值, 注册阈值, 临时报告间隔分钟, 探测间隔分钟)
+    'levels': [
+        ('peak', 20, 60, 60, 5),
+        ('busy', 8, 25, 120, 10),
+        ('normal', 1, 1, None, 15),
+    ],
+    # 低于所有阈值时为空闲，探测间隔从idle_probe开始逐次翻倍，最长max_probe
+    'idle_probe': 15,
+    'max_probe': 60,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def load_schedule():
+    """读取配置中的ADAPTIVE_SCHEDULE，未配置的字段使用默认值"""
+    return dict(DEFAULT_SCHEDULE, **(settings.get_settings().get('ADAPTIVE_SCHEDULE') or {}))
+
+
+def classify(rates, schedule):
+    """按每小时速率返回 (等级名, 临时报告间隔分钟, 探测间隔分钟)"""
+    for name, purchases, registrations, report_every, probe_every in schedule['levels']:
+        if rates['purchases'] >= purchases or rates['registrations'] >= registrations:
+            return name, report_every, probe_every
+    return 'idle', None, None
+
+
+def near_fixed_slot(now, margin=FIXED_SLOT_MARGIN):
+    """距离前后的固定日报不超过margin分钟"""
+    for hour in FIXED_HOURS:
+        for day in (-1, 0, 1):
+            slot = now.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=day)
+            if abs((slot - now).total_seconds()) <= margin * 60:
+                return True
+    return False
+
+
+def probe_counters(start, end):
+    """从实时计数器读取，计数器不存在或已停止更新时返回None"""
+    from activity_cdc import ActivityCounters
+
+    counters = ActivityCounters()
+    try:
+        age = datetime.now().timestamp() - counters.path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    if age > COUNTERS_MAX_AGE:
+        return None
+    summary = counters.load().summary(start, end)
+    return {'registrations': summary['register'][0], 'purchases': summary['purchase'][0]}
+
+
+def probe_mysql(start, end):
+    params = [int(start.timestamp()), int(end.timestamp())]
+    conn = db.connect_report()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) as v FROM wy_user WHERE add_time >= %s AND add_time < %s", params)
+            registrations = cursor.fetchone()['v']
+            cursor.execute("SELECT COUNT(*) as v FROM wy_special_buy "
+                           "WHERE add_time >= %s AND add_time < %s AND is_del = 0", params)
+            purchases = cursor.fetchone()['v']
+    finally:
+        conn.close()
+    return {'registrations': registrations, 'purchases': purchases}
+
+
+def probe(now, window=PROBE_WINDOW):
+    """最近window分钟的注册、购买数，换算成每小时速率"""
+    start = now - timedelta(minutes=window)
+    counts = probe_counters(start, now) or probe_mysql(start, now)
+    return {name: count * 60.0 / window for name, count in counts.items()}
+
+
+def send_interim_report(now, minutes):
+    """发送覆盖最近minutes分钟（向上取整到小时）的临时报告，返回是否成功"""
+    from webhook import UserActivityReporter
+    from runlock import RunGuard
+
+    reporter = UserActivityReporter(now=now, hours=max(1, math.ceil(minutes / 60)), trace=True)
+    with RunGuard(reporter.report_type, reporter.run_window_key()) as guard:
+        if not guard.acquired:
+            logger.info(f"临时报告跳过: {guard.reason}")
+            return False
+        success = reporter.run()
+        guard.finish(success)
+        return success
+
+
+class AdaptiveScheduler:
+    def __init__(self, path=None, schedule=None, prober=probe, sender=send_interim_report):
+        self.path = Path(path) if path else STATE_FILE
+        self.schedule = schedule or load_schedule()
+        self.prober = prober
+        self.sender = sender
+        self.state = {'level': 'normal', 'probe_interval': None, 'next_probe': None, 'last_report': None}
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _time(self, key):
+        value = self.state.get(key)
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S') if value else None
+
+    def _set_time(self, key, value):
+        self.state[key] = value.strftime('%Y-%m-%d %H:%M:%S')
+
+    def tick(self, now=None):
+        """执行一次调度，返回本次动作: wait / probe / report"""
+        now = (now or datetime.now()).replace(microsecond=0)
+        next_probe = self._time('next_probe')
+        if next_probe and now < next_probe:
+            return 'wait'
+
+        rates = self.prober(now)
+        level, report_every, probe_every = classify(rates, self.schedule)
+        if level == 'idle':
+            previous = self.state.get('probe_interval') if self.state.get('level') == 'idle' else None
+            probe_every = min(previous * 2, self.schedule['max_probe']) if previous else self.schedule['idle_probe']
+        if level != self.state.get('level'):
+            logger.info(f"活动等级 {self.state.get('level')} -> {level}，"
+                        f"购买{rates['purchases']:.0f}笔/小时 注册{rates['registrations']:.0f}人/小时")
+        self.state.update(level=level, probe_interval=probe_every)
+        self._set_time('next_probe', now + timedelta(minutes=probe_every))
+
+        action = 'probe'
+        last_report = self._time('last_report')
+        if report_every and not near_fixed_slot(now) and (
+                last_report is None or now - last_report >= timedelta(minutes=report_every)):
+            if self.sender(now, report_every):
+                self._set_time('last_report', now)
+            action = 'report'
+        return action
+
+
+def main():
+    parser = argparse.ArgumentParser(description='自适应报告调度')
+    parser.add_argument('command', choices=['tick', 'status'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    scheduler = AdaptiveScheduler().load()
+    if args.command == 'status':
+        print(json.dumps(scheduler.state, ensure_ascii=False, indent=2))
+        return
+
+    action = scheduler.tick()
+    scheduler.save()
+    logger.info(f"调度: {action}，等级 {scheduler.state['level']}，下次探测 {scheduler.state['next_probe']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+统一配置
+所有脚本的数据库、webhook和报告参数都从这里读取，每个进程只加载一次：
+- config.py（与脚本同目录，或 ANA_CONFIG_FILE 指定的路径）中的大写变量
+- 环境变量覆盖: ANA_DB_HOST / ANA_DB_PORT / ANA_DB_USER / ANA_DB_PASSWORD / ANA_DB_NAME / ANA_DB_CHARSET、ANA_WEBHOOK_URL
+加载时校验必填字段，出错抛出 SettingsError。
+
+多套配置（profile）:
+- DATABASE_PROFILES = {'primary': {...}, 'analytics': {'host': ...}}，只需写与DATABASE_CONFIG不同的字段
+- WEBHOOK_PROFILES = {'ops': [目标, ...]}，默认profile使用 WEBHOOK_TARGETS，未配置时只发送到 WEBHOOK_URL
+
+常驻进程（购买提醒、HTTP接口、实时采集）定期调用 reload_if_changed()，config.py修改后无需重启；
+delivery和db在配置版本变化后重新创建投递目标和连接。
+"""
+
+import os
+import copy
+import logging
+import threading
+import importlib.util
+from pathlib import Path
+
+SCRIPT_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PROFILE = 'default'
+
+# 常驻进程检查config.py是否修改的间隔（秒）
+RELOAD_INTERVAL = 30
+
+# 数据库配置必填字段
+REQUIRED_DB_KEYS = ('host', 'user', 'password', 'database')
+
+# 环境变量到数据库字段的映射
+DB_ENV = {
+    'ANA_DB_HOST': 'host',
+    'ANA_DB_PORT': 'port',
+    'ANA_DB_USER': 'user',
+    'ANA_DB_PASSWORD': 'password',
+    'ANA_DB_NAME': 'database',
+    'ANA_DB_CHARSET': 'charset',
+}
+
+# 可选参数及默认值
+DEFAULTS = {
+    'REPORT_REPLICAS': [],
+    'REPLICA_MAX_LAG': 30,
+    'REPLICA_CHECK_INTERVAL': 60,
+    'REPORT_READ_TIMEOUT': 120,
+    'REPORT_QUERY_TIMEOUT_MS': 60000,
+    'WEBHOOK_TARGETS': None,
+    'WEBHOOK_PROFILES': {},
+    'DATABASE_PROFILES': {},
+}
+
+logger = logging.getLogger(__name__)
+
+_settings = None
+_lock = threading.Lock()
+
+
+class SettingsError(ValueError):
+    """配置缺失或不合法"""
+
+
+def config_path():
+    return Path(os.environ.get('ANA_CONFIG_FILE') or SCRIPT_DIR / 'config.py')
+
+
+def read_config_file(path):
+    """执行config.py并返回其中的大写变量，文件不存在时返回空字典"""
+    if not path.exists():
+        return {}
+    spec = importlib.util.spec_from_file_location('_ana_config', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return {name: getattr(module, name) for name in dir(module) if name.isupper()}
+
+
+def validate_database(name, config):
+    missing = [key for key in REQUIRED_DB_KEYS if not config.get(key)]
+    if missing:
+        raise SettingsError(f"数据库配置 {name} 缺少字段: {', '.join(missing)}")
+    config.setdefault('charset', 'utf8mb4')
+    try:
+        config['port'] = int(config.get('port') or 3306)
+    except (TypeError, ValueError):
+        raise SettingsError(f"数据库配置 {name} 的port不是整数: {config.get('port')}")
+    return config
+
+
+def validate_targets(name, targets):
+    if not isinstance(targets, (list, tuple)) or not targets:
+        raise SettingsError(f"webhook配置 {name} 需要至少一个投递目标")
+    seen = set()
+    for target in targets:
+        target_type = target.get('type', 'wecom')
+        url = target.get('url')
+        if target_type in ('wecom', 'http') and not str(url or '').startswith(('http://', 'https://')):
+            raise SettingsError(f"webhook配置 {name} 的目标 {target.get('name')} url不合法: {url}")
+        # 投递结果按目标名汇总，未写name时使用类型名（与delivery.build_target一致）
+        target_name = target.get('name') or target_type
+        if target_name in seen:
+            raise SettingsError(f"webhook配置 {name} 中目标名重复: {target_name}，同类型的多个目标需要分别设置name")
+        seen.add(target_name)
+    return [dict(target) for target in targets]
+
+
+class Settings:
+    """一次加载得到的只读配置，version在每次重新加载后递增"""
+
+    def __init__(self, values, env=None, path=None, mtime=None, version=1):
+        self.values = values
+        self.env = os.environ if env is None else env
+        self.path = path
+        self.mtime = mtime
+        self.version = version
+        self._databases = {}
+        self._webhooks = {}
+        self._validate()
+
+    def get(self, name, default=None):
+        value = self.values.get(name, DEFAULTS.get(name, default))
+        return copy.deepcopy(value)
+
+    def _validate(self):
+        """加载时校验已配置的部分，缺少数据库配置的脚本（如只发webhook）在使用时才报错"""
+        for name in [DEFAULT_PROFILE] + list(self.get('DATABASE_PROFILES') or {}):
+            try:
+                self._databases[name] = self._build_database(name)
+            except SettingsError:
+                if name != DEFAULT_PROFILE:
+                    raise
+        self._webhooks[DEFAULT_PROFILE] = self._build_targets(DEFAULT_PROFILE)
+        for name in self.get('WEBHOOK_PROFILES') or {}:
+            self._webhooks[name] = self._build_targets(name)
+
+    def _build_database(self, profile):
+        config = self.get('DATABASE_CONFIG') or {}
+        for env_name, key in DB_ENV.items():
+            if self.env.get(env_name):
+                config[key] = self.env[env_name]
+        if profile != DEFAULT_PROFILE:
+            profiles = self.get('DATABASE_PROFILES') or {}
+            if profile not in profiles:
+                raise SettingsError(f"未配置数据库profile: {profile}")
+            config.update(profiles[profile])
+        return validate_database(profile, config)
+
+    def _build_targets(self, profile):
+        if profile == DEFAULT_PROFILE:
+            targets = self.get('WEBHOOK_TARGETS')
+            if not targets:
+                url = self.env.get('ANA_WEBHOOK_URL') or self.get('WEBHOOK_URL')
+                if not url:
+                    return None
+                targets = [{'type': 'wecom', 'name': 'default', 'url': url}]
+        else:
+            targets = (self.get('WEBHOOK_PROFILES') or {}).get(profile)
+            if targets is None:
+                raise SettingsError(f"未配置webhook profile: {profile}")
+        return validate_targets(profile, targets)
+
+    def database(self, profile=DEFAULT_PROFILE):
+        """数据库连接参数（副本）"""
+        if profile not in self._databases:
+            self._databases[profile] = self._build_database(profile)
+        return dict(self._databases[profile])
+
+    def webhook_targets(self, profile=DEFAULT_PROFILE):
+        """投递目标配置列表（副本）"""
+        targets = self._webhooks.get(profile)
+        if targets is None:
+            if profile == DEFAULT_PROFILE:
+                raise SettingsError("未配置webhook: 请在config.py中设置WEBHOOK_URL或WEBHOOK_TARGETS，或设置环境变量ANA_WEBHOOK_URL")
+            targets = self._build_targets(profile)
+        return [dict(target) for target in targets]
+
+    def report_settings(self):
+        return {
+            'replicas': self.get('REPORT_REPLICAS') or [],
+            'max_lag': self.get('REPLICA_MAX_LAG'),
+            'check_interval': self.get('REPLICA_CHECK_INTERVAL'),
+            'read_timeout': self.get('REPORT_READ_TIMEOUT'),
+            'query_timeout_ms': self.get('REPORT_QUERY_TIMEOUT_MS'),
+        }
+
+
+def load(path=None, env=None, version=1):
+    """从config.py和环境变量加载配置"""
+    path = Path(path) if path else config_path()
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        mtime = None
+    return Settings(read_config_file(path), env=env, path=path, mtime=mtime, version=version)
+
+
+def get_settings():
+    """当前进程的配置，第一次调用时加载"""
+    global _settings
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                _settings = load()
+    return _settings
+
+
+def reload_if_changed():
+    """config.py修改后重新加载，新配置校验失败时保留旧配置，返回是否已重新加载"""
+    global _settings
+    current = get_settings()
+    try:
+        mtime = current.path.stat().st_mtime
+    except FileNotFoundError:
+        mtime = None
+    if mtime == current.mtime:
+        return False
+
+    with _lock:
+        try:
+            _settings = load(current.path, version=current.version + 1)
+        except Exception as e:
+            logger.error(f"重新加载配置失败，继续使用旧配置: {e}")
+            current.mtime = mtime
+            return False
+    logger.info(f"配置已重新加载: {current.path}")
+    return True
+
+
+def reset(settings=None):
+    """替换当前进程的配置（测试用），None表示下次使用时重新加载"""
+    global _settings
+    with _lock:
+        _settings = settings
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告快照
+每次生成报告时把结构化指标（各分项条数、金额、观看分钟数、前几条明细）写入主库的
+ana_report_snapshots 表，每个 (报告类型, 窗口结束时间) 一行。
+报告中的"较昨日/较上周"直接读取24小时前、7天前的那一行，不再回查原始表。
+日报的登录和观看查询带 LIMIT 20，这两项只作记录，对比只计算注册、购买和金额。
+用法:
+    python3 snapshots.py show --days 7      # 最近7天的日报快照
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+from exporter import to_jsonable
+
+# 快照表
+SNAPSHOT_TABLE = 'ana_report_snapshots'
+
+# 查找对比快照时允许的时间偏差（定时任务可能晚几分钟启动）
+MATCH_TOLERANCE = timedelta(minutes=30)
+
+# 每个分项保存的明细条数
+TOP_ROWS = 3
+
+# 报告中对比的指标
+COMPARE_METRICS = (('new_users', '注册'), ('purchases', '购买'), ('revenue', '金额'))
+
+# 对比窗口
+COMPARE_OFFSETS = (('较昨日', timedelta(days=1)), ('较上周', timedelta(days=7)))
+
+CREATE_SNAPSHOT_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {SNAPSHOT_TABLE} (
+    report_type VARCHAR(16) NOT NULL,
+    window_end DATETIME NOT NULL,
+    window_start DATETIME NOT NULL,
+    new_users INT NOT NULL,
+    purchases INT NOT NULL,
+    revenue DECIMAL(12, 2) NOT NULL,
+    logins INT NOT NULL,
+    watches INT NOT NULL,
+    watch_minutes INT NOT NULL,
+    top_rows TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (report_type, window_end)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def extract_metrics(sections):
+    """从报告分项中提取快照指标
+
+    金额取已支付订单合计（paid_orders分项），购买明细按课程展开，一笔订单的多门课程会重复计入订单金额
+    """
+    purchases = sections.get('purchases') or []
+    paid_orders = sections.get('paid_orders') or [{}]
+    watches = sections.get('course_watches') or []
+    top_rows = {
+        'purchases': [{'product': p.get('product_name'), 'price': p.get('pay_price')} for p in purchases[:TOP_ROWS]],
+        'courses': [{'course': w.get('course_name'), 'minutes': w.get('viewing_time')} for w in watches[:TOP_ROWS]],
+    }
+    return {
+        'new_users': len(sections.get('new_users') or []),
+        'purchases': len(purchases),
+        'revenue': float(paid_orders[0].get('revenue') or 0),
+        'logins': len(sections.get('logins') or []),
+        'watches': len(watches),
+        'watch_minutes': int(sum(w.get('viewing_time') or 0 for w in watches)),
+        'top_rows': top_rows,
+    }
+
+
+class SnapshotStore:
+    """主库中的报告快照表"""
+
+    def __init__(self, conn=None):
+        self.conn = conn or db.connect()
+        self._table_ready = False
+
+    def ensure_table(self):
+        if not self._table_ready:
+            with self.conn.cursor() as cursor:
+                cursor.execute(CREATE_SNAPSHOT_TABLE)
+            self._table_ready = True
+
+    def save(self, report_type, window_start, window_end, metrics):
+        """写入一次报告的快照，同一窗口重复运行时覆盖"""
+        self.ensure_table()
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"""
+                REPLACE INTO {SNAPSHOT_TABLE}
+                    (report_type, window_end, window_start, new_users, purchases, revenue,
+                     logins, watches, watch_minutes, top_rows, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, [report_type, window_end, window_start, metrics['new_users'], metrics['purchases'],
+                  metrics['revenue'], metrics['logins'], metrics['watches'], metrics['watch_minutes'],
+                  json.dumps(metrics['top_rows'], ensure_ascii=False, default=to_jsonable), datetime.now()])
+        self.conn.commit()
+
+    def nearest(self, report_type, window_end, tolerance=MATCH_TOLERANCE):
+        """读取窗口结束时间最接近window_end（偏差不超过tolerance）的快照，没有时返回None"""
+        self.ensure_table()
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT * FROM {SNAPSHOT_TABLE}
+                WHERE report_type = %s AND window_end BETWEEN %s AND %s
+            """, [report_type, window_end - tolerance, window_end + tolerance])
+            rows = cursor.fetchall()
+        if not rows:
+            return None
+        return min(rows, key=lambda row: abs((row['window_end'] - window_end).total_seconds()))
+
+    def recent(self, report_type, since):
+        self.ensure_table()
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT * FROM {SNAPSHOT_TABLE}
+                WHERE report_type = %s AND window_end >= %s
+                ORDER BY window_end
+            """, [report_type, since])
+            return cursor.fetchall()
+
+    def comparisons(self, report_type, window_end, metrics):
+        """与24小时前、7天前的快照对比，返回 [(标签, {指标: 差值})]"""
+        results = []
+        for label, offset in COMPARE_OFFSETS:
+            previous = self.nearest(report_type, window_end - offset)
+            if previous:
+                results.append((label, {name: metrics[name] - float(previous[name])
+                                        for name, _ in COMPARE_METRICS}))
+        return results
+
+    def close(self):
+        self.conn.close()
+
+
+def format_delta(name, value):
+    if name == 'revenue':
+        return f"{'+' if value >= 0 else '-'}¥{abs(value):.0f}"
+    return f"{int(value):+d}"
+
+
+def format_comparisons(comparisons):
+    """格式化为一行，如 "较昨日 注册+3 购买-1 金额+¥200；较上周 ..." """
+    parts = []
+    for label, deltas in comparisons:
+        items = " ".join(f"{title}{format_delta(name, deltas[name])}" for name, title in COMPARE_METRICS)
+        parts.append(f"{label} {items}")
+    return "；".join(parts)
+
+
+def record_and_compare(report_type, window_start, window_end, sections):
+    """保存本次快照并返回对比结果，主库不可用时记录日志并返回空列表"""
+    store = None
+    try:
+        store = SnapshotStore()
+        metrics = extract_metrics(sections)
+        comparisons = store.comparisons(report_type, window_end, metrics)
+        store.save(report_type, window_start, window_end, metrics)
+        return comparisons
+    except Exception as e:
+        logger.warning(f"报告快照读写失败: {e}")
+        return []
+    finally:
+        if store:
+            store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='报告快照')
+    parser.add_argument('command', choices=['show'])
+    parser.add_argument('--type', default='daily')
+    parser.add_argument('--days', type=int, default=7)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = SnapshotStore()
+    try:
+        for row in store.recent(args.type, datetime.now() - timedelta(days=args.days)):
+            print(f"{row['window_end']:%m-%d %H:%M} 注册{row['new_users']} 购买{row['purchases']}笔"
+                  f"¥{float(row['revenue']):.0f} 登录{row['logins']} 观看{row['watches']}次{row['watch_minutes']}分钟")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -37,9 +37,8 @@ check_database() {
     echo "检查数据库连接..."
     cd "$SCRIPT_DIR"
     python3 -c "
-from webhook import UserActivityReporter
-reporter = UserActivityReporter()
-conn = reporter.get_db_connection()
+import db
+conn = db.get_db_connection()
 if conn:
     conn.close()
     print('数据库连接正常')
@@ -99,29 +98,14 @@ send_error_notification() {
     # 发送到企业微信
     cd "$SCRIPT_DIR"
     python3 -c "
-import requests
-import json
+import logging
+from delivery import broadcast
 
-url = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=d3ed6660-1f33-47cc-83dd-84423fc7f8ac'
-data = {
-    'msgtype': 'text',
-    'text': {
-        'content': '''$notification'''
-    }
-}
-
-try:
-    response = requests.post(url, json=data, timeout=30)
-    if response.status_code == 200:
-        result = response.json()
-        if result.get('errcode') == 0:
-            print('错误通知发送成功')
-        else:
-            print('错误通知发送失败:', result)
-    else:
-        print('HTTP请求失败:', response.status_code)
-except Exception as e:
-    print('发送错误通知失败:', e)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+if broadcast('''$notification'''):
+    print('错误通知发送成功')
+else:
+    print('错误通知发送失败')
 " >> "$LOG_DIR/webhook_runner.log" 2>&1
 }
 
@@ -134,6 +118,11 @@ main() {
         "run")
             run_webhook
             ;;
+        "resend")
+            # 重发最近一次缓存的报告，缓存有效期内不会重新查询数据库
+            cd "$SCRIPT_DIR"
+            python3 "$WEBHOOK_SCRIPT" --resend
+            ;;
         "test")
             health_check
             echo "执行测试..."
@@ -141,11 +130,12 @@ main() {
             python3 test_webhook.py
             ;;
         *)
-            echo "用法: $0 {health|run|test}"
+            echo "用法: $0 {health|run|resend|test}"
             echo ""
             echo "命令说明:"
             echo "  health - 执行健康检查"
             echo "  run    - 运行webhook脚本"  
+            echo "  resend - 重发最近一次报告（使用缓存）"
             echo "  test   - 运行测试脚本"
             echo ""
             echo "生产环境使用示例:"
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+activity_cdc.py的测试脚本
+单元测试不需要数据库；设置 CDC_TEST_MYSQL_HOST 等环境变量后，会在开启binlog的本地MySQL/MariaDB上做集成测试
+"""
+
+import sys
+import os
+import time
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from activity_cdc import rows_to_events, ActivityCounters, EventStreamWriter, BinlogActivityFeed, make_event
+
+
+class TestRowsToEvents(unittest.TestCase):
+    """binlog行变更转换测试"""
+
+    def test_register(self):
+        events = rows_to_events('wy_user', 'insert', {'uid': 1, 'add_time': 1757037600})
+        self.assertEqual([(e.kind, e.uid, e.ts) for e in events], [('register', 1, 1757037600)])
+
+    def test_every_login_is_kept(self):
+        """测试last_time的每次更新都记为登录"""
+        first = rows_to_events('wy_user', 'update', ({'uid': 1, 'last_time': 100}, {'uid': 1, 'last_time': 200}))
+        second = rows_to_events('wy_user', 'update', ({'uid': 1, 'last_time': 200}, {'uid': 1, 'last_time': 300}))
+        unrelated = rows_to_events('wy_user', 'update', ({'uid': 1, 'last_time': 300, 'nickname': 'a'},
+                                                         {'uid': 1, 'last_time': 300, 'nickname': 'b'}))
+        self.assertEqual([e.ts for e in first + second], [200, 300])
+        self.assertEqual(unrelated, [])
+
+    def test_order_paid_transition(self):
+        """测试订单从未支付变为已支付"""
+        before = {'id': 9, 'uid': 2, 'paid': 0, 'pay_price': Decimal('99.00'), 'pay_time': 0}
+        after = dict(before, paid=1, pay_time=1757037600)
+        events = rows_to_events('wy_store_order', 'update', (before, after))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].amount, 99.0)
+        self.assertEqual(rows_to_events('wy_store_order', 'update', (after, after)), [])
+
+    def test_deleted_purchase_ignored(self):
+        self.assertEqual(rows_to_events('wy_special_buy', 'insert', {'uid': 1, 'is_del': 1}), [])
+
+    def test_watch_progress(self):
+        """测试观看时长增量"""
+        events = rows_to_events('wy_special_watch', 'update',
+                                ({'uid': 1, 'special_id': 5, 'viewing_time': 10},
+                                 {'uid': 1, 'special_id': 5, 'viewing_time': 25}), event_time=1757037600)
+        self.assertEqual((events[0].kind, events[0].minutes), ('watch_time', 15.0))
+
+
+class TestActivityCounters(unittest.TestCase):
+    """计数器测试"""
+
+    def test_window_and_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            counters = ActivityCounters(path=os.path.join(tmp, 'counters.json'))
+            now = datetime.now().replace(second=0, microsecond=0)
+            ts = int(now.timestamp())
+            counters.add(make_event('order_paid', 1, ts - 3600, amount=99))
+            counters.add(make_event('order_paid', 2, ts - 60, amount=1))
+            counters.add(make_event('order_paid', 3, ts - 86400 * 2, amount=500))
+            counters.save()
+
+            loaded = ActivityCounters(path=os.path.join(tmp, 'counters.json')).load()
+            count, amount, _ = loaded.window('order_paid', now - timedelta(hours=6), now + timedelta(minutes=5))
+            self.assertEqual((count, amount), (2, 100.0))
+
+    def test_event_stream(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = EventStreamWriter(tmp)
+            writer.add(make_event('login', 1, 1757037600))
+            writer.close()
+            files = os.listdir(tmp)
+            self.assertEqual(len(files), 1)
+            with open(os.path.join(tmp, files[0]), encoding='utf-8') as f:
+                self.assertIn('"kind": "login"', f.read())
+
+
+class CollectSink:
+    def __init__(self):
+        self.events = []
+
+    def add(self, event):
+        self.events.append(event)
+
+    def save(self):
+        pass
+
+
+@unittest.skipUnless(os.getenv('CDC_TEST_MYSQL_HOST'), "未设置CDC_TEST_MYSQL_HOST，跳过binlog集成测试")
+class TestBinlogIntegration(unittest.TestCase):
+    """在本地开启binlog的MySQL/MariaDB上验证采集"""
+
+    def setUp(self):
+        import db
+        self.db_config = {
+            'host': os.getenv('CDC_TEST_MYSQL_HOST'),
+            'port': int(os.getenv('CDC_TEST_MYSQL_PORT', '3306')),
+            'user': os.getenv('CDC_TEST_MYSQL_USER', 'root'),
+            'password': os.getenv('CDC_TEST_MYSQL_PASSWORD', ''),
+            'database': os.getenv('CDC_TEST_MYSQL_DATABASE', 'ana_cdc_test'),
+            'charset': 'utf8mb4',
+        }
+        self.conn = db.connect(self.db_config)
+        self.conn.autocommit(True)
+        with self.conn.cursor() as cursor:
+            cursor.execute("CREATE TABLE IF NOT EXISTS wy_user (uid INT PRIMARY KEY, add_time INT, last_time INT)")
+            cursor.execute("DELETE FROM wy_user")
+            cursor.execute("SHOW MASTER STATUS")
+            status = cursor.fetchone()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.tmp.name, 'position.json')
+        with open(self.checkpoint, 'w') as f:
+            f.write('{"log_file": "%s", "log_pos": %d}' % (status['File'], status['Position']))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_insert_and_login_updates(self):
+        now = int(time.time())
+        with self.conn.cursor() as cursor:
+            cursor.execute("INSERT INTO wy_user VALUES (1, %s, %s)", (now, now))
+            cursor.execute("UPDATE wy_user SET last_time = %s WHERE uid = 1", (now + 10,))
+            cursor.execute("UPDATE wy_user SET last_time = %s WHERE uid = 1", (now + 20,))
+
+        sink = CollectSink()
+        feed = BinlogActivityFeed([sink], db_config=self.db_config, checkpoint_path=self.checkpoint)
+        feed.run(blocking=False)
+
+        self.assertEqual([e.kind for e in sink.events], ['register', 'login', 'login'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+anomaly.py的测试脚本
+验证时段基线、异常判断、日报窗口检查和每小时检查的数值来源
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import anomaly
+from anomaly import AnomalyDetector, report_anomalies, slot_of, run_check
+from activity_cdc import ActivityCounters, make_event
+from event_store import EventStore, import_history
+
+
+class TestAnomalyDetector(unittest.TestCase):
+    """异常检测测试"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'baseline.json')
+        self.detector = AnomalyDetector(self.path)
+        # 过去6周每天的数据: 购买每小时10笔左右
+        self.start = datetime(2025, 7, 7)
+        hour = self.start
+        while hour < self.start + timedelta(weeks=6):
+            self.detector.process_hour(hour, {'purchases': 10 + hour.day % 3, 'registrations': 5})
+            hour += timedelta(hours=1)
+        self.next_hour = hour
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_normal_hour_not_flagged(self):
+        """测试正常波动不报警"""
+        self.assertEqual(self.detector.process_hour(self.next_hour, {'purchases': 11, 'registrations': 5}), [])
+
+    def test_outage_flagged(self):
+        """测试购买骤降报警"""
+        anomalies = self.detector.process_hour(self.next_hour, {'purchases': 0, 'registrations': 5})
+        self.assertEqual([a['metric'] for a in anomalies], ['purchases'])
+        self.assertLess(anomalies[0]['z'], 0)
+
+    def test_slot_needs_samples(self):
+        """测试样本不足的时段不判断"""
+        detector = AnomalyDetector(self.path)
+        detector.process_hour(self.next_hour, {'purchases': 10})
+        self.assertIsNone(detector.check('purchases', 0, self.next_hour, self.next_hour + timedelta(hours=1)))
+
+    def test_window_not_on_the_hour(self):
+        """测试不在整点开始的窗口首尾小时按比例计入，不多算一个时段"""
+        detector = AnomalyDetector(self.path)
+        hour = self.start
+        while hour < self.next_hour:
+            detector.process_hour(hour, {'purchases': 10})
+            hour += timedelta(hours=1)
+
+        start = self.next_hour.replace(hour=13, minute=5)
+        mean, _ = detector.expected('purchases', start, start + timedelta(hours=1))
+        self.assertAlmostEqual(mean, 10.0)
+        self.assertIsNone(detector.check('purchases', 5, start, start + timedelta(hours=1)))
+
+        end = self.next_hour.replace(hour=10, second=3)
+        mean, _ = detector.expected('purchases', end - timedelta(days=1), end)
+        self.assertAlmostEqual(mean, 240.0)
+
+    def test_report_window_uses_summed_baseline(self):
+        """测试日报窗口按24个时段基线之和判断，并能从文件恢复"""
+        self.detector.save()
+        end = self.next_hour + timedelta(hours=10)
+        sections = {'new_users': [{}] * 120, 'purchases': [{'pay_price': 0}] * 30}
+
+        anomalies = report_anomalies(sections, end - timedelta(days=1), end, path=self.path)
+
+        self.assertEqual([a['metric'] for a in anomalies], ['purchases'])
+
+    def test_report_revenue_from_paid_orders(self):
+        """测试日报金额取已支付订单合计，不按购买明细相加"""
+        for week in range(5):
+            hour = self.next_hour - timedelta(weeks=week + 1)
+            for offset in range(24):
+                self.detector.update('revenue', slot_of(hour + timedelta(hours=offset)), 100)
+        self.detector.save()
+        end = self.next_hour + timedelta(hours=24)
+        # 一笔2400元的订单包含3门课程，明细相加为7200
+        purchases = [{'pay_price': 2400}] * 3
+        sections = {'purchases': purchases, 'paid_orders': [{'orders': 1, 'revenue': 2400}]}
+        anomalies = report_anomalies(sections, end - timedelta(days=1), end, path=self.path)
+        self.assertNotIn('revenue', [a['metric'] for a in anomalies])
+
+        sections['paid_orders'] = [{'orders': 3, 'revenue': 7200}]
+        anomalies = report_anomalies(sections, end - timedelta(days=1), end, path=self.path)
+        self.assertIn('revenue', [a['metric'] for a in anomalies])
+
+
+class TestRunCheck(unittest.TestCase):
+    """每小时检查的数值来源"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.now = datetime(2025, 9, 5, 10, 5)
+        self.counters = ActivityCounters(os.path.join(self.tmp.name, 'counters.json'))
+        # 计数器从8点20分开始采集
+        for minute in range(20, 120, 10):
+            self.counters.add(make_event('purchase', 1, int((datetime(2025, 9, 5, 8) + timedelta(minutes=minute)).timestamp())))
+        self.mysql_hours = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fake_mysql(self, conn, start, end):
+        self.mysql_hours.append(start.hour)
+        return {'purchases': 7.0}
+
+    def run_check(self, source, counters, catchup_hours=4):
+        with patch.object(anomaly, 'STATE_DIR', Path(self.tmp.name)), \
+                patch.object(anomaly, 'open_source', return_value=counters), \
+                patch.object(anomaly, 'values_from_mysql', side_effect=self.fake_mysql), \
+                patch('db.connect_report'), patch('delivery.broadcast'):
+            run_check(self.now, source=source, catchup_hours=catchup_hours)
+        return AnomalyDetector(os.path.join(self.tmp.name, 'anomaly_baseline.json')).load()
+
+    def test_hours_before_counters_use_mysql(self):
+        """计数器开始采集之前的小时改查MySQL，不把0计入基线"""
+        detector = self.run_check('auto', self.counters)
+        self.assertEqual(self.mysql_hours, [6, 7, 8])
+        self.assertEqual(detector.baselines['purchases'][slot_of(datetime(2025, 9, 5, 7))][0], 7.0)
+        self.assertEqual(detector.baselines['purchases'][slot_of(datetime(2025, 9, 5, 9))][0], 6)
+        self.assertEqual(detector.last_hour, datetime(2025, 9, 5, 9))
+
+    def test_expired_buckets_use_mysql(self):
+        """超过计数器保留期（8天）的小时改查MySQL"""
+        self.counters.add(make_event('purchase', 1, int(datetime(2025, 8, 20, 8).timestamp())))
+        self.run_check('auto', self.counters, catchup_hours=24 * 9)
+        # 8月27日10点到8月28日10点（保留期起点10:05之前）共25个小时
+        self.assertEqual(len(self.mysql_hours), 25)
+
+    def test_mysql_values_skip_logins(self):
+        """MySQL的last_time不能还原登录次数，不更新登录基线"""
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchone.return_value = {'v': 3}
+        values = anomaly.values_from_mysql(conn, datetime(2025, 9, 5, 8), datetime(2025, 9, 5, 9))
+        self.assertNotIn('logins', values)
+        self.assertEqual(values['purchases'], 3.0)
+
+    def test_imported_store_days_skip_logins(self):
+        """事件库中从MySQL导入的日期没有登录事件，不把0计入登录基线"""
+        store = EventStore(os.path.join(self.tmp.name, 'event_store'))
+        try:
+            with patch('backfill.keyset_scan', return_value=iter([])):
+                import_history(store, None, datetime(2025, 9, 5, 6), datetime(2025, 9, 5, 8))
+            store.add(make_event('login', 1, int(datetime(2025, 9, 5, 8, 30).timestamp())))
+            store.save()
+            detector = self.run_check('store', store)
+        finally:
+            store.close()
+        self.assertEqual(self.mysql_hours, [])
+        logins = detector.baselines['logins']
+        self.assertNotIn(slot_of(datetime(2025, 9, 5, 6)), logins)
+        self.assertNotIn(slot_of(datetime(2025, 9, 5, 7)), logins)
+        self.assertEqual(logins[slot_of(datetime(2025, 9, 5, 8))][0], 1)
+        self.assertEqual(logins[slot_of(datetime(2025, 9, 5, 9))][0], 0)
+
+    def test_store_without_segments_uses_mysql(self):
+        """事件库没有对应日期的段时改查MySQL"""
+        store = EventStore(os.path.join(self.tmp.name, 'event_store'))
+        try:
+            store.add(make_event('purchase', 1, int(datetime(2025, 9, 5, 8, 30).timestamp())))
+            store.save()
+            self.now = datetime(2025, 9, 5, 2, 5)
+            self.run_check('store', store)
+            # 9月4日没有段，9月5日已有追加段
+            self.assertEqual(self.mysql_hours, [22, 23])
+            self.mysql_hours = []
+            self.now = datetime(2025, 9, 5, 10, 5)
+            self.run_check('store', store)
+            self.assertEqual(self.mysql_hours, [])
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+api_server.py的测试脚本
+验证TTL缓存合并并发请求、ETag条件请求、窗口参数和最近一次日报
+"""
+
+import sys
+import os
+import time
+import json
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import api_server
+import report_cache
+from api_server import ActivityApi, TTLCache, make_handler, parse_window
+from report_cache import ReportCache, make_key
+
+
+class FakeApi(ActivityApi):
+    """不连接数据库的接口，记录查询次数"""
+
+    def __init__(self):
+        super().__init__(pool=object(), cache=TTLCache())
+        self.calls = 0
+
+    def load_activity(self, hours):
+        self.calls += 1
+        time.sleep(0.05)
+        return api_server.json_body({'hours': hours, 'calls': self.calls})
+
+
+class TestApiServer(unittest.IsolatedAsyncioTestCase):
+    """HTTP接口测试"""
+
+    async def asyncSetUp(self):
+        self.api = FakeApi()
+        self.server = await asyncio.start_server(make_handler(self.api), '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def request(self, path, headers=None):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        lines = [f"GET {path} HTTP/1.1", "Host: localhost"] + [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+        data = await reader.read()
+        writer.close()
+        head, _, body = data.partition(b'\r\n\r\n')
+        head_lines = head.decode('latin-1').split('\r\n')
+        response_headers = dict(line.split(': ', 1) for line in head_lines[1:])
+        return int(head_lines[0].split()[1]), response_headers, body
+
+    async def test_concurrent_requests_share_one_query(self):
+        """测试TTL内的并发请求只查询一次"""
+        results = await asyncio.gather(*[self.request('/activity?window=6h') for _ in range(5)])
+        self.assertEqual(self.api.calls, 1)
+        self.assertTrue(all(status == 200 for status, _, _ in results))
+        self.assertEqual(len({body for _, _, body in results}), 1)
+
+    async def test_etag_not_modified(self):
+        """测试带If-None-Match的请求返回304"""
+        status, headers, _ = await self.request('/activity?window=12h')
+        status, _, body = await self.request('/activity?window=12h', {'If-None-Match': headers['ETag']})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    async def test_bad_window_and_unknown_path(self):
+        """测试非法窗口和未知路径"""
+        self.assertEqual((await self.request('/activity?window=500h'))[0], 400)
+        self.assertEqual((await self.request('/nothing'))[0], 404)
+
+    async def test_latest_report(self):
+        """测试最近一次日报在报告缓存过期后仍能读取，没有日报时返回404"""
+        with tempfile.TemporaryDirectory() as tmp, patch.object(report_cache, 'CACHE_DIR', Path(tmp)):
+            self.assertEqual((await self.request('/report/latest'))[0], 404)
+
+            end = datetime(2025, 9, 5, 10, 0)
+            ReportCache().put(make_key('daily', end - timedelta(days=1), end), payload="📊 日报")
+            self.api.cache = TTLCache()
+            with patch('report_cache.time.time', return_value=time.time() + 601):
+                status, _, body = await self.request('/report/latest')
+
+        self.assertEqual(status, 200)
+        data = json.loads(body)
+        self.assertEqual(data['payload'], "📊 日报")
+        self.assertEqual(data['key']['end'], '2025-09-05 10:00')
+
+    def test_parse_window(self):
+        """测试窗口参数格式"""
+        self.assertEqual(parse_window('24h'), 24)
+        self.assertEqual(parse_window('3'), 3)
+        with self.assertRaises(ValueError):
+            parse_window('0h')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+backfill.py的测试脚本
+验证键集分页、维度补齐和断点续跑
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import backfill
+from backfill import keyset_scan, DimensionCache, Checkpoint, day_windows
+
+
+class FakeCursor:
+    """按键集条件在内存中过滤行的游标"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self.conn.queries.append((sql, params))
+        if 'IN (' in sql:
+            self.result = [r for r in self.conn.rows if r['uid'] in params]
+            return
+        start, end, last_time, _, last_key, limit = params
+        rows = [r for r in self.conn.rows
+                if start <= r['add_time'] < end and (r['add_time'], r['id']) > (last_time, last_key)]
+        self.result = sorted(rows, key=lambda r: (r['add_time'], r['id']))[:limit]
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class TestKeysetScan(unittest.TestCase):
+    """键集分页测试"""
+
+    def test_pages_cover_window_once(self):
+        """测试相同时间戳的行跨页时不重复、不遗漏"""
+        rows = [{'id': i, 'uid': i, 'add_time': 100 + i // 3} for i in range(1, 11)]
+        rows.append({'id': 99, 'uid': 99, 'add_time': 200})
+        conn = FakeConnection(rows)
+
+        pages = list(keyset_scan(conn, 't', ['id', 'uid', 'add_time'], 'add_time', 'id', 100, 110, page_size=4))
+
+        self.assertEqual([len(p) for p in pages], [4, 4, 2])
+        self.assertEqual([r['id'] for p in pages for r in p], list(range(1, 11)))
+
+    def test_dimension_lookup_cached(self):
+        """测试已补齐的维度不重复查询"""
+        conn = FakeConnection([{'uid': 1, 'phone': '138'}, {'uid': 2, 'phone': '139'}])
+        dims = DimensionCache(conn)
+        dims.load_users([1, 2, 3])
+        dims.load_users([1, 2, 3])
+
+        self.assertEqual(len(conn.queries), 1)
+        self.assertEqual(dims.users[1]['phone'], '138')
+        self.assertIsNone(dims.users[3])
+
+    def test_restored_snapshot_skips_queries(self):
+        """测试工作进程恢复预读的维度后不再查询"""
+        source = DimensionCache(FakeConnection([{'uid': 1, 'phone': '138'}]))
+        source.load_users([1])
+
+        conn = FakeConnection([])
+        dims = DimensionCache(conn).restore(source.snapshot())
+        dims.load_users([1])
+
+        self.assertEqual(conn.queries, [])
+        self.assertEqual(dims.users[1]['phone'], '138')
+
+
+class TestRender(unittest.TestCase):
+    """回填报告渲染测试"""
+
+    def test_daily_without_anomaly_check(self):
+        """测试回填的历史日报不与当前基线比较"""
+        sections = {'new_users': [{'uid': 1, 'phone': '13800138000', 'wechat_name': '小明'}],
+                    'purchases': [], 'logins': [], 'course_watches': []}
+        with patch('db.load_database_config', return_value={}), \
+                patch('webhook.load_detail_limit', return_value=5), \
+                patch('webhook.report_anomalies') as check:
+            report = backfill.render('daily', datetime(2025, 8, 2, 10), sections)
+
+        check.assert_not_called()
+        self.assertEqual(report, "📊 6页网24小时活动报告(08-02 10:00)\n🆕 新注册1人：微信:小明 手机:8000")
+
+
+class TestCheckpoint(unittest.TestCase):
+    """断点续跑测试"""
+
+    def test_day_windows(self):
+        """测试每天的报告窗口"""
+        day = datetime(2025, 8, 1)
+        self.assertEqual(day_windows(day, 'daily'), [datetime(2025, 8, 2)])
+        self.assertEqual(len(day_windows(day, '6h')), 4)
+
+    def test_resume_skips_done_days(self):
+        """测试已完成的日期不会重新生成"""
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch.object(backfill, 'STATE_DIR', backfill.Path(tmp)), \
+                    patch.object(backfill, 'ProcessPoolExecutor') as mock_pool:
+                Checkpoint('daily').mark('2025-08-01')
+                failed = backfill.run_backfill(datetime(2025, 8, 1), datetime(2025, 8, 1), 'daily', 2, tmp)
+
+            self.assertEqual(failed, [])
+            mock_pool.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
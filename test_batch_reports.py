@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+batch_reports.py的测试脚本
+验证工作进程恢复预读维度、窗口和课程任务的汇总，以及小进程池按任务顺序合并结果
+"""
+
+import re
+import sys
+import os
+import unittest
+import multiprocessing
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+import batch_reports
+from batch_reports import BatchReportRunner, window_task, course_task, _init_worker
+
+START = datetime(2025, 9, 1, 0, 0)
+T = int(START.timestamp())
+HOUR = 3600
+
+TABLES = {
+    'wy_user': [
+        {'uid': 1, 'add_time': T + 600, 'last_time': T + 600, 'status': 1, 'nickname': '新用户',
+         'phone': '13800138001', 'wechat_name': None, 'openid': None},
+        {'uid': 2, 'add_time': T - 3 * 86400, 'last_time': T + HOUR + 50, 'status': 1, 'nickname': '老用户',
+         'phone': '13800138002', 'wechat_name': '老用户', 'openid': 'o2'},
+    ],
+    'wy_store_order': [
+        {'id': 1, 'order_id': 'A1', 'uid': 1, 'pay_price': 99, 'paid': 1, 'add_time': T + 700},
+        {'id': 2, 'order_id': 'A2', 'uid': 2, 'pay_price': 199, 'paid': 1, 'add_time': T + HOUR + 100},
+        {'id': 3, 'order_id': 'A3', 'uid': 2, 'pay_price': 299, 'paid': 0, 'add_time': T + 2 * HOUR + 10},
+    ],
+    'wy_special_buy': [
+        {'id': 1, 'uid': 1, 'special_id': 12, 'order_id': 'A1', 'add_time': T + 700, 'is_del': 0},
+        {'id': 2, 'uid': 2, 'special_id': 12, 'order_id': 'A3', 'add_time': T + 2 * HOUR + 10, 'is_del': 1},
+    ],
+    'wy_special_watch': [
+        {'id': 1, 'uid': 1, 'special_id': 12, 'viewing_time': 30, 'percentage': 50, 'is_complete': 0,
+         'add_time': T + 800},
+        {'id': 2, 'uid': 2, 'special_id': 15, 'viewing_time': 45, 'percentage': 100, 'is_complete': 1,
+         'add_time': T + HOUR + 200},
+        {'id': 3, 'uid': 2, 'special_id': 15, 'viewing_time': 10, 'percentage': 20, 'is_complete': 0,
+         'add_time': T + 4 * HOUR},
+    ],
+    'wy_special': [
+        {'id': 12, 'title': '课程A', 'is_del': 0},
+        {'id': 15, 'title': '课程B', 'is_del': 0},
+    ],
+}
+
+
+def matches(row, conditions):
+    ops = {'=': lambda a, b: a == b, '<': lambda a, b: a < b}
+    return all(ops[op](row[col], int(value)) for col, op, value in conditions)
+
+
+class FakeCursor:
+    """在内存表上执行batch_reports/backfill用到的几种查询"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        table = re.search(r'FROM (\w+)', sql).group(1)
+        if 'UNION' in sql:
+            self.conn.queries.append(f'union:{table}')
+            values, column = set(), None
+            parts = re.findall(r'SELECT (\w+) FROM (\w+) WHERE (\w+) >= %s AND \w+ < %s((?: AND \w+ = \d+)*)', sql)
+            for i, (column, name, time_col, extra) in enumerate(parts):
+                start, end = params[2 * i:2 * i + 2]
+                conditions = re.findall(r'(\w+) (=) (\d+)', extra)
+                values.update(r[column] for r in TABLES[name]
+                              if start <= r[time_col] < end and matches(r, conditions))
+            self.result = [{column: v} for v in sorted(values)]
+        elif ' IN (' in sql:
+            self.conn.queries.append(f'lookup:{table}')
+            key = re.search(r'WHERE (?:\w+\.)?(\w+) IN', sql).group(1)
+            self.result = [dict(r) for r in TABLES.get(table, []) if r.get(key) in params]
+        elif not params:
+            self.conn.queries.append(f'all:{table}')
+            self.result = [dict(r) for r in TABLES[table]]
+        else:
+            self.conn.queries.append(f'scan:{table}')
+            time_col, key_col, extra = re.search(
+                r'WHERE (\w+) >= %s AND \w+ < %s AND \(\w+ > %s OR \(\w+ = %s AND (\w+) > %s\)\) (.*?)ORDER BY',
+                sql).groups()
+            start, end, last_time, _, last_key, limit = params
+            conditions = re.findall(r'(\w+) (=|<) (\d+)', extra)
+            rows = [r for r in TABLES[table] if start <= r[time_col] < end and matches(r, conditions)
+                    and (r[time_col], r[key_col]) > (last_time, last_key)]
+            self.result = [dict(r) for r in sorted(rows, key=lambda r: (r[time_col], r[key_col]))[:limit]]
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+        self.autocommit_mode = False
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def autocommit(self, value):
+        self.autocommit_mode = value
+
+    def close(self):
+        self.closed = True
+
+
+def window_summary(new_users=0, purchases=0, revenue=0, logins=0, watches=0, watch_minutes=0):
+    return {'new_users': new_users, 'purchases': purchases, 'revenue': revenue, 'logins': logins,
+            'watches': watches, 'watch_minutes': watch_minutes}
+
+
+EXPECTED_WINDOWS = [
+    (START + timedelta(hours=1), window_summary(new_users=1, purchases=1, revenue=99, watches=1, watch_minutes=30)),
+    (START + timedelta(hours=2), window_summary(purchases=1, revenue=199, logins=1, watches=1, watch_minutes=45)),
+    (START + timedelta(hours=3), window_summary()),
+]
+
+EXPECTED_COURSES = {
+    12: {'special_id': 12, 'title': '课程A', 'watches': 1, 'viewers': 1, 'watch_minutes': 30,
+         'completed': 0, 'purchases': 1, 'revenue': 99},
+    15: {'special_id': 15, 'title': '课程B', 'watches': 1, 'viewers': 1, 'watch_minutes': 45,
+         'completed': 1, 'purchases': 0, 'revenue': 0},
+}
+
+
+class TestWorkerTasks(unittest.TestCase):
+    """在当前进程内执行工作进程的初始化和任务"""
+
+    def setUp(self):
+        self.connections = []
+        patcher = patch.object(db, 'connect_report', side_effect=self.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        worker = patch.dict(batch_reports._worker, clear=True)
+        worker.start()
+        self.addCleanup(worker.stop)
+        self.runner = BatchReportRunner(START, START + timedelta(hours=3), workers=2, page_size=1)
+
+    def connect(self):
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+    def test_prefetch_snapshot(self):
+        """主进程预读全部课程和范围内活跃用户，用完关闭连接"""
+        snapshot = self.runner.prefetch()
+        self.assertEqual(set(snapshot['users']), {1, 2})
+        self.assertEqual(set(snapshot['specials']), {12, 15})
+        self.assertTrue(self.connections[0].closed)
+
+    def test_init_worker_restores_snapshot(self):
+        """工作进程恢复预读的维度，任务中不再查询用户和课程"""
+        _init_worker(self.runner.prefetch(), 1)
+        conn = batch_reports._worker['conn']
+        self.assertTrue(conn.autocommit_mode)
+        self.assertEqual(batch_reports._worker['page_size'], 1)
+        self.assertEqual(set(batch_reports._worker['dims'].users), {1, 2})
+
+        self.assertEqual(window_task((START, START + timedelta(hours=1))), EXPECTED_WINDOWS[0][1])
+        self.assertEqual(course_task((12, T, T + 3 * HOUR)), EXPECTED_COURSES[12])
+        self.assertNotIn('lookup:wy_user', conn.queries)
+        self.assertNotIn('lookup:wy_special', conn.queries)
+        # 课程的订单金额不在预读范围内，按需补齐
+        self.assertIn('lookup:wy_store_order', conn.queries)
+
+    def test_window_task_bounds(self):
+        """窗口为 (start, end]，未支付订单不计入"""
+        _init_worker(self.runner.prefetch(), 100)
+        for window_end, summary in EXPECTED_WINDOWS:
+            self.assertEqual(window_task((window_end - timedelta(hours=1), window_end)), summary)
+
+    def test_course_task_unknown_title(self):
+        _init_worker({'users': {}, 'specials': {}, 'order_prices': {}, 'order_products': {}}, 100)
+        result = course_task((99, T, T + 3 * HOUR))
+        self.assertEqual((result['title'], result['watches'], result['revenue']), ("课程99", 0, 0))
+
+    def test_map_empty_tasks(self):
+        """没有任务时不预读也不启动进程池"""
+        with patch.object(batch_reports, 'ProcessPoolExecutor') as pool:
+            self.assertEqual(self.runner.map(window_task, []), [])
+        pool.assert_not_called()
+        self.assertEqual(self.connections, [])
+
+    def test_active_courses(self):
+        self.assertEqual(self.runner.active_courses(), [12, 15])
+        self.assertTrue(self.connections[0].closed)
+
+
+@unittest.skipUnless(multiprocessing.get_start_method() == 'fork', "需要fork启动的工作进程继承模拟连接")
+class TestProcessPool(unittest.TestCase):
+    """用模拟连接运行两个工作进程的进程池"""
+
+    def setUp(self):
+        patcher = patch.object(db, 'connect_report', new=FakeConnection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.runner = BatchReportRunner(START, START + timedelta(hours=3), workers=2, page_size=1)
+
+    def test_windows(self):
+        self.assertEqual(self.runner.windows(1), EXPECTED_WINDOWS)
+
+    def test_windows_partial_tail(self):
+        """不足一个窗口的尾部不生成"""
+        results = self.runner.windows(2)
+        self.assertEqual([end for end, _ in results], [START + timedelta(hours=2)])
+        self.assertEqual(results[0][1]['purchases'], 2)
+
+    def test_courses_in_task_order(self):
+        self.assertEqual(self.runner.courses(), [EXPECTED_COURSES[12], EXPECTED_COURSES[15]])
+        self.assertEqual(self.runner.courses([15, 12]), [EXPECTED_COURSES[15], EXPECTED_COURSES[12]])
+
+
+if __name__ == '__main__':
+    unittest.main()
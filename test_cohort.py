@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cohort.py的测试脚本
+验证留存计算、增量更新和状态持久化
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cohort import CohortStore, MISSING
+
+
+def ts(day, hour=12):
+    return int(datetime(day.year, day.month, day.day, hour).timestamp())
+
+
+class FakeConnection:
+    """按表名返回行，并按键集条件过滤"""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params):
+                table = sql.split('FROM')[1].split()[0]
+                time_col = sql.split('WHERE')[1].split()[0]
+                key_col = sql.split('ORDER BY')[1].split(',')[1].split()[0]
+                start, end, last_time, _, last_key, limit = params
+                rows = [r for r in conn.tables.get(table, [])
+                        if start <= r[time_col] < end and (r[time_col], r[key_col]) > (last_time, last_key)]
+                self.result = sorted(rows, key=lambda r: (r[time_col], r[key_col]))[:limit]
+
+            def fetchall(self):
+                return self.result
+
+        return Cursor()
+
+
+class TestCohortStore(unittest.TestCase):
+    """留存计算测试"""
+
+    def setUp(self):
+        self.monday = date(2025, 8, 4)
+        self.today = self.monday + timedelta(days=40)
+
+    def test_rolling_retention_and_conversion(self):
+        """测试D1/D7/D30滚动留存和购买转化"""
+        store = CohortStore()
+        day0 = self.monday.toordinal()
+        store.register(1, day0)
+        store.register(2, day0 + 1)
+        store.register(3, day0 + 2)
+        store.touch(1, day0 + 31)
+        store.touch(2, day0 + 8)
+        store.purchase(2, day0 + 3)
+
+        cohort = [c for c in store.cohorts(self.today, weeks=8) if c['week'] == self.monday][0]
+
+        self.assertEqual(cohort['size'], 3)
+        self.assertEqual(cohort['retained'], {1: 2, 7: 2, 30: 1})
+        self.assertEqual(cohort['eligible'], {1: 3, 7: 3, 30: 3})
+        self.assertEqual(cohort['buyers'], 1)
+
+    def test_incremental_update_and_reload(self):
+        """测试增量更新只读取新数据，保存后可恢复"""
+        day = self.monday
+        conn = FakeConnection({
+            'wy_user': [{'uid': 5, 'add_time': ts(day), 'last_time': ts(day + timedelta(days=2))}],
+            'wy_special_buy': [{'id': 1, 'uid': 5, 'add_time': ts(day + timedelta(days=1))}],
+        })
+        store = CohortStore()
+        self.assertEqual(store.update(conn, now=ts(self.today)), 3)
+        self.assertEqual(store.update(conn, now=ts(self.today)), 0)
+
+        conn.tables['wy_user'][0]['last_time'] = ts(day + timedelta(days=9))
+        self.assertEqual(store.update(conn, now=ts(self.today)), 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store.directory = CohortStore(tmp).directory
+            store.save()
+            loaded = CohortStore(tmp).load()
+
+        self.assertEqual(loaded.arrays['first_seen'][5], day.toordinal())
+        self.assertEqual(loaded.arrays['last_seen'][5], day.toordinal() + 9)
+        self.assertEqual(loaded.arrays['first_purchase'][5], day.toordinal() + 1)
+        self.assertEqual(loaded.arrays['first_seen'][4], MISSING)
+        self.assertEqual(loaded.cursors, store.cursors)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+course_stats.py的测试脚本
+验证本地汇总的增量替换和按时间范围查询
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from datetime import date, datetime, timedelta
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import course_stats
+from course_stats import CourseStatsStore, PROGRESS_COLUMNS, MINUTE_COLUMNS
+
+
+def make_row(special_id, watches, minutes, completed):
+    row = {'special_id': special_id, 'watches': watches, 'minutes': minutes, 'completed': completed}
+    row.update({c: 1 for c in PROGRESS_COLUMNS + MINUTE_COLUMNS})
+    return row
+
+
+class TestCourseStatsStore(unittest.TestCase):
+    """课程汇总测试"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CourseStatsStore(os.path.join(self.tmp.name, 'stats.db'))
+        self.day = date(2025, 8, 4)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_summary_counts_distinct_viewers_across_days(self):
+        """测试跨天汇总时观看人数去重"""
+        titles = [{'id': 7, 'title': '课程A'}]
+        self.store.replace_day(self.day, [make_row(7, 3, 90, 1)],
+                               [{'special_id': 7, 'uid': 1}, {'special_id': 7, 'uid': 2}], titles)
+        self.store.replace_day(self.day + timedelta(days=1), [make_row(7, 2, 30, 1)],
+                               [{'special_id': 7, 'uid': 2}], titles)
+
+        summary = self.store.summary(self.day, self.day + timedelta(days=6))
+
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]['title'], '课程A')
+        self.assertEqual(summary[0]['watches'], 5)
+        self.assertEqual(summary[0]['minutes'], 120)
+        self.assertEqual(summary[0]['viewers'], 2)
+        self.assertEqual(summary[0][PROGRESS_COLUMNS[0]], 2)
+
+    def test_replace_day_is_idempotent(self):
+        """测试重新汇总同一天会替换旧数据"""
+        self.store.replace_day(self.day, [make_row(7, 3, 90, 1)], [], [])
+        self.store.replace_day(self.day, [make_row(7, 4, 100, 2)], [], [])
+
+        summary = self.store.summary(self.day, self.day)
+        self.assertEqual(summary[0]['watches'], 4)
+        self.assertEqual(self.store.last_day(), self.day)
+
+    def test_recent_ranking_uses_window_end(self):
+        """测试排行按报告窗口结束时间取最近几天，而不是运行当天"""
+        for offset, minutes in ((0, 90), (7, 30)):
+            self.store.replace_day(self.day + timedelta(days=offset), [make_row(7 + offset, 1, minutes, 0)], [], [])
+        self.store.close()
+        path = self.store.path
+
+        ranking = course_stats.recent_ranking(days=7, path=path, end=datetime(2025, 8, 10, 22, 0))
+        self.assertEqual([row['special_id'] for row in ranking], [7])
+        ranking = course_stats.recent_ranking(days=7, path=path, end=datetime(2025, 8, 11, 10, 0))
+        self.assertEqual([row['special_id'] for row in ranking], [14])
+        # 窗口在零点结束时不包含当天
+        ranking = course_stats.recent_ranking(days=7, path=path, end=datetime(2025, 8, 11, 0, 0))
+        self.assertEqual([row['special_id'] for row in ranking], [7])
+
+    def test_update_resumes_from_last_day(self):
+        """测试增量更新从上次最后一天开始，之后每次重新汇总最近7天"""
+        self.store.replace_day(self.day, [], [], [])
+        aggregated = []
+
+        def fake_aggregate(conn, day):
+            aggregated.append(day)
+            return [], [], []
+
+        with patch.object(course_stats, 'aggregate_day', fake_aggregate):
+            days = course_stats.update(self.store, None, today=self.day + timedelta(days=10))
+
+        self.assertEqual(days, 11)
+        self.assertEqual(aggregated[0], self.day)
+
+        aggregated.clear()
+        with patch.object(course_stats, 'aggregate_day', fake_aggregate):
+            days = course_stats.update(self.store, None, today=self.day + timedelta(days=10))
+        self.assertEqual(days, 7)
+        self.assertEqual(aggregated[0], self.day + timedelta(days=4))
+
+    def test_update_refreshes_recent_days(self):
+        """测试最近7天的观看记录后来更新了时长和完课状态，重新汇总后反映到统计中"""
+        today = self.day + timedelta(days=10)
+        rows = {self.day + timedelta(days=8): [make_row(7, 1, 10, 0)]}
+
+        def fake_aggregate(conn, day):
+            return rows.get(day, []), [], []
+
+        with patch.object(course_stats, 'aggregate_day', fake_aggregate):
+            course_stats.update(self.store, None, today=today)
+            rows[self.day + timedelta(days=8)] = [make_row(7, 1, 45, 1)]
+            course_stats.update(self.store, None, today=today)
+
+        summary = self.store.summary(today - timedelta(days=6), today)
+        self.assertEqual((summary[0]['minutes'], summary[0]['completed']), (45, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+db.py的测试脚本
+验证报告连接的从库选择、主库回退、查询超时和连接池
+"""
+
+import sys
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+
+PRIMARY = {'host': 'primary', 'port': 3306, 'user': 'u', 'password': 'p', 'database': 'd', 'charset': 'utf8mb4'}
+
+
+def make_conn(host, lag):
+    """返回SHOW REPLICA STATUS结果为指定延迟的模拟连接"""
+    conn = MagicMock(name=host)
+    conn.host = host
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = None if host == 'primary' else {'Seconds_Behind_Source': lag}
+    return conn
+
+
+def make_settings(replicas, max_lag=30, check_interval=60):
+    return {'replicas': replicas, 'max_lag': max_lag, 'check_interval': check_interval,
+            'read_timeout': 5, 'query_timeout_ms': 1000}
+
+
+class TestReportConnection(unittest.TestCase):
+    """报告连接路由测试"""
+
+    def setUp(self):
+        patcher = patch.dict(db._replica_choices, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connected = []
+
+    def connect_with_lags(self, lags, replicas):
+        def fake_connect(config, read_timeout=None, connect_timeout=None):
+            self.connected.append(config['host'])
+            if lags.get(config['host']) == 'down':
+                raise ConnectionError("refused")
+            return make_conn(config['host'], lags.get(config['host']))
+
+        with patch.object(db, 'connect', side_effect=fake_connect), \
+                patch.object(db, 'load_report_settings', return_value=make_settings(replicas)):
+            return db.connect_report(PRIMARY)
+
+    def test_picks_least_lagged_replica(self):
+        """测试选择延迟最小的从库"""
+        conn = self.connect_with_lags({'r1': 12, 'r2': 3}, [{'host': 'r1'}, {'host': 'r2'}])
+        self.assertEqual(conn.host, 'r2')
+
+    def test_skips_lagging_and_unreachable_replicas(self):
+        """测试跳过延迟过大、复制中断和连不上的从库"""
+        conn = self.connect_with_lags({'r1': 300, 'r2': None, 'r3': 'down', 'r4': 0},
+                                      [{'host': h} for h in ('r1', 'r2', 'r3', 'r4')])
+        self.assertEqual(conn.host, 'r4')
+
+    def test_falls_back_to_primary(self):
+        """测试没有可用从库时回退主库"""
+        conn = self.connect_with_lags({'r1': 300}, [{'host': 'r1'}])
+        self.assertEqual(conn.host, 'primary')
+
+    def test_choice_reused_within_interval(self):
+        """测试同一进程内的后续报告连接直接连选中的从库，不再检查全部从库"""
+        replicas = [{'host': 'r1'}, {'host': 'r2'}]
+        self.connect_with_lags({'r1': 12, 'r2': 3}, replicas)
+        self.assertEqual(self.connected, ['r1', 'r2'])
+
+        self.connected.clear()
+        conn = self.connect_with_lags({'r1': 12, 'r2': 3}, replicas)
+        self.assertEqual(conn.host, 'r2')
+        self.assertEqual(self.connected, ['r2'])
+
+        # 回退主库的选择同样复用
+        self.connect_with_lags({'r3': 300}, [{'host': 'r3'}])
+        self.connected.clear()
+        conn = self.connect_with_lags({'r3': 300}, [{'host': 'r3'}])
+        self.assertEqual((conn.host, self.connected), ('primary', ['primary']))
+
+    def test_choice_expires_and_failed_replica_repicked(self):
+        """测试选择过期后重新检查，选中的从库连不上时立即重新选择"""
+        replicas = [{'host': 'r1'}, {'host': 'r2'}]
+        with patch.object(db.time, 'monotonic', return_value=1000.0) as clock:
+            self.connect_with_lags({'r1': 12, 'r2': 3}, replicas)
+            clock.return_value = 1061.0
+            self.connected.clear()
+            conn = self.connect_with_lags({'r1': 2, 'r2': 3}, replicas)
+            self.assertEqual((conn.host, self.connected), ('r1', ['r1', 'r2']))
+
+            self.connected.clear()
+            conn = self.connect_with_lags({'r1': 'down', 'r2': 3}, replicas)
+            self.assertEqual((conn.host, self.connected), ('r2', ['r1', 'r1', 'r2']))
+
+    def test_sets_statement_timeout(self):
+        """测试报告连接设置语句执行上限"""
+        conn = self.connect_with_lags({}, [])
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_any_call("SET SESSION MAX_EXECUTION_TIME = %s", [1000])
+
+    def test_mariadb_statement_timeout(self):
+        """测试MySQL语法不支持时改用max_statement_time"""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = [Exception("Unknown system variable"), None]
+        db.set_statement_timeout(conn, 2500)
+        cursor.execute.assert_called_with("SET SESSION max_statement_time = %s", [2.5])
+
+
+class TestConnectionPool(unittest.TestCase):
+    """连接池测试"""
+
+    def test_reuses_connection_with_autocommit(self):
+        """测试池中连接开启autocommit，归还后被复用"""
+        conns = []
+
+        def factory():
+            conns.append(MagicMock())
+            return conns[-1]
+
+        pool = db.ConnectionPool(size=2, factory=factory)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(len(conns), 1)
+        first.autocommit.assert_called_once_with(True)
+
+    def test_broken_connection_replaced(self):
+        """测试ping失败的空闲连接被替换，出错的连接不放回池中"""
+        pool = db.ConnectionPool(size=1, factory=MagicMock)
+        with pool.connection() as first:
+            first.ping.side_effect = ConnectionError("gone")
+        with pool.connection() as second:
+            self.assertIsNot(first, second)
+            second.autocommit.assert_called_once_with(True)
+        with self.assertRaises(ValueError):
+            with pool.connection() as third:
+                raise ValueError("boom")
+        with pool.connection() as fourth:
+            self.assertIsNot(third, fourth)
+
+
+if __name__ == "__main__":
+    unittest.main()
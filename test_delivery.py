@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+delivery.py的测试脚本
+验证多目标并发投递、重试和限速
+"""
+
+import sys
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import delivery
+from delivery import DeliveryTarget, WeComTarget, FileTarget, WebhookRouter, RateLimiter, build_target
+
+
+class SlowTarget(DeliveryTarget):
+    """按指定耗时完成发送的测试目标"""
+
+    def __init__(self, name, delay, success=True):
+        super().__init__(name, retries=0)
+        self.delay = delay
+        self.success = success
+        self.finished_at = None
+
+    def _send(self, message):
+        time.sleep(self.delay)
+        self.finished_at = time.monotonic()
+        return self.success, False
+
+
+def make_response(status_code, payload=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = payload or {}
+    return response
+
+
+class TestWebhookRouter(unittest.TestCase):
+    """路由器测试"""
+
+    def test_deliver_to_all_targets(self):
+        """测试投递到所有目标并返回各自结果"""
+        router = WebhookRouter([SlowTarget('a', 0), SlowTarget('b', 0, success=False)])
+        self.assertEqual(router.deliver("测试"), {'a': True, 'b': False})
+
+    def test_duplicate_names_rejected(self):
+        """测试目标重名时拒绝创建，避免其中一个的结果被覆盖"""
+        with self.assertRaises(ValueError):
+            WebhookRouter([SlowTarget('a', 0), SlowTarget('a', 0, success=False)])
+
+    def test_slow_target_does_not_delay_others(self):
+        """测试慢目标不影响其他目标"""
+        fast = SlowTarget('fast', 0)
+        slow = SlowTarget('slow', 0.3)
+        started = time.monotonic()
+        WebhookRouter([slow, fast]).deliver("测试")
+
+        self.assertLess(fast.finished_at - started, 0.2)
+        self.assertGreaterEqual(slow.finished_at - started, 0.3)
+
+    def test_file_target(self):
+        """测试文件目标"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report.log')
+            target = build_target({'type': 'file', 'name': 'archive', 'path': path})
+            self.assertIsInstance(target, FileTarget)
+            self.assertTrue(target.deliver("报告内容"))
+            with open(path, encoding='utf-8') as f:
+                self.assertIn("报告内容", f.read())
+
+    def test_unknown_target_type(self):
+        """测试未知目标类型"""
+        with self.assertRaises(ValueError):
+            build_target({'type': 'fax'})
+
+    @patch('delivery.load_target_configs')
+    def test_broadcast_reports_failure(self, mock_configs):
+        """测试任一目标失败时broadcast返回False"""
+        with tempfile.TemporaryDirectory() as tmp:
+            mock_configs.return_value = [
+                {'type': 'file', 'name': 'ok', 'path': os.path.join(tmp, 'a.log')},
+                {'type': 'file', 'name': 'bad', 'path': os.path.join(tmp, 'missing', 'b.log')},
+            ]
+            with patch.dict(delivery._routers, clear=True):
+                self.assertFalse(delivery.broadcast("测试"))
+
+
+class TestWeComTarget(unittest.TestCase):
+    """企业微信目标测试"""
+
+    @patch('delivery.time.sleep')
+    @patch('requests.Session.post')
+    def test_retry_on_rate_limit(self, mock_post, mock_sleep):
+        """测试45009限流后重试成功"""
+        mock_post.side_effect = [
+            make_response(200, {'errcode': 45009, 'errmsg': 'api freq out of limit'}),
+            make_response(200, {'errcode': 0, 'errmsg': 'ok'}),
+        ]
+        target = WeComTarget('bot', 'http://localhost/send', rate_per_minute=None)
+        self.assertTrue(target.deliver("测试"))
+        self.assertEqual(mock_post.call_count, 2)
+        mock_sleep.assert_called_once_with(delivery.DEFAULT_BACKOFF)
+
+    @patch('delivery.time.sleep')
+    @patch('requests.Session.post')
+    def test_retry_on_server_error(self, mock_post, mock_sleep):
+        """测试5xx按重试次数重试"""
+        mock_post.return_value = make_response(502)
+        target = WeComTarget('bot', 'http://localhost/send', retries=2, rate_per_minute=None)
+        self.assertFalse(target.deliver("测试"))
+        self.assertEqual(mock_post.call_count, 3)
+
+    @patch('delivery.time.sleep')
+    @patch('requests.Session.post')
+    def test_no_retry_on_invalid_key(self, mock_post, mock_sleep):
+        """测试密钥错误不重试"""
+        mock_post.return_value = make_response(200, {'errcode': 93000, 'errmsg': 'invalid webhook url'})
+        target = WeComTarget('bot', 'http://localhost/send', rate_per_minute=None)
+        self.assertFalse(target.deliver("测试"))
+        self.assertEqual(mock_post.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    def test_targets_have_separate_sessions(self):
+        """测试每个目标使用独立的连接池"""
+        a = WeComTarget('a', 'http://localhost/a')
+        b = WeComTarget('b', 'http://localhost/b')
+        self.assertIsNot(a.session, b.session)
+        self.assertIs(a.session, a.session)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """限速器测试"""
+
+    @patch('delivery.time.sleep')
+    def test_waits_when_bucket_empty(self, mock_sleep):
+        """测试令牌用完后等待"""
+        limiter = RateLimiter(2)
+        limiter.acquire()
+        limiter.acquire()
+        mock_sleep.side_effect = lambda seconds: setattr(limiter, 'tokens', 1)
+        limiter.acquire()
+        mock_sleep.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+event_store.py的测试脚本
+验证定长记录写入、窗口查询、封存合并（包括读取时并发封存）和与计数器一致的汇总格式
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from activity_cdc import make_event, ActivityCounters
+from event_store import EventStore, Segment, RECORD, import_history
+
+
+def ts(*args):
+    return int(datetime(*args).timestamp())
+
+
+class TestEventStore(unittest.TestCase):
+    """事件库读写"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = EventStore(self.tmp.name)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def add_events(self):
+        events = [
+            make_event('register', 1, ts(2025, 9, 1, 23, 50)),
+            make_event('order_paid', 1, ts(2025, 9, 2, 0, 10), amount=99.9),
+            make_event('login', 2, ts(2025, 9, 2, 8, 0)),
+            make_event('login', 2, ts(2025, 9, 2, 9, 0)),
+            make_event('watch', 3, ts(2025, 9, 2, 7, 0), special_id=12, minutes=25.5),
+        ]
+        for event in events:
+            self.store.add(event)
+        self.store.save()
+        return events
+
+    def test_window_crosses_days(self):
+        """窗口跨天时读取两天的段，边界为左闭右开"""
+        self.add_events()
+        summary = self.store.summary(datetime(2025, 9, 1, 23, 0), datetime(2025, 9, 2, 9, 0))
+        self.assertEqual(summary['register'][0], 1)
+        self.assertEqual(summary['order_paid'], (1, 99.9, 0.0))
+        self.assertEqual(summary['login'][0], 1)
+        self.assertEqual(summary['watch'][2], 25.5)
+
+    def test_compact_sorts_and_keeps_events(self):
+        """封存后记录按时间排序，查询结果不变"""
+        self.add_events()
+        start, end = datetime(2025, 9, 1), datetime(2025, 9, 3)
+        before = sorted(self.store.scan(start, end))
+        self.assertEqual(self.store.compact(today='20250903'), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, '20250902.log')))
+        self.assertEqual(sorted(self.store.scan(start, end)), before)
+
+        segment = Segment(self.store.path('20250902', 'seg'))
+        try:
+            times = [record[0] for record in segment.records()]
+        finally:
+            segment.close()
+        self.assertEqual(times, sorted(times))
+
+    def test_late_events_merged(self):
+        """封存后到达的同一天事件写入新的追加段，下次封存时合并"""
+        self.add_events()
+        self.store.compact(today='20250903')
+        self.store.add(make_event('login', 5, ts(2025, 9, 2, 12, 0)))
+        self.store.save()
+        window = (datetime(2025, 9, 2), datetime(2025, 9, 3))
+        self.assertEqual(self.store.window('login', *window)[0], 3)
+        self.store.compact(today='20250903')
+        self.assertEqual(self.store.window('login', *window)[0], 3)
+        self.assertEqual(self.store.distinct_uids('login', *window), {2, 5})
+
+    def test_scan_during_compaction(self):
+        """读取过程中另一个进程封存同一天，重新打开后不漏读也不重复读"""
+        self.add_events()
+        self.store.compact(today='20250903')
+        self.store.add(make_event('login', 5, ts(2025, 9, 2, 12, 0)))
+        self.store.save()
+        writer = self.store
+        compacted = []
+
+        class CompactingSegment(Segment):
+            """读取方打开旧的封存段之后，封存进程合并了追加段"""
+
+            def __init__(self, path):
+                super().__init__(path)
+                if not compacted:
+                    compacted.append(None)
+                    compacted[0] = writer.compact_day('20250902')
+
+        reader = EventStore(self.tmp.name)
+        with patch('event_store.Segment', CompactingSegment):
+            self.assertEqual(reader.window('login', datetime(2025, 9, 2), datetime(2025, 9, 3))[0], 3)
+        self.assertEqual(compacted, [5])
+
+    def test_covers(self):
+        """没有段文件的日期不算在事件库范围内"""
+        self.add_events()
+        self.assertTrue(self.store.covers(datetime(2025, 9, 2, 8), datetime(2025, 9, 2, 9)))
+        self.store.compact(today='20250903')
+        self.assertTrue(self.store.covers(datetime(2025, 9, 1, 23), datetime(2025, 9, 2, 1)))
+        self.assertFalse(self.store.covers(datetime(2025, 9, 3, 8), datetime(2025, 9, 3, 9)))
+
+    def test_imported_range_has_no_logins(self):
+        """从MySQL导入的时间范围只覆盖能导入的事件类型"""
+        with patch('backfill.keyset_scan', return_value=iter([])):
+            import_history(self.store, None, datetime(2025, 9, 2), datetime(2025, 9, 2, 12))
+        self.add_events()
+        start, end = datetime(2025, 9, 2, 8), datetime(2025, 9, 2, 9)
+        self.assertTrue(self.store.covers(start, end, kind='purchase'))
+        self.assertFalse(self.store.covers(start, end, kind='login'))
+        self.assertTrue(self.store.covers(datetime(2025, 9, 2, 12), datetime(2025, 9, 2, 13), kind='login'))
+
+    def test_partial_record_ignored(self):
+        """追加段末尾写了一半的记录不会被读取"""
+        self.add_events()
+        with open(self.store.path('20250902', 'log'), 'ab') as f:
+            f.write(b'\x00' * (RECORD.size // 2))
+        summary = self.store.summary(datetime(2025, 9, 2), datetime(2025, 9, 3))
+        self.assertEqual(summary['login'][0], 2)
+
+    def test_matches_counters(self):
+        """与实时计数器在分桶对齐的窗口上汇总一致"""
+        counters = ActivityCounters(path=os.path.join(self.tmp.name, 'counters.json'))
+        for event in self.add_events():
+            counters.add(event)
+        start, end = datetime(2025, 9, 1, 12, 0), datetime(2025, 9, 2, 12, 0)
+        self.assertEqual(self.store.summary(start, end), counters.summary(start, end))
+
+    def test_import_refuses_existing_days(self):
+        """已有数据的日期不允许重复导入"""
+        self.add_events()
+        with self.assertRaises(RuntimeError):
+            import_history(self.store, None, datetime(2025, 9, 2), datetime(2025, 9, 2) + timedelta(hours=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
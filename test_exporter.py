@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+exporter.py的测试脚本
+验证各导出格式的类型转换和分批写出（Parquet测试需要pyarrow）
+"""
+
+import sys
+import os
+import io
+import csv
+import gzip
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from decimal import Decimal
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import exporter
+from pymysql.constants import FIELD_TYPE
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+ROWS = [
+    {'uid': 1, 'pay_price': Decimal('19.90'), 'purchase_time': datetime(2025, 8, 1, 9, 30), 'products': '课程A'},
+    {'uid': 2, 'pay_price': Decimal('100.00'), 'purchase_time': datetime(2025, 8, 1, 10, 0), 'products': None},
+]
+
+# pymysql游标的字段描述: (名称, 类型, 显示长度, 内部长度, 精度, 小数位数, 可为NULL)
+DESCRIPTION = [
+    ('uid', FIELD_TYPE.LONG, None, 11, 11, 0, False),
+    ('pay_price', FIELD_TYPE.NEWDECIMAL, None, 12, 12, 2, True),
+    ('purchase_time', FIELD_TYPE.DATETIME, None, 19, 19, 0, True),
+    ('products', FIELD_TYPE.BLOB, None, 1024, 1024, 0, True),
+]
+
+
+def batches():
+    yield ROWS[:1]
+    yield ROWS[1:]
+
+
+class TestExporter(unittest.TestCase):
+    """导出格式测试"""
+
+    def test_json(self):
+        """测试JSON中Decimal写成数字、时间写成字符串"""
+        out = io.BytesIO()
+        exporter.write_json(out, {'hours': 6}, [('purchases', batches()), ('logins', iter([]))])
+        data = json.loads(out.getvalue().decode('utf-8'))
+
+        self.assertEqual(data['hours'], 6)
+        self.assertEqual(data['sections']['purchases'][0]['pay_price'], 19.9)
+        self.assertEqual(data['sections']['purchases'][1]['pay_price'], 100)
+        self.assertEqual(data['sections']['purchases'][0]['purchase_time'], '2025-08-01 09:30:00')
+        self.assertEqual(data['sections']['logins'], [])
+
+    def test_jsonl(self):
+        """测试每行一个对象并带分项名称"""
+        out = io.BytesIO()
+        exporter.write_jsonl(out, [('purchases', batches())])
+        lines = out.getvalue().decode('utf-8').splitlines()
+
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])['section'], 'purchases')
+
+    def test_csv_gzip(self):
+        """测试CSV保留Decimal精度并gzip压缩"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'purchases.csv.gz')
+            out, raw = exporter.open_output(path)
+            exporter.write_csv(out, batches())
+            exporter.close_output(out, raw)
+
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+
+        self.assertEqual(rows[0]['pay_price'], '19.90')
+        self.assertEqual(rows[1]['products'], '')
+        self.assertEqual(rows[1]['purchase_time'], '2025-08-01 10:00:00')
+
+    def test_csv_empty_section_header(self):
+        """测试分项没有数据时按字段描述写出表头"""
+        description = []
+
+        def empty():
+            description[:] = DESCRIPTION
+            return
+            yield
+
+        out = io.BytesIO()
+        exporter.write_csv(out, empty(), description)
+        self.assertEqual(out.getvalue().decode('utf-8'), "uid,pay_price,purchase_time,products\r\n")
+
+    @unittest.skipIf(pq is None, "未安装pyarrow")
+    def test_parquet_empty_section(self):
+        """测试分项没有数据时写出只有结构的有效Parquet文件"""
+        out = io.BytesIO()
+        exporter.write_parquet(out, iter([]), DESCRIPTION)
+        table = pq.read_table(io.BytesIO(out.getvalue()))
+
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema.names, ['uid', 'pay_price', 'purchase_time', 'products'])
+        self.assertEqual(str(table.schema.field('pay_price').type), 'decimal128(38, 2)')
+
+    @unittest.skipIf(pq is None, "未安装pyarrow")
+    def test_parquet_schema_from_description(self):
+        """测试Parquet列类型取自字段描述：第一批全为NULL的列、精度不同的Decimal都能写入后续批次"""
+        description = DESCRIPTION
+        later = [{'uid': 3, 'pay_price': Decimal('12345.5'), 'purchase_time': datetime(2025, 8, 1, 11, 0),
+                  'products': b'\xe8\xaf\xbe\xe7\xa8\x8bB'}]
+        out = io.BytesIO()
+        exporter.write_parquet(out, iter([ROWS[1:], later]), description)
+        table = pq.read_table(io.BytesIO(out.getvalue()))
+
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(str(table.schema.field('products').type), 'string')
+        self.assertEqual(table.column('products').to_pylist(), [None, '课程B'])
+        self.assertEqual(table.column('pay_price').to_pylist(), [Decimal('100.00'), Decimal('12345.50')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fake_wecom.py的测试脚本
+用本地模拟服务验证WeComTarget对5xx、45009限流、超时和超长报告的真实处理
+"""
+
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from delivery import WeComTarget
+from fake_wecom import FakeWeComServer, FaultConfig
+from bench_delivery import percentile, compare
+
+
+class TestFakeWeCom(unittest.TestCase):
+    """模拟服务与真实HTTP发送"""
+
+    def deliver(self, faults, message="测试消息", retries=2, timeout=5):
+        with FakeWeComServer(faults=faults) as server:
+            target = WeComTarget('fake', server.url, timeout=timeout, rate_per_minute=None,
+                                 retries=retries, backoff=0.01)
+            success = target.deliver(message)
+        return success, server
+
+    def test_ok(self):
+        """正常发送，服务端记录消息"""
+        success, server = self.deliver(FaultConfig())
+        self.assertTrue(success)
+        self.assertEqual(server.stats['ok'], 1)
+        self.assertEqual(server.messages[0]['text']['content'], "测试消息")
+
+    def test_server_error_retried(self):
+        """502会重试，重试次数用完后失败"""
+        success, server = self.deliver(FaultConfig(error_rate=1.0), retries=2)
+        self.assertFalse(success)
+        self.assertEqual(server.stats['requests'], 3)
+        self.assertEqual(server.stats['server_error'], 3)
+
+    def test_rate_limited_retried(self):
+        """45009限流会重试，窗口过去后成功"""
+        faults = FaultConfig(rate_limit=1, rate_window=0.05)
+        with FakeWeComServer(faults=faults) as server:
+            target = WeComTarget('fake', server.url, rate_per_minute=None, retries=3, backoff=0.05)
+            self.assertTrue(target.deliver("第一条"))
+            self.assertTrue(target.deliver("第二条"))
+        self.assertGreaterEqual(server.stats['rate_limited'], 1)
+        self.assertEqual(server.stats['ok'], 2)
+
+    def test_timeout(self):
+        """服务端不响应时客户端超时并重试"""
+        faults = FaultConfig(timeout_rate=1.0, hang_seconds=2)
+        success, server = self.deliver(faults, retries=1, timeout=0.2)
+        self.assertFalse(success)
+        self.assertEqual(server.stats['timeout'], 2)
+
+    def test_content_too_long(self):
+        """超过2048字节返回40058，不重试"""
+        with FakeWeComServer(faults=FaultConfig()) as server:
+            target = WeComTarget('fake', server.url, rate_per_minute=None)
+            success = target.deliver({"msgtype": "text", "text": {"content": "长" * 1000}})
+        self.assertFalse(success)
+        self.assertEqual(server.stats['too_long'], 1)
+        self.assertEqual(server.stats['requests'], 1)
+
+    @patch('delivery.PART_INTERVAL', 0)
+    def test_long_report_split(self):
+        """超长报告拆成多条发送，每条都被接收"""
+        report = "\n".join(f"第{i}行：" + "活动" * 60 for i in range(14))
+        success, server = self.deliver(FaultConfig(), message=report)
+        self.assertTrue(success)
+        self.assertEqual(server.stats['too_long'], 0)
+        self.assertEqual(server.stats['ok'], 3)
+        self.assertTrue(server.messages[0]['text']['content'].startswith("(1/3)"))
+
+    @patch('delivery.PART_INTERVAL', 0)
+    def test_very_long_report_uploaded(self):
+        """markdown也放不下时上传文件，另发一条摘要"""
+        report = "\n".join(f"第{i}行：" + "活动" * 60 for i in range(100))
+        success, server = self.deliver(FaultConfig(), message=report)
+        self.assertTrue(success)
+        self.assertEqual(server.stats['upload'], 1)
+        self.assertEqual([m['msgtype'] for m in server.messages], ['text', 'file'])
+        self.assertIn(report.encode('utf-8'), list(server.uploads.values())[0])
+
+
+class TestBenchDelivery(unittest.TestCase):
+    """压测统计和基线比较"""
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_compare(self):
+        baseline = {'throughput': 100, 'p95_ms': 50, 'p99_ms': 80, 'success_rate': 1.0}
+        self.assertEqual(compare(dict(baseline, throughput=90), baseline), [])
+        regressions = compare(dict(baseline, throughput=50, p99_ms=200), baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+log_janitor.py的测试脚本
+验证压缩/删除分级、重叠目录去重和dry-run
+"""
+
+import sys
+import os
+import gzip
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from log_janitor import LogJanitor, is_log_file, scan_logs
+
+NOW = datetime(2025, 9, 5, 10, 0)
+
+
+class TestLogJanitor(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.logs = os.path.join(self.tmp.name, 'logs')
+        self.webhook_log = os.path.join(self.tmp.name, 'webhook-log')
+        os.makedirs(os.path.join(self.webhook_log, 'backfill'))
+        os.makedirs(self.logs)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make(self, directory, name, days, content="日志内容\n" * 100):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        ts = (NOW - timedelta(days=days)).timestamp()
+        os.utime(path, (ts, ts))
+        return path
+
+    def janitor(self, **kwargs):
+        return LogJanitor([self.logs, self.webhook_log], compress_days=7, retention_days=30,
+                          batch_size=2, now=NOW, **kwargs)
+
+    def test_is_log_file(self):
+        self.assertTrue(is_log_file('webhook_20250901.log'))
+        self.assertTrue(is_log_file('monitor.log.1'))
+        self.assertTrue(is_log_file('webhook_20250901.log.gz'))
+        self.assertTrue(is_log_file('trace_20250901.jsonl'))
+        self.assertFalse(is_log_file('webhook_20250901.log.gz.tmp'))
+        self.assertFalse(is_log_file('report_20250901_1000.txt'))
+
+    def test_tiers(self):
+        """7天前的压缩，30天前的删除，新日志和其他文件不动"""
+        fresh = self.make(self.logs, 'monitor.log', 0)
+        old = self.make(self.webhook_log, 'webhook_20250820.log', 16)
+        expired = [self.make(self.webhook_log, f"webhook_202507{day:02d}.log", 40 + day) for day in range(5)]
+        expired_gz = self.make(self.logs, 'monitor.log.1.gz', 45)
+        report_file = self.make(os.path.join(self.webhook_log, 'backfill'), 'report_20250701_1000.txt', 60)
+
+        report = self.janitor().run()
+
+        self.assertEqual((report.scanned, report.compressed, report.deleted), (8, 1, 6))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(os.path.exists(report_file))
+        self.assertFalse(os.path.exists(old))
+        for path in expired + [expired_gz]:
+            self.assertFalse(os.path.exists(path))
+        with gzip.open(old + '.gz', 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), "日志内容\n" * 100)
+        # 压缩后保留原修改时间，到期后按原时间删除
+        self.assertEqual(int(os.stat(old + '.gz').st_mtime), int((NOW - timedelta(days=16)).timestamp()))
+
+    def test_dry_run(self):
+        old = self.make(self.logs, 'a.log', 10)
+        expired = self.make(self.logs, 'b.log', 40)
+        report = self.janitor(dry_run=True).run()
+        self.assertEqual((report.compressed, report.deleted), (1, 1))
+        self.assertTrue(os.path.exists(old))
+        self.assertTrue(os.path.exists(expired))
+        self.assertIn("将删除1个", report.format())
+        self.assertIn(expired, report.format())
+
+    def test_overlapping_roots(self):
+        """重叠目录和符号链接只遍历一次"""
+        self.make(self.webhook_log, 'webhook_20250901.log', 1)
+        os.symlink(self.webhook_log, os.path.join(self.logs, 'link'))
+        roots = [self.logs, self.webhook_log, self.tmp.name]
+        self.assertEqual(len(list(scan_logs(roots))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+payload.py的测试脚本
+验证按UTF-8字节数拆分报告和消息类型选择
+"""
+
+import sys
+import os
+import unittest
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from payload import (build_messages, pack_lines, split_line, split_bytes, utf8_len,
+                     TEXT_MAX_BYTES, MARKDOWN_MAX_BYTES)
+
+
+def make_report(lines, width=60):
+    return "\n".join(f"第{i}行：" + "活动" * width for i in range(lines))
+
+
+class TestSplit(unittest.TestCase):
+    """按字节切分"""
+
+    def test_split_bytes_keeps_characters(self):
+        """中文按3字节计算，不会切坏字符"""
+        pieces = split_bytes("中文abc" * 10, 10)
+        self.assertTrue(all(utf8_len(p) <= 10 for p in pieces))
+        self.assertEqual(''.join(pieces), "中文abc" * 10)
+
+    def test_split_line_on_separator(self):
+        """超长行优先在 ; 处切开"""
+        line = ";".join(["微信:用户 手机:1234"] * 20)
+        pieces = split_line(line, 100)
+        self.assertTrue(all(utf8_len(p) <= 100 for p in pieces))
+        self.assertTrue(all(p.startswith("微信") for p in pieces))
+        self.assertEqual(";".join(pieces), line)
+
+    def test_pack_lines(self):
+        """按行装填，每段都不超过上限且内容不丢失"""
+        report = make_report(30)
+        parts = pack_lines(report, 1000)
+        self.assertTrue(all(utf8_len(p) <= 1000 for p in parts))
+        self.assertEqual("\n".join(parts), report)
+
+
+class TestBuildMessages(unittest.TestCase):
+    """消息类型选择"""
+
+    def test_short_report_unchanged(self):
+        report = "📊 6页网24小时活动报告\n暂无新活动"
+        self.assertEqual(build_messages(report), [{"msgtype": "text", "text": {"content": report}}])
+
+    def test_split_into_text_parts(self):
+        messages = build_messages(make_report(14))
+        self.assertEqual([m['msgtype'] for m in messages], ['text'] * 3)
+        for index, message in enumerate(messages, 1):
+            content = message['text']['content']
+            self.assertTrue(content.startswith(f"({index}/3)\n"))
+            self.assertLessEqual(utf8_len(content), TEXT_MAX_BYTES)
+
+    def test_markdown_when_many_parts(self):
+        messages = build_messages(make_report(25))
+        self.assertEqual([m['msgtype'] for m in messages], ['markdown'] * 3)
+        self.assertTrue(all(utf8_len(m['markdown']['content']) <= MARKDOWN_MAX_BYTES for m in messages))
+
+    def test_file_when_too_long(self):
+        report = make_report(100)
+        messages = build_messages(report, filename='daily.txt')
+        self.assertEqual([m['msgtype'] for m in messages], ['text', 'file'])
+        self.assertLessEqual(utf8_len(messages[0]['text']['content']), TEXT_MAX_BYTES)
+        self.assertIn("daily.txt", messages[0]['text']['content'])
+        self.assertEqual(messages[1]['data'], report.encode('utf-8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
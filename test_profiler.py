@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+profiler.py的测试脚本
+验证阶段计时、嵌套阶段的独占耗时、剖析结果文件和--profile参数解析
+"""
+
+import sys
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import profiler
+from profiler import RunProfiler, phase, extract_profile_flag
+
+
+class TestPhase(unittest.TestCase):
+    """阶段计时"""
+
+    def test_noop_without_profiler(self):
+        """未开启剖析时phase不记录也不报错"""
+        self.assertIsNone(profiler._active)
+        with phase('query'):
+            pass
+        self.assertIsNone(profiler._active)
+
+    def test_nested_phases_exclusive(self):
+        """嵌套阶段的时间从外层阶段中扣除"""
+        run = RunProfiler('test')
+        clock = iter([0.0, 1.0, 3.0, 4.0])
+        with patch.object(profiler, '_active', run), \
+                patch.object(profiler.time, 'perf_counter', side_effect=lambda: next(clock)):
+            with phase('query'):
+                with phase('fetch'):
+                    pass
+
+        self.assertEqual(run.timings, {'query': 2.0, 'fetch': 2.0})
+        self.assertEqual(run.counts, {'query': 1, 'fetch': 1})
+
+    def test_phase_recorded_on_exception(self):
+        run = RunProfiler('test')
+        with patch.object(profiler, '_active', run):
+            with self.assertRaises(ValueError):
+                with phase('send'):
+                    raise ValueError("发送失败")
+        self.assertEqual(run.counts['send'], 1)
+        self.assertEqual(run._stack, [])
+
+    def test_summary_order(self):
+        """标准阶段按固定顺序排在前面，其他阶段按名称排在后面"""
+        run = RunProfiler('test')
+        run.total = 1.0
+        run.timings = {'zzz': 0.1, 'send': 0.2, 'connect': 0.3}
+        run.counts.update(run.timings.keys())
+        lines = run.summary().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['connect', 'send', 'zzz', 'other'])
+        self.assertIn("400.0ms", lines[-1])
+
+
+class TestRunProfiler(unittest.TestCase):
+    """剖析结果文件"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_writes_result_files(self):
+        with patch('builtins.print'):
+            with RunProfiler('webhook', output_dir=self.tmp.name, interval=0.001) as run:
+                self.assertIs(profiler._active, run)
+                with phase('render'):
+                    time.sleep(0.02)
+
+        self.assertIsNone(profiler._active)
+        files = sorted(os.listdir(self.tmp.name))
+        self.assertEqual([name.split('.', 1)[1] for name in files], ['collapsed', 'phases.txt', 'pstats'])
+        self.assertTrue(all(name.startswith('webhook_') for name in files))
+
+        with open(os.path.join(self.tmp.name, files[1]), encoding='utf-8') as f:
+            summary = f.read()
+        self.assertIn("性能剖析: webhook", summary)
+        self.assertIn("render", summary)
+
+        # 折叠栈每行为 "栈 次数"
+        with open(os.path.join(self.tmp.name, files[0]), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn("test_profiler.py:", stack)
+
+    def test_write_failure_does_not_raise(self):
+        """结果文件写不出时只记录错误，不影响报告任务"""
+        path = os.path.join(self.tmp.name, 'file')
+        open(path, 'w').close()
+        with patch('builtins.print'):
+            with RunProfiler('webhook', output_dir=os.path.join(path, 'profile')):
+                pass
+        self.assertIsNone(profiler._active)
+
+
+class TestExtractProfileFlag(unittest.TestCase):
+    def test_extract(self):
+        self.assertEqual(extract_profile_flag(['health', '--profile']), (True, ['health']))
+        self.assertEqual(extract_profile_flag(['--profile', 'check', '-v']), (True, ['check', '-v']))
+        self.assertEqual(extract_profile_flag(['health']), (False, ['health']))
+        self.assertEqual(extract_profile_flag([]), (False, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+purchase_alert.py的测试脚本
+验证合并窗口、键集分页游标和重启、发送失败后的重发、未支付订单的转正和过期，以及CDC模式第一次启动的位置
+"""
+
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import purchase_alert
+from purchase_alert import AlertCoalescer, PaidOrderPoller, OrderPaidSink, PurchaseAlertStream, PENDING_TTL
+from activity_cdc import BinlogActivityFeed
+
+NOW = 1757037600
+
+
+class FakeOrders(PaidOrderPoller):
+    """用内存中的订单模拟 wy_store_order 上的三种查询"""
+
+    def __init__(self, orders, **kwargs):
+        super().__init__(**kwargs)
+        self.orders = orders
+        self.queries = []
+
+    def query(self, sql, params):
+        sql = ' '.join(sql.split())
+        if 'OR id > %s' in sql:
+            self.queries.append('page')
+            start, after_time, after_id, limit = params
+            rows = sorted((o for o in self.orders if o['add_time'] >= start
+                           and (o['add_time'] > after_time or o['id'] > after_id)),
+                          key=lambda o: (o['add_time'], o['id']))
+            return [{'id': o['id'], 'paid': o['paid'], 'add_time': o['add_time']} for o in rows[:limit]]
+        if sql.startswith('SELECT id FROM wy_store_order WHERE paid = 1'):
+            self.queries.append('pending')
+            return [{'id': o['id']} for o in self.orders if o['id'] in params and o['paid'] == 1]
+        self.queries.append('details')
+        return [dict(o) for o in self.orders if o['id'] in params]
+
+
+def order(order_id, add_time, paid=1, price=99):
+    return {'id': order_id, 'uid': order_id, 'paid': paid, 'add_time': add_time, 'pay_price': price,
+            'phone': '13800138000', 'wechat_name': f'用户{order_id}', 'products': '课程A'}
+
+
+class TestAlertCoalescer(unittest.TestCase):
+    """合并窗口"""
+
+    def test_window_and_flush(self):
+        sent = []
+        coalescer = AlertCoalescer(window=30, send=lambda message: sent.append(message) or True)
+        with patch.object(purchase_alert.time, 'monotonic', return_value=100.0) as clock:
+            self.assertFalse(coalescer.due())
+            coalescer.add(order(1, NOW))
+            clock.return_value = 120.0
+            coalescer.add(order(2, NOW, price=199))
+            clock.return_value = 129.9
+            self.assertFalse(coalescer.due())
+            # 窗口从第一笔订单开始计时
+            clock.return_value = 130.0
+            self.assertTrue(coalescer.due())
+
+        self.assertTrue(coalescer.flush())
+        self.assertEqual(len(sent), 1)
+        self.assertTrue(sent[0].startswith("💰 新订单2笔 ¥298"))
+        self.assertTrue(coalescer.flush())
+        self.assertEqual(len(sent), 1)
+
+    def test_send_failure_keeps_orders(self):
+        """发送失败的订单留在窗口中，下次flush时与新订单一起发送"""
+        results = [False, True]
+        sent = []
+        coalescer = AlertCoalescer(window=0, send=lambda message: sent.append(message) or results.pop(0))
+        coalescer.add(order(1, NOW))
+        self.assertFalse(coalescer.flush())
+        self.assertTrue(coalescer.due())
+        coalescer.add(order(2, NOW))
+        self.assertTrue(coalescer.flush())
+        self.assertTrue(sent[1].startswith("💰 新订单2笔"))
+
+
+class TestPaidOrderPoller(unittest.TestCase):
+    """键集分页和未支付订单"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cursor_path = os.path.join(self.tmp.name, 'cursor.json')
+        patcher = patch.object(purchase_alert.time, 'time', return_value=NOW)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def poller(self, orders, **kwargs):
+        return FakeOrders(orders, cursor_path=self.cursor_path, page_size=2, **kwargs)
+
+    def test_first_start_skips_history(self):
+        """第一次启动从当前时间开始，不提醒历史订单"""
+        orders = [order(1, NOW - 60), order(2, NOW - 10)]
+        poller = self.poller(orders)
+        poller.load_cursor()
+        self.assertEqual(poller.poll(), [])
+        orders.append(order(3, NOW + 5))
+        self.assertEqual([o['id'] for o in poller.poll()], [3])
+
+    def test_keyset_pages_and_restart(self):
+        """同一秒内的多笔订单跨页不重复不遗漏，重启后从游标继续"""
+        orders = [order(i, NOW + 1) for i in range(1, 6)]
+        poller = self.poller(orders)
+        poller.load_cursor()
+        self.assertEqual([o['id'] for o in poller.poll()], [1, 2, 3, 4, 5])
+        self.assertEqual(poller.queries.count('page'), 3)
+        self.assertEqual((poller.last_add_time, poller.last_id), (NOW + 1, 5))
+        poller.mark_sent()
+
+        orders.append(order(6, NOW + 1))
+        restarted = self.poller(orders)
+        restarted.load_cursor()
+        self.assertEqual([o['id'] for o in restarted.poll()], [6])
+
+    def test_pending_promoted_and_expired(self):
+        orders = [order(1, NOW + 1, paid=0), order(2, NOW + 2, paid=0)]
+        poller = self.poller(orders, pending_check_interval=0)
+        poller.load_cursor()
+        self.assertEqual(poller.poll(), [])
+        self.assertEqual(set(poller.pending), {1, 2})
+
+        orders[0]['paid'] = 1
+        self.assertEqual([o['id'] for o in poller.poll()], [1])
+        self.assertEqual(set(poller.pending), {2})
+
+        # 超过等待时间后不再检查
+        self.clock.return_value = NOW + 2 + PENDING_TTL + 1
+        orders[1]['paid'] = 1
+        self.assertEqual(poller.poll(), [])
+        self.assertEqual(poller.pending, {})
+
+        # 未支付订单随游标保存，重启后继续跟踪
+        with open(self.cursor_path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['pending'], {})
+
+    def test_pending_check_interval(self):
+        """未支付订单按间隔检查，不是每个周期都查询"""
+        orders = [order(1, NOW + 1, paid=0)]
+        poller = self.poller(orders, pending_check_interval=60)
+        poller.load_cursor()
+        poller.poll()
+        poller.poll()
+        self.assertEqual(poller.queries.count('pending'), 1)
+
+        orders[0]['paid'] = 1
+        self.clock.return_value = NOW + 61
+        self.assertEqual([o['id'] for o in poller.poll()], [1])
+
+    def test_unsent_orders_alerted_after_restart(self):
+        """发送失败时游标保留未发送的订单，重启后重新提醒"""
+        orders = [order(1, NOW + 1), order(2, NOW + 2)]
+        poller = self.poller(orders)
+        poller.load_cursor()
+        stream = PurchaseAlertStream(coalesce_seconds=0)
+        stream.coalescer.send = lambda message: False
+        for found in poller.poll():
+            stream.coalescer.add(found)
+        stream.flush(poller)
+
+        restarted = self.poller(orders)
+        restarted.load_cursor()
+        found = restarted.poll()
+        self.assertEqual([o['id'] for o in found], [1, 2])
+
+        # 发送成功后不再重复提醒
+        stream = PurchaseAlertStream(coalesce_seconds=0)
+        sent = []
+        stream.coalescer.send = lambda message: sent.append(message) or True
+        for o in found:
+            stream.coalescer.add(o)
+        stream.flush(restarted)
+        self.assertEqual(len(sent), 1)
+        restarted = self.poller(orders)
+        restarted.load_cursor()
+        self.assertEqual(restarted.poll(), [])
+
+    def test_cursor_written_only_when_changed(self):
+        orders = [order(1, NOW + 1)]
+        poller = self.poller(orders)
+        poller.load_cursor()
+        with patch.object(purchase_alert.os, 'replace', wraps=os.replace) as replace:
+            poller.poll()
+            poller.poll()
+            poller.poll()
+            self.assertEqual(replace.call_count, 1)
+            orders.append(order(2, NOW + 2))
+            poller.poll()
+            self.assertEqual(replace.call_count, 2)
+
+        restarted = self.poller(orders)
+        restarted.load_cursor()
+        self.assertFalse(restarted.save_cursor())
+
+
+class TestCdcMode(unittest.TestCase):
+    """binlog模式"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.tmp.name, 'binlog.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def master_conn(self):
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = {'File': 'mysql-bin.000042', 'Position': 1234}
+        return conn
+
+    def test_first_start_at_master_position(self):
+        """没有检查点时从主库当前位置开始并立即保存"""
+        feed = BinlogActivityFeed([], db_config={}, checkpoint_path=self.checkpoint, start_at_current=True)
+        with patch('db.connect', return_value=self.master_conn()) as connect:
+            self.assertEqual(feed.start_position(), {'log_file': 'mysql-bin.000042', 'log_pos': 1234})
+            # 之后的启动沿用检查点，不再读取主库位置
+            self.assertEqual(feed.start_position()['log_pos'], 1234)
+        self.assertEqual(connect.call_count, 1)
+
+    def test_default_reads_current_binlog(self):
+        """activity_cdc默认没有检查点时从当前binlog开头读取"""
+        feed = BinlogActivityFeed([], db_config={}, checkpoint_path=self.checkpoint)
+        with patch('db.connect') as connect:
+            self.assertEqual(feed.start_position(), {})
+        connect.assert_not_called()
+
+    def test_paid_order_alert(self):
+        poller = MagicMock()
+        poller.fetch_order_details.return_value = [order(9, NOW)]
+        sent = []
+        coalescer = AlertCoalescer(window=0, send=lambda message: sent.append(message) or True)
+        feed = BinlogActivityFeed([OrderPaidSink(poller, coalescer)], checkpoint_path=self.checkpoint)
+
+        before = {'id': 9, 'uid': 9, 'paid': 0, 'pay_price': 99, 'pay_time': 0}
+        feed.dispatch('wy_store_order', 'update', (before, dict(before, paid=1, pay_time=NOW)), NOW)
+        feed.dispatch('wy_user', 'insert', {'uid': 10, 'add_time': NOW}, NOW)
+        coalescer.flush()
+
+        poller.fetch_order_details.assert_called_once_with([9])
+        self.assertEqual(len(sent), 1)
+        self.assertIn("新订单1笔", sent[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+report_cache.py的测试脚本
+"""
+
+import sys
+import os
+import time
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from report_cache import ReportCache, make_key
+
+
+class TestReportCache(unittest.TestCase):
+    """报告缓存测试"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ReportCache(cache_dir=self.tmp.name, ttl=60)
+        self.end = datetime(2025, 9, 5, 10, 0, 30)
+        self.key = make_key('daily', self.end - timedelta(days=1), self.end)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_is_minute_aligned(self):
+        """测试同一分钟内的窗口得到相同的键"""
+        later = self.end + timedelta(seconds=20)
+        self.assertEqual(self.key, make_key('daily', later - timedelta(days=1), later))
+        self.assertNotEqual(self.key, make_key('6h', self.end - timedelta(days=1), self.end))
+        self.assertNotEqual(self.key, make_key('daily', self.end - timedelta(days=1), self.end, {'uid': 1}))
+
+    def test_put_and_get(self):
+        """测试分项数据和渲染结果合并保存"""
+        sections = {'purchases': [{'uid': 1, 'pay_price': Decimal('99.00'), 'purchase_time': self.end}]}
+        self.cache.put(self.key, sections=sections)
+        self.cache.put(self.key, payload="报告")
+
+        entry = self.cache.get(self.key)
+        self.assertEqual(entry['sections'], sections)
+        self.assertEqual(entry['payload'], "报告")
+
+    def test_expired_entry_is_ignored(self):
+        """测试过期条目不再返回"""
+        self.cache.put(self.key, payload="报告")
+        with patch('report_cache.time.time', return_value=time.time() + 120):
+            self.assertIsNone(self.cache.get(self.key))
+
+    def test_latest_include_expired(self):
+        """测试过期的报告默认不返回，include_expired时仍返回最新的一份"""
+        self.cache.put(self.key, payload="日报")
+        with patch('report_cache.time.time', return_value=time.time() + 601):
+            self.assertIsNone(self.cache.latest('daily'))
+            self.assertEqual(self.cache.latest('daily', include_expired=True)['payload'], "日报")
+
+    def test_latest_and_invalidate(self):
+        """测试获取最新报告和按类型失效"""
+        other = make_key('6h', self.end - timedelta(hours=6), self.end)
+        self.cache.put(self.key, payload="日报")
+        self.cache.put(other, payload="6小时报告")
+
+        self.assertEqual(self.cache.latest('daily')['payload'], "日报")
+        self.assertEqual(self.cache.invalidate(report_type='daily'), 1)
+        self.assertIsNone(self.cache.latest('daily'))
+        self.assertIsNotNone(self.cache.get(other))
+
+
+if __name__ == "__main__":
+    unittest.main()
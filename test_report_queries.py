@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告查询的集成测试
+在本地MariaDB/MySQL（如docker容器）中建立报告用到的表和索引，写入固定的测试数据，
+执行日报和6小时报告的全部查询，检查结果行数、窗口边界和购买明细，
+并用EXPLAIN检查按时间过滤的表没有全表扫描（type=ALL）。
+
+未设置 REPORT_TEST_MYSQL_HOST 时跳过。测试会删除并重建表，数据库名必须包含 test：
+    docker run -d --name ana-test-db -e MARIADB_ROOT_PASSWORD=test -e MARIADB_DATABASE=ana_report_test \\
+        -p 3307:3306 mariadb:10.11
+    REPORT_TEST_MYSQL_HOST=127.0.0.1 REPORT_TEST_MYSQL_PORT=3307 REPORT_TEST_MYSQL_PASSWORD=test \\
+        python3 -m pytest test_report_queries.py
+"""
+
+import sys
+import os
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
+from webhook import UserActivityReporter
+from query_6hours_activity import SixHoursActivityQuery, SECTION_QUERIES
+
+# 报告使用的表（只含查询用到的字段）和线上应有的索引
+SCHEMA = [
+    """CREATE TABLE wy_user (
+        uid INT PRIMARY KEY, phone VARCHAR(20), nickname VARCHAR(64),
+        add_time INT NOT NULL, last_time INT NOT NULL, status TINYINT NOT NULL DEFAULT 1,
+        KEY idx_add_time (add_time), KEY idx_last_time (last_time))""",
+    """CREATE TABLE wy_wechat_user (
+        id INT AUTO_INCREMENT PRIMARY KEY, uid INT NOT NULL, nickname VARCHAR(64), openid VARCHAR(64),
+        KEY idx_uid (uid))""",
+    """CREATE TABLE wy_special (
+        id INT PRIMARY KEY, title VARCHAR(128), is_del TINYINT NOT NULL DEFAULT 0)""",
+    """CREATE TABLE wy_special_buy (
+        id INT PRIMARY KEY, uid INT NOT NULL, special_id INT NOT NULL, order_id VARCHAR(32),
+        add_time INT NOT NULL, is_del TINYINT NOT NULL DEFAULT 0,
+        KEY idx_add_time (add_time))""",
+    """CREATE TABLE wy_store_order (
+        id INT PRIMARY KEY, order_id VARCHAR(32) NOT NULL, uid INT NOT NULL, pay_price DECIMAL(10, 2),
+        paid TINYINT NOT NULL DEFAULT 0, add_time INT NOT NULL,
+        UNIQUE KEY uk_order_id (order_id), KEY idx_add_time_id (add_time, id))""",
+    """CREATE TABLE wy_store_order_cart_info (
+        id INT AUTO_INCREMENT PRIMARY KEY, oid INT NOT NULL, product_id INT NOT NULL,
+        KEY idx_oid (oid))""",
+    """CREATE TABLE wy_special_watch (
+        id INT PRIMARY KEY, uid INT NOT NULL, special_id INT NOT NULL, viewing_time INT NOT NULL,
+        percentage INT NOT NULL, is_complete TINYINT NOT NULL DEFAULT 0, add_time INT NOT NULL,
+        KEY idx_add_time (add_time))""",
+]
+
+TABLES = ['wy_user', 'wy_wechat_user', 'wy_special', 'wy_special_buy', 'wy_store_order',
+          'wy_store_order_cart_info', 'wy_special_watch']
+
+# EXPLAIN中不允许全表扫描的表别名（按时间过滤的表和订单明细）
+NO_FULL_SCAN = {'u', 'sb', 'o', 'ci', 'sw'}
+
+# 报告窗口结束时间，测试数据覆盖此前60天
+REPORT_END = datetime(2025, 9, 5, 10, 0)
+DAYS = 60
+
+USERS = 3001
+PURCHASES = 4000
+ORDERS = 2000
+WATCHES = 6000
+COURSES = 20
+
+
+def integration_db_config():
+    return {
+        'host': os.getenv('REPORT_TEST_MYSQL_HOST'),
+        'port': int(os.getenv('REPORT_TEST_MYSQL_PORT', '3306')),
+        'user': os.getenv('REPORT_TEST_MYSQL_USER', 'root'),
+        'password': os.getenv('REPORT_TEST_MYSQL_PASSWORD', ''),
+        'database': os.getenv('REPORT_TEST_MYSQL_DATABASE', 'ana_report_test'),
+        'charset': 'utf8mb4',
+    }
+
+
+def build_rows(end_ts):
+    """生成测试数据，各类记录在60天内均匀分布，窗口边界上正好有记录"""
+    base = end_ts - DAYS * 86400
+    step = DAYS * 86400 // (USERS - 1)
+    users = [(uid, f"1380000{uid:04d}", f"用户{uid}", base + (uid - 1) * step,
+              end_ts - ((uid - 1) % 400) * 3600 + 1800, 0 if uid % 50 == 0 else 1)
+             for uid in range(1, USERS + 1)]
+    wechat = [(uid, f"微信{uid}", f"openid{uid}") for uid in range(1, USERS + 1, 2)]
+    courses = [(sid, f"课程{sid:02d}", 1 if sid == COURSES else 0) for sid in range(1, COURSES + 1)]
+    purchases = [(j + 1, j * 7 % (USERS - 1) + 1, j % COURSES + 1, f"O{j // 2}",
+                  base + j * (DAYS * 86400 // PURCHASES), 1 if j % 25 == 0 else 0)
+                 for j in range(PURCHASES)]
+    orders = [(k + 1, f"O{k}", k * 7 % (USERS - 1) + 1, 10 + k % 50, 0 if k % 10 == 0 else 1,
+               base + k * (DAYS * 86400 // ORDERS))
+              for k in range(ORDERS)]
+    cart = [(k + 1, k % COURSES + 1) for k in range(ORDERS)]
+    cart += [(k + 1, (k + 5) % COURSES + 1) for k in range(0, ORDERS, 3)]
+    watches = [(w + 1, w * 11 % (USERS - 1) + 1, w % COURSES + 1, w % 90, w % 101, 1 if w % 4 == 0 else 0,
+                base + w * (DAYS * 86400 // WATCHES))
+               for w in range(WATCHES)]
+    return {'users': users, 'wechat': wechat, 'courses': courses, 'purchases': purchases,
+            'orders': orders, 'cart': cart, 'watches': watches}
+
+
+@unittest.skipUnless(os.getenv('REPORT_TEST_MYSQL_HOST'), "未设置REPORT_TEST_MYSQL_HOST，跳过报告查询集成测试")
+class TestReportQueries(unittest.TestCase):
+    """在真实数据库上执行报告查询"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_config = integration_db_config()
+        if 'test' not in cls.db_config['database']:
+            raise RuntimeError(f"测试会重建表，数据库名必须包含test: {cls.db_config['database']}")
+        cls.conn = db.connect(cls.db_config)
+        cls.conn.autocommit(True)
+        with cls.conn.cursor() as cursor:
+            # 窗口时间按数据库会话时区换算，与报告查询中的UNIX_TIMESTAMP(%s)一致
+            cursor.execute("SELECT UNIX_TIMESTAMP(%s) as ts", [REPORT_END])
+            cls.end_ts = int(cursor.fetchone()['ts'])
+            for table in TABLES:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            for statement in SCHEMA:
+                cursor.execute(statement)
+
+            cls.rows = build_rows(cls.end_ts)
+            cursor.executemany("INSERT INTO wy_user VALUES (%s, %s, %s, %s, %s, %s)", cls.rows['users'])
+            cursor.executemany("INSERT INTO wy_wechat_user (uid, nickname, openid) VALUES (%s, %s, %s)",
+                               cls.rows['wechat'])
+            cursor.executemany("INSERT INTO wy_special VALUES (%s, %s, %s)", cls.rows['courses'])
+            cursor.executemany("INSERT INTO wy_special_buy VALUES (%s, %s, %s, %s, %s, %s)", cls.rows['purchases'])
+            cursor.executemany("INSERT INTO wy_store_order VALUES (%s, %s, %s, %s, %s, %s)", cls.rows['orders'])
+            cursor.executemany("INSERT INTO wy_store_order_cart_info (oid, product_id) VALUES (%s, %s)",
+                               cls.rows['cart'])
+            cursor.executemany("INSERT INTO wy_special_watch VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                               cls.rows['watches'])
+            cursor.execute(f"ANALYZE TABLE {', '.join(TABLES)}")
+            cursor.fetchall()
+
+        cls.patchers = [
+            patch.object(db, 'load_database_config', lambda profile='default': dict(cls.db_config)),
+            patch.object(db, 'load_report_settings', lambda: {
+                'replicas': [], 'max_lag': 30, 'read_timeout': 60, 'query_timeout_ms': 60000}),
+        ]
+        for patcher in cls.patchers:
+            patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for patcher in cls.patchers:
+            patcher.stop()
+        cls.conn.close()
+
+    def capture(self, target):
+        """记录target执行的SQL和参数"""
+        queries = []
+        original = target.execute_query
+
+        def execute_query(sql, params=None):
+            queries.append((sql, params))
+            return original(sql, params)
+
+        target.execute_query = execute_query
+        return queries
+
+    def assert_no_full_scan(self, sql, params):
+        with self.conn.cursor() as cursor:
+            cursor.execute("EXPLAIN " + sql, params)
+            plan = cursor.fetchall()
+        for row in plan:
+            if row['table'] in NO_FULL_SCAN:
+                self.assertNotEqual(row['type'], 'ALL', f"{row['table']} 全表扫描:\n{plan}\n{sql}")
+
+    def test_daily_report(self):
+        reporter = UserActivityReporter(now=REPORT_END, detail_limit=2)
+        queries = self.capture(reporter)
+        start, end = self.end_ts - 86400, self.end_ts
+        rows = self.rows
+
+        new_users = reporter.get_new_registrations()
+        expected = [u for u in rows['users'] if start <= u[3] < end]
+        self.assertEqual(len(new_users), len(expected))
+        # 窗口左闭右开：恰好在开始时间注册的用户计入，恰好在结束时间注册的不计入
+        self.assertIn(start, [u[3] for u in expected])
+        self.assertEqual(new_users[0]['uid'], max(u[0] for u in expected))
+
+        purchases = reporter.get_product_purchases()
+        expected = [p for p in rows['purchases'] if start <= p[4] < end and not p[5]]
+        self.assertEqual(len(purchases), len(expected))
+        self.assertTrue(all(p['product_name'] and p['pay_price'] is not None for p in purchases))
+
+        paid_orders = reporter.get_paid_orders()
+        expected = [o for o in rows['orders'] if start <= o[5] < end and o[4] == 1]
+        self.assertEqual(paid_orders[0]['orders'], len(expected))
+        self.assertEqual(float(paid_orders[0]['revenue']), float(sum(o[3] for o in expected)))
+
+        logins = reporter.get_user_logins()
+        expected = [u for u in rows['users'] if start <= u[4] < end and u[3] < start]
+        self.assertEqual(len(logins), min(20, len(expected)))
+
+        watches = reporter.get_course_watching()
+        expected = [w for w in rows['watches'] if start <= w[6] < end]
+        self.assertEqual(len(watches), min(20, len(expected)))
+        self.assertEqual(watches[0]['viewing_time'], max(w[3] for w in expected))
+
+        self.assertFalse(reporter.query_failed)
+        self.assertEqual(len(queries), 5)
+        for sql, params in queries:
+            self.assert_no_full_scan(sql, params)
+
+    def test_six_hours_report(self):
+        query = SixHoursActivityQuery(end_time=REPORT_END, hours=6)
+        start, end = self.end_ts - 6 * 3600, self.end_ts
+        rows = self.rows
+        users = {u[0]: u for u in rows['users']}
+        courses = {c[0]: c for c in rows['courses']}
+
+        new_users = query.get_new_registrations()
+        # 窗口左开右闭，只统计正常状态的用户
+        expected = [u for u in rows['users'] if start < u[3] <= end and u[5] == 1]
+        self.assertEqual(len(new_users), len(expected))
+        self.assertIn(end, [u[3] for u in expected])
+
+        purchases = query.get_product_purchases()
+        expected = {o[0]: o for o in rows['orders'] if start < o[5] <= end and o[4] == 1}
+        self.assertEqual(len(purchases), len(expected))
+        by_order = {p['order_id']: p for p in purchases}
+        for oid, order in expected.items():
+            titles = sorted({courses[pid][1] for cart_oid, pid in rows['cart'] if cart_oid == oid})
+            self.assertEqual(by_order[order[1]]['products'], ', '.join(titles))
+
+        logins = query.get_user_logins()
+        expected = [u for u in rows['users']
+                    if start < u[4] <= end and u[3] < end - 86400 and u[5] == 1]
+        self.assertEqual(len(logins), len(expected))
+
+        watching = query.get_course_watching()
+        expected = [w for w in rows['watches'] if start < w[6] <= end
+                    and users[w[1]][5] == 1 and not courses[w[2]][2]]
+        self.assertEqual(len(watching), len(expected))
+
+        self.assertFalse(query.query_failed)
+        for name in SECTION_QUERIES.values():
+            self.assert_no_full_scan(*getattr(query, name)())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+runlock.py的测试脚本
+验证本机文件锁、集群租约和同一窗口只发送一次
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from runlock import FileLock, LockBusy, RunGuard, report_slot, window_key
+
+
+class FakeServer:
+    """模拟主库上的命名锁和ana_report_runs表"""
+
+    def __init__(self):
+        self.locks = {}
+        self.runs = {}
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, params=None):
+        server = self.conn.server
+        sql = ' '.join(sql.split())
+        if sql.startswith("SELECT GET_LOCK"):
+            owner = server.locks.get(params[0])
+            if owner is None or owner is self.conn:
+                server.locks[params[0]] = self.conn
+                self.result = {'acquired': 1}
+            else:
+                self.result = {'acquired': 0}
+        elif sql.startswith("SELECT RELEASE_LOCK"):
+            server.locks.pop(params[0], None)
+        elif sql.startswith("SELECT status"):
+            run = server.runs.get(params[0])
+            self.result = {'status': run['status']} if run else None
+        elif sql.startswith("INSERT INTO"):
+            run = server.runs.setdefault(params[0], {'attempts': 0})
+            run.update(status='running', attempts=run['attempts'] + 1)
+        elif sql.startswith("UPDATE"):
+            server.runs[params[1]]['status'] = params[0]
+
+    def fetchone(self):
+        return self.result
+
+
+class FakeConn:
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        # 连接断开时MySQL自动释放该连接持有的命名锁
+        for name, owner in list(self.server.locks.items()):
+            if owner is self:
+                del self.server.locks[name]
+        self.closed = True
+
+
+class TestFileLock(unittest.TestCase):
+    """本机文件锁"""
+
+    def test_exclusive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'daily.lock')
+            with FileLock(path):
+                with self.assertRaises(LockBusy):
+                    FileLock(path).acquire()
+            with FileLock(path):
+                pass
+
+
+class TestRunGuard(unittest.TestCase):
+    """同一窗口只运行一次"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = FakeServer()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def guard(self, window='w1', force=False, lock_dir=None):
+        return RunGuard('daily', window, force=force, lock_dir=lock_dir or self.tmp.name,
+                        connect=lambda: FakeConn(self.server))
+
+    def test_sent_window_skipped(self):
+        """已发送的窗口再次运行时跳过"""
+        with self.guard() as guard:
+            self.assertTrue(guard.acquired)
+            guard.finish(True)
+        with self.guard() as guard:
+            self.assertFalse(guard.acquired)
+            self.assertIn("已发送", guard.reason)
+        self.assertEqual(self.server.locks, {})
+
+    def test_failed_window_retried(self):
+        """失败的窗口允许重试"""
+        with self.guard() as guard:
+            guard.finish(False)
+        with self.guard() as guard:
+            self.assertTrue(guard.acquired)
+        self.assertEqual(list(self.server.runs.values())[0]['attempts'], 2)
+
+    def test_force_resend(self):
+        with self.guard() as guard:
+            guard.finish(True)
+        with self.guard(force=True) as guard:
+            self.assertTrue(guard.acquired)
+
+    def test_other_node_holds_lease(self):
+        """另一台机器（不同的本机锁目录）持有租约时跳过"""
+        with tempfile.TemporaryDirectory() as other_dir:
+            with self.guard() as first:
+                self.assertTrue(first.acquired)
+                with self.guard(lock_dir=other_dir) as second:
+                    self.assertFalse(second.acquired)
+                    self.assertIn("租约", second.reason)
+
+    def test_same_host_overlap(self):
+        """本机已有进程运行时跳过，不会连接主库"""
+        with self.guard() as first:
+            self.assertTrue(first.acquired)
+            with self.guard(window='w2') as second:
+                self.assertFalse(second.acquired)
+                self.assertIn("本机", second.reason)
+
+    def test_nodes_start_minutes_apart(self):
+        """两台机器在同一时段的不同分钟启动，后启动的跳过"""
+        with tempfile.TemporaryDirectory() as other_dir:
+            with self.guard(window=window_key('daily', datetime(2025, 9, 5, 10, 0, 2))) as first:
+                self.assertTrue(first.acquired)
+                first.finish(True)
+            with self.guard(window=window_key('daily', datetime(2025, 9, 5, 10, 4)), lock_dir=other_dir) as second:
+                self.assertFalse(second.acquired)
+                self.assertIn("已发送", second.reason)
+
+    def test_lease_per_report_type(self):
+        """租约按报告类型命名，不同窗口键也互斥"""
+        with tempfile.TemporaryDirectory() as other_dir:
+            with self.guard(window='w1') as first:
+                self.assertTrue(first.acquired)
+                with self.guard(window='w2', lock_dir=other_dir) as second:
+                    self.assertFalse(second.acquired)
+                    self.assertIn("租约", second.reason)
+
+    def test_database_unavailable(self):
+        """连不上主库时只用本机文件锁"""
+        def fail():
+            raise ConnectionError("down")
+
+        with RunGuard('daily', 'w1', lock_dir=self.tmp.name, connect=fail) as guard:
+            self.assertTrue(guard.acquired)
+            guard.finish(True)
+
+
+class TestReportSlot(unittest.TestCase):
+    """窗口按调度时段对齐"""
+
+    def test_daily_slots(self):
+        self.assertEqual(report_slot(datetime(2025, 9, 5, 10, 3)), datetime(2025, 9, 5, 10, 0))
+        self.assertEqual(report_slot(datetime(2025, 9, 5, 21, 59)), datetime(2025, 9, 5, 10, 0))
+        self.assertEqual(report_slot(datetime(2025, 9, 5, 23, 30)), datetime(2025, 9, 5, 22, 0))
+        self.assertEqual(report_slot(datetime(2025, 9, 5, 3, 0)), datetime(2025, 9, 4, 22, 0))
+
+    def test_interim_slots(self):
+        self.assertEqual(report_slot(datetime(2025, 9, 5, 15, 5), hours=2), datetime(2025, 9, 5, 14, 0))
+        self.assertEqual(report_slot(datetime(2025, 9, 5, 15, 55), hours=1), datetime(2025, 9, 5, 15, 0))
+
+    def test_window_key(self):
+        self.assertEqual(window_key('daily', datetime(2025, 9, 5, 10, 0)),
+                         window_key('daily', datetime(2025, 9, 5, 10, 7)))
+        self.assertNotEqual(window_key('daily', datetime(2025, 9, 5, 10, 0)),
+                            window_key('daily', datetime(2025, 9, 5, 22, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
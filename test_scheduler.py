@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+scheduler.py的测试脚本
+验证活动等级判断、高峰时缩短报告间隔和空闲时探测退避
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from scheduler import AdaptiveScheduler, classify, near_fixed_slot, DEFAULT_SCHEDULE
+
+
+class TestScheduler(unittest.TestCase):
+    """调度决策"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.rates = {'purchases': 0, 'registrations': 0}
+        self.sent = []
+        self.probes = []
+
+        def prober(now):
+            self.probes.append(now)
+            return dict(self.rates)
+
+        def sender(now, minutes):
+            self.sent.append((now, minutes))
+            return True
+
+        self.scheduler = AdaptiveScheduler(os.path.join(self.tmp.name, 'scheduler.json'),
+                                           schedule=DEFAULT_SCHEDULE, prober=prober, sender=sender)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_ticks(self, start, minutes, step=5):
+        now = start
+        while now < start + timedelta(minutes=minutes):
+            self.scheduler.tick(now)
+            now += timedelta(minutes=step)
+
+    def test_classify(self):
+        self.assertEqual(classify({'purchases': 30, 'registrations': 0}, DEFAULT_SCHEDULE)[0], 'peak')
+        self.assertEqual(classify({'purchases': 0, 'registrations': 30}, DEFAULT_SCHEDULE)[0], 'busy')
+        self.assertEqual(classify({'purchases': 2, 'registrations': 0}, DEFAULT_SCHEDULE)[0], 'normal')
+        self.assertEqual(classify({'purchases': 0, 'registrations': 0}, DEFAULT_SCHEDULE)[0], 'idle')
+
+    def test_near_fixed_slot(self):
+        self.assertTrue(near_fixed_slot(datetime(2025, 9, 1, 9, 50)))
+        self.assertTrue(near_fixed_slot(datetime(2025, 9, 1, 22, 15)))
+        self.assertFalse(near_fixed_slot(datetime(2025, 9, 1, 14, 0)))
+
+    def test_peak_reports_hourly(self):
+        """高峰期间每小时发送一次临时报告"""
+        self.rates = {'purchases': 40, 'registrations': 0}
+        self.run_ticks(datetime(2025, 9, 1, 13, 0), 180)
+        self.assertEqual([(t.hour, m) for t, m in self.sent], [(13, 60), (14, 60), (15, 60)])
+        self.assertEqual(len(self.probes), 36)
+
+    def test_normal_only_fixed_schedule(self):
+        """平常不发送临时报告"""
+        self.rates = {'purchases': 2, 'registrations': 3}
+        self.run_ticks(datetime(2025, 9, 1, 13, 0), 180)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(len(self.probes), 12)
+
+    def test_idle_backoff(self):
+        """持续空闲时探测间隔翻倍，最长1小时；活动恢复后立即缩短"""
+        self.run_ticks(datetime(2025, 9, 1, 1, 0), 240)
+        gaps = [(b - a).seconds // 60 for a, b in zip(self.probes, self.probes[1:])]
+        self.assertEqual(gaps[:3], [15, 30, 60])
+        self.assertEqual(self.scheduler.state['probe_interval'], 60)
+
+        self.rates = {'purchases': 40, 'registrations': 0}
+        self.scheduler.state['next_probe'] = None
+        self.scheduler.tick(datetime(2025, 9, 1, 14, 0))
+        self.assertEqual(self.scheduler.state['level'], 'peak')
+        self.assertEqual(self.scheduler.state['probe_interval'], 5)
+
+    def test_no_interim_near_fixed_report(self):
+        self.rates = {'purchases': 40, 'registrations': 0}
+        self.scheduler.tick(datetime(2025, 9, 1, 9, 45))
+        self.assertEqual(self.sent, [])
+
+    def test_state_persisted(self):
+        self.rates = {'purchases': 40, 'registrations': 0}
+        self.scheduler.tick(datetime(2025, 9, 1, 13, 0))
+        self.scheduler.save()
+        restored = AdaptiveScheduler(self.scheduler.path).load()
+        self.assertEqual(restored.state['level'], 'peak')
+        self.assertEqual(restored.state['last_report'], '2025-09-01 13:00:00')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+settings.py的测试脚本
+验证配置文件和环境变量的合并、校验、profile和热加载
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import settings
+from settings import SettingsError, load
+
+CONFIG = """
+DATABASE_CONFIG = {'host': 'localhost', 'port': 3306, 'user': '6page', 'password': 'secret', 'database': '6page'}
+WEBHOOK_URL = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=test'
+DATABASE_PROFILES = {'analytics': {'host': '10.0.0.30'}}
+WEBHOOK_PROFILES = {'sales': [{'type': 'file', 'name': '归档', 'path': '/tmp/sales.log'}]}
+REPORT_DETAIL_LIMIT = 5
+"""
+
+
+class SettingsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'config.py')
+        self.write(CONFIG)
+
+    def tearDown(self):
+        settings.reset()
+        self.tmp.cleanup()
+
+    def write(self, content, mtime=None):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        if mtime:
+            os.utime(self.path, (mtime, mtime))
+
+
+class TestLoad(SettingsTestCase):
+    """加载和校验"""
+
+    def test_config_file(self):
+        current = load(self.path, env={})
+        config = current.database()
+        self.assertEqual(config['password'], 'secret')
+        self.assertEqual(config['charset'], 'utf8mb4')
+        self.assertEqual(current.webhook_targets()[0]['url'], 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=test')
+        self.assertEqual(current.get('REPORT_DETAIL_LIMIT'), 5)
+        self.assertEqual(current.report_settings()['max_lag'], 30)
+
+    def test_env_overrides_file(self):
+        env = {'ANA_DB_PASSWORD': 'from-env', 'ANA_DB_PORT': '3307',
+               'ANA_WEBHOOK_URL': 'https://example.com/hook'}
+        current = load(self.path, env=env)
+        self.assertEqual(current.database()['password'], 'from-env')
+        self.assertEqual(current.database()['port'], 3307)
+        self.assertEqual(current.webhook_targets()[0]['url'], 'https://example.com/hook')
+
+    def test_env_only(self):
+        """没有config.py时只用环境变量"""
+        env = {'ANA_DB_HOST': 'db', 'ANA_DB_USER': 'u', 'ANA_DB_PASSWORD': 'p', 'ANA_DB_NAME': 'd'}
+        current = load(os.path.join(self.tmp.name, 'missing.py'), env=env)
+        self.assertEqual(current.database()['host'], 'db')
+        with self.assertRaises(SettingsError):
+            current.webhook_targets()
+
+    def test_invalid(self):
+        self.write(CONFIG + "\nWEBHOOK_URL = 'qyapi.weixin.qq.com'\n")
+        with self.assertRaises(SettingsError):
+            load(self.path, env={})
+        self.write(CONFIG + "\nDATABASE_PROFILES = {'bad': {'port': 'x'}}\n")
+        with self.assertRaises(SettingsError):
+            load(self.path, env={})
+
+    def test_duplicate_target_names(self):
+        """同一配置中目标名重复（包括都未写name的同类型目标）时拒绝加载"""
+        self.write(CONFIG + "\nWEBHOOK_TARGETS = [{'type': 'wecom', 'url': 'https://a.example.com'},"
+                            " {'type': 'wecom', 'url': 'https://b.example.com'}]\n")
+        with self.assertRaises(SettingsError):
+            load(self.path, env={})
+
+    def test_profiles(self):
+        current = load(self.path, env={})
+        analytics = current.database('analytics')
+        self.assertEqual(analytics['host'], '10.0.0.30')
+        self.assertEqual(analytics['password'], 'secret')
+        self.assertEqual(current.webhook_targets('sales')[0]['type'], 'file')
+        with self.assertRaises(SettingsError):
+            current.database('missing')
+
+    def test_copies(self):
+        """调用方修改返回值不影响缓存的配置"""
+        current = load(self.path, env={})
+        current.database()['host'] = 'changed'
+        self.assertEqual(current.database()['host'], 'localhost')
+
+
+class TestReload(SettingsTestCase):
+    """进程内缓存和热加载"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.dict(os.environ, {'ANA_CONFIG_FILE': self.path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        settings.reset()
+
+    def test_cached(self):
+        self.assertIs(settings.get_settings(), settings.get_settings())
+        self.assertFalse(settings.reload_if_changed())
+
+    def test_reload_on_change(self):
+        first = settings.get_settings()
+        self.write(CONFIG.replace("'secret'", "'rotated'"), mtime=first.mtime + 10)
+        self.assertTrue(settings.reload_if_changed())
+        current = settings.get_settings()
+        self.assertEqual(current.database()['password'], 'rotated')
+        self.assertEqual(current.version, first.version + 1)
+
+    def test_invalid_reload_keeps_old(self):
+        first = settings.get_settings()
+        self.write("DATABASE_CONFIG = {}\nWEBHOOK_URL = 'bad'\n", mtime=first.mtime + 10)
+        self.assertFalse(settings.reload_if_changed())
+        self.assertIs(settings.get_settings(), first)
+        self.assertFalse(settings.reload_if_changed())
+
+    def test_router_rebuilt(self):
+        """配置重新加载后delivery重建投递目标"""
+        import delivery
+
+        with patch.dict(delivery._routers, clear=True):
+            first = delivery.get_router()
+            self.assertIs(delivery.get_router(), first)
+            self.write(CONFIG.replace("key=test", "key=rotated"), mtime=settings.get_settings().mtime + 10)
+            settings.reload_if_changed()
+            second = delivery.get_router()
+            self.assertIsNot(second, first)
+            self.assertIn("key=rotated", second.targets[0].url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+snapshots.py的测试脚本
+验证快照指标提取、最近快照匹配和较昨日/较上周对比
+"""
+
+import sys
+import os
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from snapshots import SnapshotStore, extract_metrics, format_comparisons
+
+
+class FakeCursor:
+    """按SQL开头区分语句，把快照保存在内存中"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        if sql.startswith("REPLACE INTO"):
+            names = ['report_type', 'window_end', 'window_start', 'new_users', 'purchases', 'revenue',
+                     'logins', 'watches', 'watch_minutes', 'top_rows', 'created_at']
+            row = dict(zip(names, params))
+            row['revenue'] = Decimal(str(row['revenue']))
+            self.rows[(row['report_type'], row['window_end'])] = row
+        elif "BETWEEN" in sql:
+            report_type, low, high = params
+            self.result = [r for (t, end), r in self.rows.items() if t == report_type and low <= end <= high]
+        elif sql.startswith("SELECT"):
+            report_type, since = params
+            self.result = sorted((r for (t, end), r in self.rows.items() if t == report_type and end >= since),
+                                 key=lambda r: r['window_end'])
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConn:
+    def __init__(self):
+        self.rows = {}
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_sections(users, purchases):
+    return {
+        'new_users': [{'uid': i} for i in range(users)],
+        'purchases': [{'product_name': '课程', 'pay_price': Decimal('99.00')} for _ in range(purchases)],
+        'paid_orders': [{'orders': purchases, 'revenue': Decimal('99.00') * purchases}],
+        'logins': [],
+        'course_watches': [{'course_name': 'Python', 'viewing_time': 30}],
+    }
+
+
+class TestSnapshots(unittest.TestCase):
+    """快照读写和对比"""
+
+    def setUp(self):
+        self.store = SnapshotStore(FakeConn())
+        self.now = datetime(2025, 9, 10, 10, 0)
+
+    def test_extract_metrics(self):
+        metrics = extract_metrics(make_sections(3, 2))
+        self.assertEqual(metrics['new_users'], 3)
+        self.assertEqual(metrics['purchases'], 2)
+        self.assertEqual(metrics['revenue'], 198.0)
+        self.assertEqual(metrics['watch_minutes'], 30)
+        self.assertEqual(len(metrics['top_rows']['purchases']), 2)
+
+    def test_revenue_from_paid_orders(self):
+        """一笔订单包含多门课程时金额不重复计算"""
+        sections = make_sections(0, 3)
+        sections['paid_orders'] = [{'orders': 1, 'revenue': Decimal('99.00')}]
+        metrics = extract_metrics(sections)
+        self.assertEqual((metrics['purchases'], metrics['revenue']), (3, 99.0))
+
+    def test_compare_with_yesterday_and_last_week(self):
+        """定时任务晚几分钟启动也能匹配到对比快照"""
+        yesterday = self.now - timedelta(days=1, minutes=-3)
+        last_week = self.now - timedelta(days=7)
+        self.store.save('daily', yesterday - timedelta(days=1), yesterday, extract_metrics(make_sections(1, 1)))
+        self.store.save('daily', last_week - timedelta(days=1), last_week, extract_metrics(make_sections(5, 0)))
+
+        comparisons = self.store.comparisons('daily', self.now, extract_metrics(make_sections(3, 2)))
+        self.assertEqual([label for label, _ in comparisons], ['较昨日', '较上周'])
+        self.assertEqual(comparisons[0][1], {'new_users': 2, 'purchases': 1, 'revenue': 99.0})
+        self.assertEqual(format_comparisons(comparisons),
+                         "较昨日 注册+2 购买+1 金额+¥99；较上周 注册-2 购买+2 金额+¥198")
+
+    def test_no_history(self):
+        self.assertEqual(self.store.comparisons('daily', self.now, extract_metrics(make_sections(1, 0))), [])
+
+    def test_other_report_type_ignored(self):
+        yesterday = self.now - timedelta(days=1)
+        self.store.save('6h', yesterday, yesterday, extract_metrics(make_sections(1, 1)))
+        self.assertIsNone(self.store.nearest('daily', yesterday))
+
+    def test_save_replaces_same_window(self):
+        self.store.save('daily', self.now, self.now, extract_metrics(make_sections(1, 0)))
+        self.store.save('daily', self.now, self.now, extract_metrics(make_sections(4, 0)))
+        rows = self.store.recent('daily', self.now - timedelta(days=1))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['new_users'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+timeline.py的测试脚本
+验证重放去重、时间排序、类型过滤、最近N条、清理和从事件库导入
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from activity_cdc import make_event
+from event_store import EventStore
+from timeline import TimelineIndex, import_from_store, format_event
+
+
+def ts(*args):
+    return int(datetime(*args).timestamp())
+
+
+class TestTimeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = TimelineIndex(os.path.join(self.tmp.name, 'timeline.db'), batch_size=2)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def add_events(self):
+        events = [
+            make_event('order_paid', 1, ts(2025, 9, 2, 0, 10), amount=99.9, ref_id='O1001'),
+            make_event('register', 1, ts(2025, 9, 1, 23, 50)),
+            make_event('login', 2, ts(2025, 9, 2, 8, 0)),
+            make_event('watch', 1, ts(2025, 9, 3, 9, 0), special_id=7, minutes=12),
+            make_event('purchase', 1, ts(2025, 9, 3, 10, 0), special_id=7),
+        ]
+        for event in events:
+            self.index.add(event)
+        self.index.save()
+        return events
+
+    def test_timeline_order(self):
+        self.add_events()
+        events = self.index.timeline(1)
+        self.assertEqual([e.kind for e in events], ['register', 'order_paid', 'watch', 'purchase'])
+        self.assertEqual(events[1].ref_id, 'O1001')
+        self.assertEqual(events[1].amount, 99.9)
+        self.assertEqual([e.kind for e in self.index.timeline(2)], ['login'])
+
+    def test_replay_ignored(self):
+        """重放binlog时重复的事件不会重复写入"""
+        events = self.add_events()
+        for event in events:
+            self.index.add(event)
+        self.index.close()
+        self.assertEqual(len(self.index.timeline(1)), 4)
+
+    def test_filters(self):
+        self.add_events()
+        window = self.index.timeline(1, datetime(2025, 9, 2), datetime(2025, 9, 3, 10, 0))
+        self.assertEqual([e.kind for e in window], ['order_paid', 'watch'])
+        kinds = self.index.timeline(1, kinds=['watch', 'purchase'])
+        self.assertEqual([e.kind for e in kinds], ['watch', 'purchase'])
+        latest = self.index.timeline(1, limit=2)
+        self.assertEqual([e.kind for e in latest], ['watch', 'purchase'])
+
+    def test_prune(self):
+        self.add_events()
+        self.assertEqual(self.index.prune(datetime(2025, 9, 3)), 3)
+        self.assertEqual(self.index.first_ts(), ts(2025, 9, 3, 9, 0))
+
+    def test_import_from_store(self):
+        """只导入索引最早事件之前的历史"""
+        store = EventStore(os.path.join(self.tmp.name, 'event_store'))
+        try:
+            store.add(make_event('register', 1, ts(2025, 9, 1, 8, 0)))
+            store.add(make_event('order_paid', 1, ts(2025, 9, 1, 9, 0), amount=99.9))
+            store.add(make_event('login', 1, ts(2025, 9, 2, 8, 0)))
+            store.save()
+            self.index.add(make_event('login', 1, ts(2025, 9, 2, 8, 0)))
+            self.index.save()
+
+            count = import_from_store(self.index, store, datetime(2025, 9, 1), datetime(2025, 9, 3))
+        finally:
+            store.close()
+        self.assertEqual(count, 2)
+        self.assertEqual([e.kind for e in self.index.timeline(1)], ['register', 'order_paid', 'login'])
+
+    def test_format_event(self):
+        event = make_event('purchase', 1, ts(2025, 9, 3, 10, 0), special_id=7, amount=99.9)
+        self.assertEqual(format_event(event, {7: 'Python入门'}), "2025-09-03 10:00:00 购买 Python入门 ¥99.90")
+        self.assertEqual(format_event(event), "2025-09-03 10:00:00 购买 课程7 ¥99.90")
+
+
+if __name__ == '__main__':
+    unittest.main()
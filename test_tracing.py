@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tracing.py的测试脚本
+验证span的父子关系、跨投递线程的run_id传递、属性和JSON输出
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+
+# 添加项目路径到sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tracing
+from tracing import RunTracer, span, load_spans, format_tree
+from delivery import FileTarget, WeComTarget, WebhookRouter
+from fake_wecom import FakeWeComServer, FaultConfig
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def by_name(self, tracer):
+        spans = {}
+        for s in tracer.spans:
+            spans.setdefault(s.name, []).append(s)
+        return spans
+
+    def test_inactive_noop(self):
+        """未开启追踪时span不记录任何内容"""
+        with span('query', section='new_users') as current:
+            current.set('rows', 3)
+        tracing.set_attribute('rows', 3)
+        self.assertIsNone(tracing._active)
+
+    def test_nested_spans(self):
+        with RunTracer('report', output_dir=self.tmp.name, report_type='daily') as tracer:
+            with span('generate'):
+                with span('query', section='new_users') as current:
+                    current.set('rows', 5)
+            with self.assertRaises(ValueError):
+                with span('send'):
+                    raise ValueError("boom")
+
+        spans = self.by_name(tracer)
+        root = spans['report'][0]
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(root.attributes['report_type'], 'daily')
+        self.assertEqual(spans['generate'][0].parent_id, root.span_id)
+        self.assertEqual(spans['query'][0].parent_id, spans['generate'][0].span_id)
+        self.assertEqual(spans['query'][0].attributes, {'section': 'new_users', 'rows': 5})
+        self.assertEqual(spans['send'][0].status, 'error')
+        self.assertIsNone(tracing._active)
+
+    def test_delivery_threads(self):
+        """并发投递线程中的span挂在调用方的send下，带HTTP状态码"""
+        with FakeWeComServer(faults=FaultConfig()) as server:
+            router = WebhookRouter([
+                WeComTarget('bot', server.url, rate_per_minute=None),
+                FileTarget('archive', os.path.join(self.tmp.name, 'archive.log')),
+            ])
+            with RunTracer('report', output_dir=self.tmp.name) as tracer:
+                with span('send'):
+                    router.deliver("测试消息")
+
+        spans = self.by_name(tracer)
+        send = spans['send'][0]
+        attempts = {s.attributes['target']: s for s in spans['send.attempt']}
+        self.assertEqual(set(attempts), {'bot', 'archive'})
+        self.assertTrue(all(s.parent_id == send.span_id for s in attempts.values()))
+        self.assertEqual(attempts['bot'].attributes['status_code'], 200)
+        self.assertEqual(attempts['bot'].attributes['errcode'], 0)
+        self.assertGreater(attempts['bot'].attributes['bytes'], 0)
+
+    def test_failed_attempt_marked(self):
+        with FakeWeComServer(faults=FaultConfig(error_rate=1.0)) as server:
+            target = WeComTarget('bot', server.url, rate_per_minute=None, retries=1, backoff=0.01)
+            with RunTracer('report', output_dir=self.tmp.name) as tracer:
+                self.assertFalse(target.deliver("测试消息"))
+
+        attempts = self.by_name(tracer)['send.attempt']
+        self.assertEqual([s.attributes['attempt'] for s in attempts], [1, 2])
+        self.assertTrue(all(s.status == 'error' and s.attributes['status_code'] == 502 for s in attempts))
+
+    def test_write_and_show(self):
+        for _ in range(2):
+            with RunTracer('report', output_dir=self.tmp.name) as tracer:
+                with span('query', section='logins') as current:
+                    current.set('rows', 2)
+
+        spans = load_spans(tracer.path())
+        self.assertEqual({s['run_id'] for s in spans}, {tracer.run_id})
+        tree = format_tree(spans).splitlines()
+        self.assertTrue(tree[0].startswith('report '))
+        self.assertTrue(tree[1].startswith('  query '))
+        self.assertIn('rows=2', tree[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
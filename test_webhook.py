@@ -28,6 +28,11 @@ class TestUserActivityReporter(unittest.TestCase):
         """测试前设置"""
         self.reporter = UserActivityReporter()
         
+        # 报告快照会写入主库的ana_report_snapshots，测试中不能用模拟数据覆盖真实快照
+        patcher = patch('webhook.record_and_compare', return_value=[])
+        self.mock_record_and_compare = patcher.start()
+        self.addCleanup(patcher.stop)
+        
         # 模拟测试数据
         self.mock_new_users = [
             {'uid': 1, 'phone': '13800138001', 'nickname': 'test1', 'wechat_name': '微信用户1', 'register_time': datetime.now()},
@@ -107,11 +112,12 @@ class TestUserActivityReporter(unittest.TestCase):
         self.assertEqual(result[0]['viewing_time'], 30.5)
         mock_execute_query.assert_called_once()
     
+    @patch('webhook.UserActivityReporter.get_paid_orders', return_value=[{'orders': 2, 'revenue': 298.0}])
     @patch('webhook.UserActivityReporter.get_course_watching')
     @patch('webhook.UserActivityReporter.get_user_logins')
     @patch('webhook.UserActivityReporter.get_product_purchases')
     @patch('webhook.UserActivityReporter.get_new_registrations')
-    def test_generate_report(self, mock_new_users, mock_purchases, mock_logins, mock_watches):
+    def test_generate_report(self, mock_new_users, mock_purchases, mock_logins, mock_watches, mock_paid_orders):
         """测试报告生成"""
         # 设置mock返回值
         mock_new_users.return_value = self.mock_new_users
@@ -131,12 +137,17 @@ class TestUserActivityReporter(unittest.TestCase):
         
         # 验证报告长度限制（应该控制在合理范围内）
         self.assertLessEqual(len(report), 500)  # 允许一些缓冲，但不应该过长
+        
+        # 快照只交给打桩的record_and_compare，不会写入主库
+        self.mock_record_and_compare.assert_called_once()
     
+    @patch('webhook.UserActivityReporter.get_paid_orders', return_value=[{'orders': 0, 'revenue': 0}])
     @patch('webhook.UserActivityReporter.get_course_watching')
     @patch('webhook.UserActivityReporter.get_user_logins') 
     @patch('webhook.UserActivityReporter.get_product_purchases')
     @patch('webhook.UserActivityReporter.get_new_registrations')
-    def test_generate_report_empty_data(self, mock_new_users, mock_purchases, mock_logins, mock_watches):
+    def test_generate_report_empty_data(self, mock_new_users, mock_purchases, mock_logins, mock_watches,
+                                        mock_paid_orders):
         """测试空数据情况下的报告生成"""
         # 设置空数据
         mock_new_users.return_value = []
@@ -152,7 +163,7 @@ class TestUserActivityReporter(unittest.TestCase):
         self.assertIn("活跃老用户：0人", report)
         self.assertIn("课程观看：0次", report)
     
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_send_webhook_success(self, mock_post):
         """测试webhook发送成功"""
         # 模拟成功响应
@@ -165,7 +176,7 @@ class TestUserActivityReporter(unittest.TestCase):
         self.assertTrue(result)
         mock_post.assert_called_once()
     
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_send_webhook_failure(self, mock_post):
         """测试webhook发送失败"""
         # 模拟失败响应
@@ -177,8 +188,9 @@ class TestUserActivityReporter(unittest.TestCase):
         result = self.reporter.send_webhook("测试消息")
         self.assertFalse(result)
     
-    @patch('requests.post')
-    def test_send_webhook_http_error(self, mock_post):
+    @patch('delivery.time.sleep')
+    @patch('requests.Session.post')
+    def test_send_webhook_http_error(self, mock_post, mock_sleep):
         """测试HTTP错误"""
         # 模拟HTTP错误
         mock_response = MagicMock()
@@ -188,7 +200,7 @@ class TestUserActivityReporter(unittest.TestCase):
         result = self.reporter.send_webhook("测试消息")
         self.assertFalse(result)
     
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_send_webhook_exception(self, mock_post):
         """测试异常处理"""
         # 模拟异常
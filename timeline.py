@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户活动时间线索引
+本地sqlite中按 (uid, 时间) 聚簇保存每个用户的注册、登录、购买、支付和观看事件，
+查看单个用户的活动只需一次主键范围读取，不再跨 wy_user / wy_special_buy / wy_special_watch /
+wy_store_order 做关联查询。
+
+索引作为 activity_cdc 的sink增量维护；重放binlog时重复的事件按主键忽略。
+历史数据从本地事件库（event_store.py）导入，只补齐索引中最早事件之前的部分。
+用法:
+    python3 timeline.py import --days 30     # 从事件库导入最近30天
+    python3 timeline.py show --uid 123        # 查看用户时间线
+    python3 timeline.py prune --days 365      # 删除365天前的事件
+    python3 query_6hours_activity.py timeline --uid 123
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from activity_cdc import STATE_DIR, make_event
+
+# 本地索引库
+TIMELINE_DB = STATE_DIR / 'timeline.db'
+
+# 缓冲多少个事件后写入一次（save时也会写入）
+BATCH_SIZE = 500
+
+# 事件类型的显示名称
+KIND_LABELS = {
+    'register': '注册',
+    'login': '登录',
+    'purchase': '购买',
+    'order_paid': '支付',
+    'watch': '观看',
+    'watch_time': '继续观看',
+}
+
+logger = logging.getLogger(__name__)
+
+
+class TimelineIndex:
+    """按用户聚簇的活动事件表，可以作为 activity_cdc.BinlogActivityFeed 的sink"""
+
+    def __init__(self, path=None, batch_size=BATCH_SIZE):
+        self.path = Path(path) if path else TIMELINE_DB
+        self.batch_size = batch_size
+        self.conn = None
+        self._pending = []
+
+    def open(self):
+        if self.conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path))
+            # WAL模式下采集进程写入时，查询不会被阻塞
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS events (
+                    uid INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    special_id INTEGER NOT NULL,
+                    ref TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    minutes REAL NOT NULL,
+                    PRIMARY KEY (uid, ts, kind, special_id, ref)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+            """)
+        return self.conn
+
+    def close(self):
+        self.save()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def add(self, event):
+        self._pending.append((event.uid, event.ts, event.kind, event.special_id,
+                              '' if event.ref_id is None else str(event.ref_id), event.amount, event.minutes))
+        if len(self._pending) >= self.batch_size:
+            self.save()
+
+    def save(self):
+        """写入缓冲的事件，已存在的事件忽略"""
+        if not self._pending:
+            return
+        conn = self.open()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending)
+        self._pending = []
+
+    def timeline(self, uid, start=None, end=None, kinds=None, limit=None):
+        """用户在[start, end)内的事件，按时间先后排序，指定limit时只取最近的limit条"""
+        where = "uid = ? AND ts >= ? AND ts < ?"
+        params = [uid, int(start.timestamp()) if start else 0, int(end.timestamp()) if end else 2 ** 32]
+        if kinds:
+            where += f" AND kind IN ({', '.join(['?'] * len(kinds))})"
+            params.extend(kinds)
+        columns = "uid, ts, kind, special_id, ref, amount, minutes"
+        if limit:
+            sql = (f"SELECT * FROM (SELECT {columns} FROM events WHERE {where} ORDER BY ts DESC LIMIT ?) "
+                   f"ORDER BY ts")
+            params.append(limit)
+        else:
+            sql = f"SELECT {columns} FROM events WHERE {where} ORDER BY ts"
+        return [make_event(kind, row_uid, ts, special_id=special_id, amount=amount, minutes=minutes, ref_id=ref or None)
+                for row_uid, ts, kind, special_id, ref, amount, minutes in self.open().execute(sql, params)]
+
+    def first_ts(self):
+        """索引中最早的事件时间，没有事件时返回None"""
+        return self.open().execute("SELECT MIN(ts) FROM events").fetchone()[0]
+
+    def prune(self, before):
+        """删除before之前的事件，返回删除条数"""
+        conn = self.open()
+        with conn:
+            return conn.execute("DELETE FROM events WHERE ts < ?", [int(before.timestamp())]).rowcount
+
+
+def import_from_store(index, store, start, end):
+    """从本地事件库导入窗口内、索引最早事件之前的事件，返回条数
+
+    采集进程写入的事件带订单号，事件库中的没有，同一时段重复导入无法按主键去重，
+    所以只补齐索引已有数据之前的历史。
+    """
+    first_ts = index.first_ts()
+    if first_ts is not None:
+        end = min(end, datetime.fromtimestamp(first_ts))
+    count = 0
+    for event in store.scan(start, end) if start < end else ():
+        index.add(event)
+        count += 1
+    index.save()
+    return count
+
+
+def format_event(event, titles=None):
+    """格式化一条事件，如 "09-05 10:00:12 购买 课程名" """
+    line = f"{datetime.fromtimestamp(event.ts):%Y-%m-%d %H:%M:%S} {KIND_LABELS.get(event.kind, event.kind)}"
+    if event.special_id:
+        line += f" {(titles or {}).get(event.special_id) or f'课程{event.special_id}'}"
+    if event.amount:
+        line += f" ¥{event.amount:.2f}"
+    if event.minutes:
+        line += f" {event.minutes:.0f}分钟"
+    return line
+
+
+def load_titles(special_ids):
+    """按主键读取课程名称，数据库不可用时返回空字典"""
+    if not special_ids:
+        return {}
+    try:
+        import db
+        conn = db.connect_report()
+    except Exception as e:
+        logger.warning(f"读取课程名称失败: {e}")
+        return {}
+    try:
+        with conn.cursor() as cursor:
+            ids = sorted(special_ids)
+            cursor.execute(f"SELECT id, title FROM wy_special WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+            return {row['id']: row['title'] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def print_timeline(uid, days=30, kinds=None, limit=None, index=None, titles=True):
+    """输出用户最近days天的时间线"""
+    index = index or TimelineIndex()
+    end = datetime.now()
+    events = index.timeline(uid, end - timedelta(days=days), end, kinds=kinds, limit=limit)
+    print(f"=== 用户 {uid} 最近{days}天活动 ===")
+    if not events:
+        print("时间线索引中没有该用户的记录（历史数据可用 python3 timeline.py import 导入）")
+        return events
+    names = load_titles({e.special_id for e in events if e.special_id}) if titles else {}
+    for event in events:
+        print(format_event(event, names))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用户活动时间线索引')
+    parser.add_argument('command', choices=['import', 'show', 'prune'])
+    parser.add_argument('--uid', type=int, help='show查看的用户')
+    parser.add_argument('--days', type=int, default=30, help='import导入/show查看最近多少天，prune保留多少天')
+    parser.add_argument('--limit', type=int, help='show只显示最近多少条')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    index = TimelineIndex()
+    try:
+        if args.command == 'import':
+            from event_store import EventStore
+            end = datetime.now()
+            store = EventStore()
+            try:
+                count = import_from_store(index, store, end - timedelta(days=args.days), end)
+            finally:
+                store.close()
+            print(f"已导入 {count} 条事件")
+        elif args.command == 'prune':
+            print(f"已删除 {index.prune(datetime.now() - timedelta(days=args.days))} 条事件")
+        else:
+            if args.uid is None:
+                parser.error("show需要 --uid")
+            print_timeline(args.uid, args.days, limit=args.limit, index=index)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
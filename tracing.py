@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告运行追踪
+一次报告运行中的各阶段记录为span（参考OpenTelemetry的字段）：
+- query    每个分项的数据库查询（行数），其中 db.connect 为建立连接
+- render   报告渲染（字节数、是否使用缓存）
+- send     投递，下面每个目标每次尝试一个 send.attempt（HTTP状态码、errcode、字节数）
+- log_write  写入webhook-log（字节数）
+同一次运行的span共用run_id（即trace_id），投递线程中的span也挂在同一次运行下。
+运行结束后追加写入 logs/traces/trace_YYYYMMDD.jsonl，每行一个span。
+
+未开启追踪时 span() 不做任何事。
+用法:
+    python3 tracing.py show               # 最近一次运行的span树和耗时
+    python3 tracing.py show --run <run_id>
+"""
+
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# 追踪结果输出目录
+TRACE_DIR = Path("/www/wwwroot/ana/logs/traces")
+
+logger = logging.getLogger(__name__)
+
+# 当前生效的追踪器，未开启追踪时为None
+_active = None
+
+# 当前线程/上下文中正在进行的span
+_current = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """一个阶段的耗时和属性"""
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.status = 'ok'
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, name, value):
+        self.attributes[name] = value
+
+    def finish(self, error=None):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        if error is not None:
+            self.status = 'error'
+            self.attributes.setdefault('error', f"{type(error).__name__}: {error}")
+        self.tracer.record(self)
+
+    def to_dict(self):
+        return {
+            'run_id': self.tracer.run_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': datetime.fromtimestamp(self.start).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            'duration_ms': round(self.duration_ms, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    """未开启追踪时的占位span"""
+
+    def set(self, name, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+@contextmanager
+def span(name, **attributes):
+    """记录一个阶段，未开启追踪时不做任何事"""
+    tracer = _active
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+
+    current = Span(tracer, name, _current.get(), attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        _current.reset(token)
+        current.finish(e)
+        raise
+    _current.reset(token)
+    current.finish()
+
+
+def set_attribute(name, value):
+    """给当前span添加属性"""
+    current = _current.get()
+    if current is not None and _active is not None:
+        current.set(name, value)
+
+
+def mark_failed(reason=None):
+    """把当前span标记为失败（没有抛出异常的失败，如HTTP 5xx）"""
+    current = _current.get()
+    if current is not None and _active is not None:
+        current.status = 'error'
+        if reason:
+            current.attributes.setdefault('error', reason)
+
+
+def wrap(func):
+    """让func在其他线程中运行时挂在当前span下"""
+    if _active is None:
+        return func
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+class RunTracer:
+    """一次报告运行的追踪器，根span覆盖整次运行"""
+
+    def __init__(self, name, run_id=None, output_dir=None, **attributes):
+        self.name = name
+        self.run_id = run_id or uuid.uuid4().hex
+        self.output_dir = Path(output_dir) if output_dir else TRACE_DIR
+        self.attributes = attributes
+        self.spans = []
+        self._lock = threading.Lock()
+        self._root = None
+
+    def __enter__(self):
+        global _active
+        _active = self
+        self._root = span(self.name, **self.attributes)
+        self._root.__enter__()
+        logger.info(f"追踪已开启，run_id: {self.run_id}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        try:
+            self._root.__exit__(exc_type, exc, tb)
+        finally:
+            _active = None
+        try:
+            self.write()
+        except Exception as e:
+            logger.error(f"保存追踪结果失败: {e}")
+        return False
+
+    def record(self, finished):
+        with self._lock:
+            self.spans.append(finished)
+
+    def path(self):
+        return self.output_dir / f"trace_{datetime.now().strftime('%Y%m%d')}.jsonl"
+
+    def write(self):
+        """追加写入当天的追踪文件，每行一个span"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        lines = "".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in self.spans)
+        with open(self.path(), 'a', encoding='utf-8') as f:
+            f.write(lines)
+        return self.path()
+
+
+def load_spans(path, run_id=None):
+    """读取追踪文件中某次运行（默认最后一次）的span"""
+    spans = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                spans.append(json.loads(line))
+    if not spans:
+        return []
+    run_id = run_id or spans[-1]['run_id']
+    return [s for s in spans if s['run_id'] == run_id]
+
+
+def format_tree(spans):
+    """按父子关系缩进输出span，子span按开始时间排序"""
+    children = {}
+    for s in spans:
+        children.setdefault(s['parent_id'], []).append(s)
+
+    lines = []
+
+    def walk(parent_id, depth):
+        for s in sorted(children.get(parent_id, []), key=lambda s: s['start']):
+            attributes = " ".join(f"{k}={v}" for k, v in s['attributes'].items())
+            status = "" if s['status'] == 'ok' else " ❌"
+            lines.append(f"{'  ' * depth}{s['name']} {s['duration_ms']:.1f}ms{status} {attributes}".rstrip())
+            walk(s['span_id'], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='报告运行追踪')
+    parser.add_argument('command', choices=['show'])
+    parser.add_argument('--run', help='run_id，默认为最近一次运行')
+    parser.add_argument('--date', default=datetime.now().strftime('%Y%m%d'), help='日期 YYYYMMDD')
+    args = parser.parse_args()
+
+    path = TRACE_DIR / f"trace_{args.date}.jsonl"
+    if not path.exists():
+        print(f"没有追踪文件: {path}")
+        sys.exit(1)
+    spans = load_spans(path, args.run)
+    if not spans:
+        print("没有找到对应的运行")
+        sys.exit(1)
+    print(f"run_id: {spans[0]['run_id']}")
+    print(format_tree(spans))
+
+
+if __name__ == "__main__":
+    main()
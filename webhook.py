@@ -3,71 +3,100 @@
 """
 用户活动日报webhook脚本
 每日上午10点和晚上10点运行，报告过去24小时用户活动情况
+活动高峰时由scheduler.py按更短的间隔发送临时报告
 """
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-import pymysql
-import requests
 import json
 import logging
+import argparse
 from datetime import datetime, timedelta
 from pathlib import Path
-from config import DATABASE_CONFIG
 
-# 企业微信Webhook配置
-WEBHOOK_URL = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=d3ed6660-1f33-47cc-83dd-84423fc7f8ac"
+import db
+import delivery
+import settings
+from profiler import phase, RunProfiler
+from tracing import span, RunTracer
+from report_cache import ReportCache, make_key
+from anomaly import report_anomalies, format_anomalies
+from runlock import RunGuard, window_key
+from snapshots import record_and_compare, format_comparisons
+
+# 报告类型（缓存键的一部分）
+REPORT_TYPE = 'daily'
+
+# 日志文件
+LOG_FILE = '/www/wwwroot/ana/webhook.log'
+
+# 每个分项列出的明细条数，超出企业微信单条长度时由delivery拆成多条发送
+DETAIL_LIMIT = 2
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/www/wwwroot/ana/webhook.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def setup_logging():
+    """配置日志输出，只在作为脚本运行时调用，导入本模块没有副作用"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_FILE, encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+def format_user_info(user):
+    """格式化用户信息"""
+    wechat_name = user.get('wechat_name') or '未绑定'
+    phone = user.get('phone') or '未填写'
+    return f"微信:{wechat_name} 手机:{phone[-4:]if phone != '未填写' else phone}"
+
+def load_detail_limit():
+    """读取配置中的REPORT_DETAIL_LIMIT，未配置时使用默认值"""
+    return settings.get_settings().get('REPORT_DETAIL_LIMIT', DETAIL_LIMIT)
+
 class UserActivityReporter:
     """用户活动报告生成器"""
     
-    def __init__(self):
-        self.db_config = DATABASE_CONFIG
-        self.now = datetime.now()
-        self.yesterday = self.now - timedelta(days=1)
+    def __init__(self, now=None, cache=None, detail_limit=None, hours=24, trace=False):
+        self.db_config = db.load_database_config()
+        self.detail_limit = detail_limit or load_detail_limit()
+        self.now = now or datetime.now()
+        # 日报为24小时窗口；调度器在活动高峰时发送更短窗口的临时报告，使用单独的报告类型
+        self.hours = hours
+        self.report_type = REPORT_TYPE if hours == 24 else f"interim_{hours}h"
+        self.yesterday = self.now - timedelta(hours=hours)
+        self.cache = cache
+        self.query_failed = False
+        # 是否把本次运行各阶段的span写入追踪文件
+        self.trace = trace
+        self.run_id = None
         
     def get_db_connection(self):
         """获取数据库连接"""
-        try:
-            conn = pymysql.connect(
-                host=self.db_config['host'],
-                port=self.db_config['port'],
-                user=self.db_config['user'],
-                password=self.db_config['password'],
-                database=self.db_config['database'],
-                charset=self.db_config['charset'],
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            return conn
-        except Exception as e:
-            logger.error(f"数据库连接失败: {e}")
-            return None
+        return db.get_report_connection(self.db_config)
     
     def execute_query(self, sql, params=None):
         """执行SQL查询"""
-        conn = self.get_db_connection()
+        with span('db.connect') as current:
+            conn = self.get_db_connection()
+            current.set('connected', conn is not None)
         if not conn:
+            self.query_failed = True
             return []
             
         try:
             with conn.cursor() as cursor:
-                cursor.execute(sql, params)
-                return cursor.fetchall()
+                with phase('query'):
+                    cursor.execute(sql, params)
+                with phase('fetch'):
+                    return cursor.fetchall()
         except Exception as e:
             logger.error(f"查询执行失败: {e}")
+            self.query_failed = True
             return []
         finally:
             conn.close()
@@ -111,6 +140,17 @@ class UserActivityReporter:
         """
         return self.execute_query(sql, [self.yesterday, self.now])
     
+    def get_paid_orders(self):
+        """获取过去24小时已支付订单的笔数和金额（与异常检测基线相同的口径，一笔多课程的订单只计一次）"""
+        sql = """
+        SELECT COUNT(*) as orders, COALESCE(SUM(o.pay_price), 0) as revenue
+        FROM wy_store_order o
+        WHERE o.add_time >= UNIX_TIMESTAMP(%s)
+        AND o.add_time < UNIX_TIMESTAMP(%s)
+        AND o.paid = 1
+        """
+        return self.execute_query(sql, [self.yesterday, self.now])
+    
     def get_user_logins(self):
         """获取过去24小时老用户登录情况"""
         sql = """
@@ -152,11 +192,167 @@ class UserActivityReporter:
         """
         return self.execute_query(sql, [self.yesterday, self.now])
     
+    def get_course_ranking(self):
+        """获取截至报告窗口结束的近7天观看最多的课程（读取course_stats的本地汇总）"""
+        from course_stats import recent_ranking
+        return recent_ranking(days=7, limit=3, end=self.now)
+    
     def format_user_info(self, user):
         """格式化用户信息"""
-        wechat_name = user.get('wechat_name') or '未绑定'
-        phone = user.get('phone') or '未填写'
-        return f"微信:{wechat_name} 手机:{phone[-4:]if phone != '未填写' else phone}"
+        return format_user_info(user)
+    
+    def collect_sections(self):
+        """查询报告各分项数据"""
+        queries = {
+            'new_users': self.get_new_registrations,
+            'purchases': self.get_product_purchases,
+            'paid_orders': self.get_paid_orders,
+            'logins': self.get_user_logins,
+            'course_watches': self.get_course_watching,
+            'course_ranking': self.get_course_ranking,
+        }
+        sections = {}
+        for name, query in queries.items():
+            with span('query', section=name) as current:
+                sections[name] = query()
+                current.set('rows', len(sections[name] or []))
+        return sections
+    
+    def cache_key(self):
+        """当前报告窗口的缓存键"""
+        return make_key(self.report_type, self.yesterday, self.now)
+    
+    def run_window_key(self):
+        """运行锁和幂等记录的窗口键，按10点/22点（临时报告按间隔）对齐，与启动的分钟无关"""
+        return window_key(self.report_type, self.now, self.hours)
+    
+    def load_sections(self):
+        """获取报告各分项数据，优先使用缓存"""
+        if self.cache:
+            entry = self.cache.get(self.cache_key())
+            if entry and 'sections' in entry:
+                logger.info("使用缓存的报告数据")
+                return entry['sections']
+        
+        self.query_failed = False
+        sections = self.collect_sections()
+        
+        # 查询出错时的空结果不能缓存，否则重试会复用错误数据
+        if self.cache and not self.query_failed:
+            self.cache.put(self.cache_key(), sections=sections)
+        return sections
+    
+    def cached_payload(self):
+        """获取已渲染好的报告，没有缓存时返回None"""
+        if not self.cache:
+            return None
+        entry = self.cache.get(self.cache_key())
+        return entry.get('payload') if entry else None
+    
+    def render_report(self, sections):
+        """把各分项数据渲染成报告文本"""
+        new_users = sections['new_users']
+        purchases = sections['purchases']
+        logins = sections['logins']
+        course_watches = sections['course_watches']
+        limit = self.detail_limit
+        
+        # 生成报告内容
+        report_time = self.now.strftime("%m-%d %H:%M")
+        report = f"📊 6页网{self.hours}小时活动报告({report_time})\n"
+        
+        # 只显示有数据的项目
+        has_activity = False
+        
+        # 新用户注册
+        if new_users:
+            has_activity = True
+            report += f"🆕 新注册{len(new_users)}人："
+            for i, user in enumerate(new_users[:limit]):  # 最多显示limit个
+                report += f"{self.format_user_info(user)}"
+                if i < len(new_users[:limit]) - 1:
+                    report += ";"
+            if len(new_users) > limit:
+                report += f"等{len(new_users)}人"
+            report += "\n"
+        
+        # 产品购买
+        if purchases:
+            has_activity = True
+            total_revenue = sum(p.get('pay_price', 0) for p in purchases if p.get('pay_price'))
+            report += f"💰 购买{len(purchases)}笔¥{total_revenue:.0f}："
+            for i, purchase in enumerate(purchases[:limit]):  # 最多显示limit个
+                report += f"{self.format_user_info(purchase)}购买{purchase.get('product_name', '课程')}"
+                if i < len(purchases[:limit]) - 1:
+                    report += ";"
+            if len(purchases) > limit:
+                report += f"等{len(purchases)}笔"
+            report += "\n"
+        
+        # 老用户登录
+        if logins:
+            has_activity = True
+            report += f"👥 活跃{len(logins)}人："
+            for i, login in enumerate(logins[:limit]):  # 最多显示limit个
+                report += f"{self.format_user_info(login)}"
+                if i < len(logins[:limit]) - 1:
+                    report += ";"
+            if len(logins) > limit:
+                report += f"等{len(logins)}人"
+            report += "\n"
+        
+        # 课程观看
+        if course_watches:
+            has_activity = True
+            total_watch_time = sum(c.get('viewing_time', 0) for c in course_watches)
+            # 转换观看时长显示：如果超过60分钟显示小时，否则显示分钟
+            if total_watch_time > 60:
+                time_display = f"{total_watch_time/60:.1f}小时"
+            else:
+                time_display = f"{total_watch_time:.0f}分钟"
+            
+            report += f"📚 观看{len(course_watches)}次{time_display}："
+            for i, watch in enumerate(course_watches[:limit]):  # 最多显示limit个
+                watch_time = watch.get('viewing_time', 0)
+                if watch_time > 60:
+                    time_str = f"{watch_time/60:.1f}小时"
+                else:
+                    time_str = f"{watch_time:.0f}分钟"
+                report += f"{self.format_user_info(watch)}看{watch.get('course_name', '课程')}{time_str}"
+                if i < len(course_watches[:limit]) - 1:
+                    report += ";"
+            if len(course_watches) > limit:
+                report += f"等{len(course_watches)}次"
+            report += "\n"
+        
+        # 与同时段基线相比明显偏高或偏低的指标，回填的历史报告没有这一项
+        anomalies = sections.get('anomalies')
+        if anomalies:
+            report += format_anomalies(anomalies, "⚠️ 异常：").replace("\n", " ") + "\n"
+        
+        # 与昨日、上周同一时刻的报告对比，没有历史快照时不显示
+        comparison = sections.get('comparison')
+        if comparison and has_activity:
+            report += f"📈 {format_comparisons(comparison)}\n"
+        
+        # 近7天热门课程，本地没有课程统计时不显示
+        course_ranking = sections.get('course_ranking')
+        if course_ranking and has_activity:
+            items = []
+            for course in course_ranking:
+                watches = course.get('watches') or 0
+                completion = course.get('completed', 0) / watches if watches else 0
+                items.append(f"{course.get('title') or '课程'}{course.get('viewers', 0)}人完课{completion:.0%}")
+            report += f"🏆 近7天热门：{';'.join(items)}\n"
+        
+        # 如果所有数据都为0，显示无活动信息
+        if not has_activity:
+            report += "暂无新活动"
+        else:
+            # 去掉最后的换行符
+            report = report.rstrip('\n')
+        
+        return report
     
     def generate_report(self):
         """生成活动报告"""
@@ -164,85 +360,21 @@ class UserActivityReporter:
             logger.info("开始生成用户活动报告...")
             
             # 获取数据
-            new_users = self.get_new_registrations()
-            purchases = self.get_product_purchases()
-            logins = self.get_user_logins()
-            course_watches = self.get_course_watching()
-            
-            # 生成报告内容
-            report_time = self.now.strftime("%m-%d %H:%M")
-            report = f"📊 6页网24小时活动报告({report_time})\n"
-            
-            # 只显示有数据的项目
-            has_activity = False
-            
-            # 新用户注册
-            if new_users:
-                has_activity = True
-                report += f"🆕 新注册{len(new_users)}人："
-                for i, user in enumerate(new_users[:2]):  # 最多显示2个
-                    report += f"{self.format_user_info(user)}"
-                    if i < len(new_users[:2]) - 1:
-                        report += ";"
-                if len(new_users) > 2:
-                    report += f"等{len(new_users)}人"
-                report += "\n"
+            sections = self.load_sections()
             
-            # 产品购买
-            if purchases:
-                has_activity = True
-                total_revenue = sum(p.get('pay_price', 0) for p in purchases if p.get('pay_price'))
-                report += f"💰 购买{len(purchases)}笔¥{total_revenue:.0f}："
-                for i, purchase in enumerate(purchases[:2]):  # 最多显示2个
-                    report += f"{self.format_user_info(purchase)}购买{purchase.get('product_name', '课程')}"
-                    if i < len(purchases[:2]) - 1:
-                        report += ";"
-                if len(purchases) > 2:
-                    report += f"等{len(purchases)}笔"
-                report += "\n"
+            # 保存本次快照并读取昨日、上周同一时刻的快照做对比，再与当前基线比较标出异常，查询出错时都不做
+            if not self.query_failed:
+                with span('snapshot'):
+                    comparison = record_and_compare(self.report_type, self.yesterday, self.now, sections)
+                anomalies = report_anomalies(sections, self.yesterday, self.now)
+                sections = dict(sections, comparison=comparison, anomalies=anomalies)
             
-            # 老用户登录
-            if logins:
-                has_activity = True
-                report += f"👥 活跃{len(logins)}人："
-                for i, login in enumerate(logins[:2]):  # 最多显示2个
-                    report += f"{self.format_user_info(login)}"
-                    if i < len(logins[:2]) - 1:
-                        report += ";"
-                if len(logins) > 2:
-                    report += f"等{len(logins)}人"
-                report += "\n"
-            
-            # 课程观看
-            if course_watches:
-                has_activity = True
-                total_watch_time = sum(c.get('viewing_time', 0) for c in course_watches)
-                # 转换观看时长显示：如果超过60分钟显示小时，否则显示分钟
-                if total_watch_time > 60:
-                    time_display = f"{total_watch_time/60:.1f}小时"
-                else:
-                    time_display = f"{total_watch_time:.0f}分钟"
-                
-                report += f"📚 观看{len(course_watches)}次{time_display}："
-                for i, watch in enumerate(course_watches[:2]):  # 最多显示2个
-                    watch_time = watch.get('viewing_time', 0)
-                    if watch_time > 60:
-                        time_str = f"{watch_time/60:.1f}小时"
-                    else:
-                        time_str = f"{watch_time:.0f}分钟"
-                    report += f"{self.format_user_info(watch)}看{watch.get('course_name', '课程')}{time_str}"
-                    if i < len(course_watches[:2]) - 1:
-                        report += ";"
-                if len(course_watches) > 2:
-                    report += f"等{len(course_watches)}次"
-                report += "\n"
-            
-            # 如果所有数据都为0，显示无活动信息
-            if not has_activity:
-                report += "暂无新活动"
-            else:
-                # 去掉最后的换行符
-                report = report.rstrip('\n')
+            # 生成报告内容
+            with span('render') as current:
+                report = self.render_report(sections)
+                current.set('bytes', len(report.encode('utf-8')))
+            if self.cache and not self.query_failed:
+                self.cache.put(self.cache_key(), payload=report)
                 
             logger.info(f"报告生成成功，长度: {len(report)}字符")
             return report
@@ -252,32 +384,11 @@ class UserActivityReporter:
             return f"⚠️ 报告生成失败: {str(e)}"
     
     def send_webhook(self, message):
-        """发送企业微信webhook消息"""
-        try:
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            
-            response = requests.post(WEBHOOK_URL, json=data, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('errcode') == 0:
-                    logger.info("Webhook发送成功")
-                    return True
-                else:
-                    logger.error(f"Webhook发送失败: {result}")
-                    return False
-            else:
-                logger.error(f"HTTP请求失败: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"发送webhook失败: {e}")
-            return False
+        """发送webhook消息到所有配置的目标"""
+        with span('send', bytes=len(message.encode('utf-8'))) as current:
+            success = delivery.broadcast(message)
+            current.set('success', success)
+            return success
     
     def save_webhook_log(self, report, success):
         """保存webhook日志到文件"""
@@ -305,8 +416,9 @@ class UserActivityReporter:
 """
             
             # 写入日志文件（追加模式）
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(log_content)
+            with span('log_write', path=str(log_file), bytes=len(log_content.encode('utf-8'))):
+                with open(log_file, 'a', encoding='utf-8') as f:
+                    f.write(log_content)
             
             logger.info(f"Webhook日志已保存到: {log_file}")
             
@@ -314,18 +426,35 @@ class UserActivityReporter:
             logger.error(f"保存webhook日志失败: {e}")
 
     def run(self):
-        """运行报告生成和发送"""
+        """运行报告生成和发送，开启追踪时各阶段记录到同一个run_id下"""
+        if not self.trace:
+            return self.run_once()
+        with RunTracer('report', report_type=self.report_type, window=self.cache_key()) as tracer:
+            self.run_id = tracer.run_id
+            return self.run_once()
+
+    def run_once(self):
+        """生成并发送一次报告"""
         try:
             logger.info("开始执行用户活动日报任务...")
             
-            # 生成报告
-            report = self.generate_report()
+            # 生成报告，同一窗口已渲染过时直接复用
+            with span('generate') as current:
+                report = self.cached_payload()
+                current.set('cached', bool(report))
+                if report:
+                    logger.info("使用缓存的报告内容")
+                else:
+                    with phase('render'):
+                        report = self.generate_report()
             
             # 发送webhook
-            success = self.send_webhook(report)
+            with phase('send'):
+                success = self.send_webhook(report)
             
             # 保存日志
-            self.save_webhook_log(report, success)
+            with phase('log_write'):
+                self.save_webhook_log(report, success)
             
             if success:
                 logger.info("用户活动日报发送成功")
@@ -341,11 +470,52 @@ class UserActivityReporter:
             print(f"❌ 任务执行失败: {e}")
             return False
 
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='用户活动日报')
+    parser.add_argument('--profile', action='store_true', help='输出各阶段耗时和火焰图数据')
+    parser.add_argument('--no-cache', action='store_true', help='不使用报告缓存，重新查询')
+    parser.add_argument('--resend', action='store_true', help='重发最近一次缓存的报告')
+    parser.add_argument('--clear-cache', action='store_true', help='清除日报缓存后退出')
+    parser.add_argument('--force', action='store_true', help='窗口已发送过也重新发送')
+    parser.add_argument('--no-trace', action='store_true', help='不记录本次运行的追踪span')
+    return parser.parse_args(argv)
+
 def main():
     """主函数"""
+    setup_logging()
     try:
-        reporter = UserActivityReporter()
-        success = reporter.run()
+        args = parse_args()
+        cache = None if args.no_cache else ReportCache()
+        
+        if args.clear_cache:
+            removed = ReportCache().invalidate(report_type=REPORT_TYPE)
+            print(f"已清除 {removed} 条日报缓存")
+            sys.exit(0)
+        
+        reporter = UserActivityReporter(cache=cache, trace=not args.no_trace)
+        if args.resend and cache:
+            # 重发时沿用上一次报告的窗口，命中缓存后不再查询数据库
+            entry = cache.latest(REPORT_TYPE)
+            if entry:
+                window = json.loads(entry['key'])
+                reporter = UserActivityReporter(now=datetime.strptime(window['end'], '%Y-%m-%d %H:%M'), cache=cache,
+                                                trace=not args.no_trace)
+            else:
+                logger.info("没有可重发的缓存报告，重新生成")
+        
+        # 同一窗口只运行一次：本机文件锁 + 主库租约 + 幂等记录，重发时忽略已发送标记
+        with RunGuard(reporter.report_type, reporter.run_window_key(), force=args.resend or args.force) as guard:
+            if not guard.acquired:
+                print(f"⏭️ 跳过: {guard.reason}")
+                sys.exit(0)
+            
+            if args.profile:
+                with RunProfiler('webhook'):
+                    success = reporter.run()
+            else:
+                success = reporter.run()
+            guard.finish(success)
         sys.exit(0 if success else 1)
     except Exception as e:
         logger.error(f"程序执行失败: {e}")
@@ -7,18 +7,19 @@ Webhook系统监控和维护脚本
 
 import sys
 import os
-import glob
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 from pathlib import Path
 
 # 添加项目路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from webhook import UserActivityReporter
+import db
+import delivery
+from log_janitor import LogJanitor
+from profiler import phase, extract_profile_flag, RunProfiler
 
 # 配置
-LOG_RETENTION_DAYS = 30  # 日志保留天数
 MAX_LOG_SIZE_MB = 100    # 单个日志文件最大大小MB
 
 class WebhookMonitor:
@@ -43,8 +44,7 @@ class WebhookMonitor:
     def check_database_connection(self):
         """检查数据库连接"""
         try:
-            reporter = UserActivityReporter()
-            conn = reporter.get_db_connection()
+            conn = db.get_db_connection()
             if conn:
                 conn.close()
                 self.logger.info("数据库连接检查: ✅ 正常")
@@ -59,68 +59,36 @@ class WebhookMonitor:
     def check_webhook_connectivity(self):
         """检查webhook连通性"""
         try:
-            import requests
-            url = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=d3ed6660-1f33-47cc-83dd-84423fc7f8ac"
-            
             # 发送测试消息
-            test_data = {
-                "msgtype": "text", 
-                "text": {
-                    "content": f"🧪 系统监控测试\n⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n✅ Webhook连接正常"
-                }
-            }
+            test_message = f"🧪 系统监控测试\n⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n✅ Webhook连接正常"
             
-            response = requests.post(url, json=test_data, timeout=10)
+            with phase('send'):
+                success = delivery.broadcast(test_message)
             
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('errcode') == 0:
-                    self.logger.info("Webhook连接检查: ✅ 正常")
-                    return True
-                else:
-                    self.logger.error(f"Webhook连接检查: ❌ API错误 {result}")
-                    return False
+            if success:
+                self.logger.info("Webhook连接检查: ✅ 正常")
+                return True
             else:
-                self.logger.error(f"Webhook连接检查: ❌ HTTP错误 {response.status_code}")
+                self.logger.error("Webhook连接检查: ❌ 失败")
                 return False
                 
         except Exception as e:
             self.logger.error(f"Webhook连接检查异常: {e}")
             return False
     
-    def clean_old_logs(self):
-        """清理旧日志文件"""
+    def clean_old_logs(self, dry_run=False):
+        """压缩和删除旧日志（logs/ 和 webhook-log/），返回JanitorReport，失败时返回None"""
         try:
-            cutoff_date = datetime.now() - timedelta(days=LOG_RETENTION_DAYS)
-            cleaned_count = 0
-            
-            # 清理各种日志文件
-            log_patterns = ['*.log', '*.log.*', 'webhook_*.log']
-            
-            for pattern in log_patterns:
-                for log_file in self.log_dir.glob(pattern):
-                    try:
-                        # 检查文件修改时间
-                        file_mtime = datetime.fromtimestamp(log_file.stat().st_mtime)
-                        
-                        if file_mtime < cutoff_date:
-                            log_file.unlink()
-                            cleaned_count += 1
-                            self.logger.info(f"删除旧日志: {log_file.name}")
-                            
-                    except Exception as e:
-                        self.logger.warning(f"删除日志文件失败 {log_file}: {e}")
-            
-            if cleaned_count > 0:
-                self.logger.info(f"日志清理完成: 删除了{cleaned_count}个旧文件")
+            report = LogJanitor(dry_run=dry_run).run()
+            if report.deleted or report.compressed:
+                self.logger.info(f"日志清理完成: {report.format()}")
             else:
                 self.logger.info("日志清理: 无需清理")
-                
-            return cleaned_count
+            return report
             
         except Exception as e:
             self.logger.error(f"日志清理失败: {e}")
-            return 0
+            return None
     
     def check_log_sizes(self):
         """检查日志文件大小"""
@@ -209,8 +177,8 @@ class WebhookMonitor:
                 report += f"⚠️ 发现{len(large_logs)}个大日志文件\n"
             
             # 维护信息
-            if cleaned_logs > 0:
-                report += f"🧹 清理了{cleaned_logs}个旧日志文件\n"
+            if cleaned_logs and (cleaned_logs.deleted or cleaned_logs.compressed):
+                report += f"🧹 删除了{cleaned_logs.deleted}个、压缩了{cleaned_logs.compressed}个旧日志文件\n"
             
             self.logger.info("系统状态检查完成")
             return report, all([db_status, webhook_status, crontab_status])
@@ -225,8 +193,8 @@ class WebhookMonitor:
         try:
             # 只在有问题时发送报告，避免过度通知
             if not is_healthy:
-                reporter = UserActivityReporter()
-                success = reporter.send_webhook(report)
+                with phase('send'):
+                    success = delivery.broadcast(report)
                 
                 if success:
                     self.logger.info("状态报告发送成功")
@@ -248,7 +216,8 @@ class WebhookMonitor:
             self.logger.info("开始系统监控...")
             
             # 生成状态报告
-            report, is_healthy = self.generate_system_status_report()
+            with phase('render'):
+                report, is_healthy = self.generate_system_status_report()
             
             # 发送状态报告
             self.send_status_report(report, is_healthy)
@@ -262,10 +231,19 @@ class WebhookMonitor:
 
 def main():
     """主函数"""
+    profile, args = extract_profile_flag(sys.argv[1:])
+    if profile:
+        with RunProfiler('webhook_monitor'):
+            run_command(args)
+    else:
+        run_command(args)
+
+def run_command(args):
+    """执行监控命令"""
     monitor = WebhookMonitor()
     
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
+    if args:
+        command = args[0]
         
         if command == "health":
             # 健康检查
@@ -273,9 +251,11 @@ def main():
             sys.exit(0 if success else 1)
             
         elif command == "clean":
-            # 清理日志
-            cleaned = monitor.clean_old_logs()
-            print(f"清理了 {cleaned} 个旧日志文件")
+            # 清理日志，--dry-run只统计
+            report = monitor.clean_old_logs(dry_run='--dry-run' in args)
+            if report is None:
+                sys.exit(1)
+            print(report.format())
             
         elif command == "test":
             # 测试连接